@@ -1,43 +1,305 @@
+import copy
+import gzip
 import json
 import os
 import hashlib
+import hmac
+import queue
+import threading
 import time
+import uuid
+import atexit
 import logging
-from logging.handlers import RotatingFileHandler
+import signal
+import sys
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 from pathlib import Path
 
-from flask import Flask, render_template, request, jsonify
+from flask import (
+    Flask,
+    Response,
+    render_template,
+    request,
+    jsonify,
+    g,
+    has_request_context,
+    stream_with_context,
+)
 
 from ttlock_api import (
     register_user,
     get_access_token,
     list_locks,
+    list_lock_records,
     operate_lock,
+    refresh_access_token,
+    configure_hedging,
     TTLockError,
 )
+from records import (
+    LOCK_RECORD_TYPES,
+    UNLOCK_RECORD_TYPES,
+    RecordJournal,
+    record_time,
+    record_type,
+)
+from provisioning import (
+    DEFAULT_CONCURRENCY,
+    DEFAULT_RATE,
+    ProvisioningManager,
+    validate_items,
+)
+from scheduler import Scheduler, validate_schedule
+from profiling import RequestProfiler, SlowRequestLog
 
 app = Flask(__name__)
 app.secret_key = "change-this-secret"
 
 CONFIG_PATH = Path(os.environ.get("CONFIG_PATH", "/data/config.json"))
 LOG_PATH = Path(os.environ.get("LOG_PATH", "/data/app.log"))
+# Optional shared secret for /api/callback (passed as ?token=...)
+CALLBACK_TOKEN = os.environ.get("CALLBACK_TOKEN", "")
+# Worker pool size for async lock command jobs (?async=1)
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", "4"))
+# Checkpoints for bulk passcode / eKey provisioning jobs
+PROVISIONING_DIR = Path(
+    os.environ.get("PROVISIONING_DIR", str(CONFIG_PATH.parent / "provisioning"))
+)
+# Stored schedules and their run history
+SCHEDULES_DIR = Path(os.environ.get("SCHEDULES_DIR", str(CONFIG_PATH.parent / "schedules")))
+# Scheduled commands per second, shared by all schedules (spreads 22:00 bursts)
+SCHEDULER_RATE = float(os.environ.get("SCHEDULER_RATE", "1"))
+# Journal of lock records served incrementally at /api/records
+RECORDS_PATH = Path(os.environ.get("RECORDS_PATH", str(CONFIG_PATH.parent / "records.jsonl")))
+# Pull lock records from the cloud every N seconds (0 = rely on callbacks only)
+RECORD_SYNC_INTERVAL = int(os.environ.get("RECORD_SYNC_INTERVAL", "0"))
+# Poll interval (seconds) suggested to /api/locks clients via X-Poll-Interval:
+# POLL_INTERVAL_HINT is a fixed floor, stretched toward BUSY_POLL_INTERVAL while
+# the upstream slots or the blocking-request budget are more than half used
+POLL_INTERVAL_HINT = float(os.environ.get("POLL_INTERVAL_HINT", "0") or 0)
+BUSY_POLL_INTERVAL = float(os.environ.get("BUSY_POLL_INTERVAL", "60"))
+# Seconds between background upstream probes reported by /readyz (0 = off)
+HEALTH_PROBE_INTERVAL = int(os.environ.get("HEALTH_PROBE_INTERVAL", "60"))
+# Admission control for upstream-bound work (request threads and workers)
+UPSTREAM_CONCURRENCY = int(os.environ.get("UPSTREAM_CONCURRENCY", "6"))
+UPSTREAM_QUEUE = int(os.environ.get("UPSTREAM_QUEUE", "4"))
+UPSTREAM_QUEUE_TIMEOUT = float(os.environ.get("UPSTREAM_QUEUE_TIMEOUT", "3"))
+# Request threads that may block (cloud calls, waits for a lock, a job or an
+# idempotent original). With MAX_EVENT_STREAMS (4) this stays below
+# gunicorn's 16 threads, so reads served from memory always find a thread.
+BLOCKING_REQUESTS = int(os.environ.get("BLOCKING_REQUESTS", "10"))
+# Async command jobs accepted but not yet finished
+MAX_QUEUED_JOBS = int(os.environ.get("MAX_QUEUED_JOBS", "100"))
+# Longest a saved change waits in memory before it is written to CONFIG_PATH
+STATE_FLUSH_DELAY = float(os.environ.get("STATE_FLUSH_DELAY", "1.0"))
+# Bearer token for /api/admin/* (profiling); admin endpoints are off when unset
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN", "")
+# Capture the stack of requests running longer than this (ms, 0 = off)
+SLOW_REQUEST_MS = float(os.environ.get("SLOW_REQUEST_MS", "0"))
+# Base log level plus per-component overrides, e.g. "callbacks=DEBUG,upstream=WARNING"
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+LOG_LEVELS = os.environ.get("LOG_LEVELS", "")
 
 # --------------------------------------------------------------------
 # Logging
 # --------------------------------------------------------------------
+# Records are put on an in-memory queue on the request thread and written
+# to disk (as JSON lines) by a QueueListener thread, so file I/O and rotation
+# never add to request latency.
+LOG_QUEUE_SIZE = 10_000
+
 logger = logging.getLogger("ttlock_helper")
-logger.setLevel(logging.INFO)
+logger.setLevel(getattr(logging, LOG_LEVEL, logging.INFO))
+logger.propagate = False
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": self.formatTime(record, "%Y-%m-%d %H:%M:%S"),
+            "level": record.levelname,
+            "logger": record.name,
+            "request_id": getattr(record, "request_id", "-"),
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class RequestIdFilter(logging.Filter):
+    """Tag records with the current request id (runs on the request thread)."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not hasattr(record, "request_id"):
+            record.request_id = g.get("request_id", "-") if has_request_context() else "-"
+        return True
+
+
+class DroppingQueueHandler(QueueHandler):
+    """QueueHandler that drops (and counts) records when the queue is full."""
+
+    def __init__(self, log_queue: queue.Queue) -> None:
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def _apply_log_levels(spec: str) -> None:
+    for item in spec.split(","):
+        name, _, level = item.partition("=")
+        name, level = name.strip(), level.strip().upper()
+        if not name or not hasattr(logging, level):
+            continue
+        logging.getLogger(f"ttlock_helper.{name}").setLevel(getattr(logging, level))
+
+
+_log_queue: queue.Queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+_log_handler = DroppingQueueHandler(_log_queue)
+_log_handler.addFilter(RequestIdFilter())
+_log_listener: QueueListener | None = None
 
 if not logger.handlers:
     LOG_PATH.parent.mkdir(parents=True, exist_ok=True)
-    handler = RotatingFileHandler(LOG_PATH, maxBytes=1_000_000, backupCount=3)
-    formatter = logging.Formatter("%(asctime)s [%(levelname)s] %(message)s")
-    handler.setFormatter(formatter)
-    logger.addHandler(handler)
+    file_handler = RotatingFileHandler(LOG_PATH, maxBytes=1_000_000, backupCount=3)
+    file_handler.setFormatter(JsonFormatter())
+    logger.addHandler(_log_handler)
+    _apply_log_levels(LOG_LEVELS)
+    _log_listener = QueueListener(_log_queue, file_handler, respect_handler_level=True)
+    _log_listener.start()
+    atexit.register(_log_listener.stop)
+
+
+def log_event(message: str, level: int = logging.INFO, component: str = "") -> None:
+    target = logger.getChild(component) if component else logger
+    target.log(level, message)
+
+
+def log_stats() -> dict:
+    return {
+        "queued": _log_queue.qsize(),
+        "dropped": _log_handler.dropped,
+        "level": logging.getLevelName(logger.level),
+    }
+
+
+# --------------------------------------------------------------------
+# Tracing (X-Trace-Id in, Server-Timing out, recent traces at /api/traces)
+# --------------------------------------------------------------------
+TRACE_BUFFER_SIZE = 500
+UNTRACED_PATHS = ("/api/traces", "/api/events", "/static/", "/healthz", "/readyz")
+
+_traces: deque = deque(maxlen=TRACE_BUFFER_SIZE)
+_traces_lock = threading.Lock()
+_trace_local = threading.local()
+
+
+def start_trace(trace_id: str, name: str) -> dict:
+    trace = {
+        "trace_id": trace_id,
+        "name": name,
+        "start": time.time(),
+        "_t0": time.perf_counter(),
+        "spans": [],
+    }
+    _trace_local.trace = trace
+    return trace
+
+
+def finish_trace(trace: dict, status: int | str) -> dict:
+    if getattr(_trace_local, "trace", None) is trace:
+        _trace_local.trace = None
+    record = {k: v for k, v in trace.items() if not k.startswith("_")}
+    record["duration_ms"] = round((time.perf_counter() - trace["_t0"]) * 1000, 2)
+    record["status"] = status
+    with _traces_lock:
+        _traces.append(record)
+    return record
+
+
+@contextmanager
+def span(name: str):
+    """Time a stage of the current trace (no-op outside a traced request/job)."""
+    trace = getattr(_trace_local, "trace", None)
+    if trace is None:
+        yield
+        return
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace["spans"].append(
+            {
+                "name": name,
+                "offset_ms": round((t0 - trace["_t0"]) * 1000, 2),
+                "duration_ms": round((time.perf_counter() - t0) * 1000, 2),
+            }
+        )
+
+
+def server_timing_header(record: dict) -> str:
+    totals: dict[str, float] = {}
+    for item in record["spans"]:
+        totals[item["name"]] = totals.get(item["name"], 0.0) + item["duration_ms"]
+    parts = [f"{name};dur={dur:.2f}" for name, dur in totals.items()]
+    parts.append(f"total;dur={record['duration_ms']:.2f}")
+    return ", ".join(parts)
+
+
+@app.before_request
+def _assign_request_id():
+    g.request_id = request.headers.get("X-Request-ID") or uuid.uuid4().hex[:12]
+    g.trace_id = request.headers.get("X-Trace-Id") or g.request_id
+    if not request.path.startswith(UNTRACED_PATHS):
+        g.trace = start_trace(g.trace_id, f"{request.method} {request.path}")
+
+
+# --------------------------------------------------------------------
+# On-demand profiling and slow-request stacks (/api/admin/*)
+# --------------------------------------------------------------------
+profiler = RequestProfiler()
+slow_requests = SlowRequestLog()
+slow_requests.configure(SLOW_REQUEST_MS)
+
+
+@app.before_request
+def _profiling_start():
+    if request.path.startswith(UNTRACED_PATHS) or request.path.startswith("/api/admin/"):
+        return
+    rule = request.url_rule.rule if request.url_rule is not None else ""
+    profiler.request_started(request.path, rule)
+    slow_requests.request_started(request.method, request.path, g.get("request_id", ""))
+
+
+@app.teardown_request
+def _profiling_finish(exc):
+    profiler.request_finished()
+    slow_requests.request_finished()
+
+
+@app.after_request
+def _echo_request_id(response):
+    response.headers["X-Request-ID"] = g.get("request_id", "")
+    trace = g.pop("trace", None)
+    if trace is not None:
+        record = finish_trace(trace, response.status_code)
+        response.headers["X-Trace-Id"] = record["trace_id"]
+        response.headers["Server-Timing"] = server_timing_header(record)
+    return response
 
 
-def log_event(message: str, level: int = logging.INFO) -> None:
-    logger.log(level, message)
+@app.teardown_request
+def _drop_trace(exc):
+    # after_request is skipped on unhandled errors; don't leak the trace
+    _trace_local.trace = None
 
 
 def get_log_tail(lines: int = 200) -> str:
@@ -70,10 +332,28 @@ def default_config() -> dict:
         "locks": [],
         "last_lock_error": "",
         "last_lock_action_result": "",
+        # Change tracking for /api/locks?since=<version>
+        "locks_version": 0,
+        "lock_versions": {},
+        "removed_locks": [],
+        "locks_history_floor": 0,
+        # Epoch seconds; 0 = unknown
+        "token_expires_at": 0,
+        "locks_refreshed_at": 0,
     }
 
 
-def load_config() -> dict:
+# State lives in memory; save_config() only swaps the in-memory copy and a
+# writer thread persists the latest version at most STATE_FLUSH_DELAY later.
+# A burst of saves (e.g. a scene locking ten doors) costs one disk write.
+_state: dict | None = None
+_state_lock = threading.Lock()
+_flush_lock = threading.Lock()
+_state_dirty = threading.Event()
+_state_writer: threading.Thread | None = None
+
+
+def _read_config_file() -> dict:
     if CONFIG_PATH.exists():
         try:
             with CONFIG_PATH.open("r", encoding="utf-8") as f:
@@ -89,10 +369,222 @@ def load_config() -> dict:
     return base
 
 
+def load_config() -> dict:
+    """A private copy of the current state; pass it to save_config() to commit."""
+    global _state
+    with span("config_load"):
+        with _state_lock:
+            if _state is None:
+                _state = _read_config_file()
+            return copy.deepcopy(_state)
+
+
+def read_state() -> dict:
+    """The current state without copying it; callers must not mutate it."""
+    global _state
+    with span("config_load"):
+        with _state_lock:
+            if _state is None:
+                _state = _read_config_file()
+            return _state
+
+
+# Lock state fields that move together with locks_version
+LOCK_STATE_FIELDS = (
+    "locks",
+    "locks_version",
+    "lock_versions",
+    "removed_locks",
+    "locks_history_floor",
+    "locks_refreshed_at",
+)
+
+
 def save_config(cfg: dict) -> None:
+    """
+    Commit ``cfg`` as the current state. A copy older than the current lock
+    state (lower locks_version) keeps the current lock fields, so a stale
+    save can never roll locks or their version back.
+    """
+    global _state
+    with span("state_save"):
+        snapshot = copy.deepcopy(cfg)
+        with _state_lock:
+            current = _state
+            stale = current is not None and int(snapshot.get("locks_version", 0)) < int(
+                current.get("locks_version", 0)
+            )
+            if stale:
+                # The current state is never mutated, so sharing is safe
+                for field in LOCK_STATE_FIELDS:
+                    snapshot[field] = current.get(field)
+            _state = snapshot
+        ensure_state_writer()
+        _state_dirty.set()
+    if stale:
+        log_event(
+            f"Stale save (locks_version {cfg.get('locks_version')} < {snapshot['locks_version']}) "
+            "kept the current lock state",
+            logging.WARNING,
+        )
+    notify_lock_change(int(snapshot.get("locks_version", 0)))
+
+
+def _write_config_file(cfg: dict) -> None:
+    """Atomic replace: a crash leaves either the old or the new file, never half."""
     CONFIG_PATH.parent.mkdir(parents=True, exist_ok=True)
-    with CONFIG_PATH.open("w", encoding="utf-8") as f:
+    tmp = CONFIG_PATH.with_name(CONFIG_PATH.name + ".tmp")
+    with tmp.open("w", encoding="utf-8") as f:
         json.dump(cfg, f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, CONFIG_PATH)
+    try:
+        dir_fd = os.open(CONFIG_PATH.parent, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(dir_fd)
+    finally:
+        os.close(dir_fd)
+
+
+def flush_state() -> None:
+    """Write pending state now (writer thread, shutdown)."""
+    with _flush_lock:
+        with _state_lock:
+            if not _state_dirty.is_set() or _state is None:
+                return
+            _state_dirty.clear()
+            # save_config() swaps in a new dict and never mutates this one,
+            # so it can be serialised without holding up readers
+            cfg = _state
+        try:
+            _write_config_file(cfg)
+        except Exception as e:
+            _state_dirty.set()
+            log_event(f"Failed to write config file: {e}", logging.ERROR)
+
+
+def _state_writer_loop() -> None:
+    while True:
+        _state_dirty.wait()
+        time.sleep(STATE_FLUSH_DELAY)  # coalesce everything saved meanwhile
+        flush_state()
+
+
+def ensure_state_writer() -> None:
+    global _state_writer
+    if _state_writer is not None and _state_writer.is_alive():
+        return
+    with _state_lock:
+        if _state_writer is None or not _state_writer.is_alive():
+            _state_writer = threading.Thread(
+                target=_state_writer_loop, name="ttlock-state-writer", daemon=True
+            )
+            _state_writer.start()
+
+
+def _install_sigterm_flush() -> None:
+    """
+    Flush on SIGTERM (docker stop) before the server's own handler runs.
+    atexit alone is too late: interpreter exit first waits for request
+    threads, and an open /api/events stream can outlast docker's kill timeout.
+    """
+    if threading.current_thread() is not threading.main_thread():
+        return
+    previous = signal.getsignal(signal.SIGTERM)
+
+    def handle_sigterm(signum, frame):
+        # Flush on a thread: the interrupted main thread may hold a lock
+        threading.Thread(target=flush_state, name="ttlock-state-flush").start()
+        if callable(previous):
+            previous(signum, frame)
+        else:
+            sys.exit(0)
+
+    signal.signal(signal.SIGTERM, handle_sigterm)
+
+
+_install_sigterm_flush()
+# Backstop for any other clean exit; runs before the log listener stops
+atexit.register(flush_state)
+
+
+# --------------------------------------------------------------------
+# Lock change tracking (versions for /api/locks?since=)
+# --------------------------------------------------------------------
+LOCK_HISTORY_SIZE = 1000  # removal tombstones kept for delta queries
+
+
+# Wakes /api/events streams when a saved config carries a new locks_version
+_lock_change = threading.Condition()
+_lock_change_version = 0
+
+
+def notify_lock_change(version: int) -> None:
+    global _lock_change_version
+    with _lock_change:
+        if version != _lock_change_version:
+            _lock_change_version = version
+            _lock_change.notify_all()
+
+
+def bump_lock_version(cfg: dict, lock_id) -> int:
+    version = int(cfg.get("locks_version", 0)) + 1
+    cfg["locks_version"] = version
+    cfg.setdefault("lock_versions", {})[str(lock_id)] = version
+    return version
+
+
+def record_lock_removal(cfg: dict, lock_id) -> int:
+    version = int(cfg.get("locks_version", 0)) + 1
+    cfg["locks_version"] = version
+    cfg.setdefault("lock_versions", {}).pop(str(lock_id), None)
+    removed = cfg.setdefault("removed_locks", [])
+    removed.append({"lockId": lock_id, "version": version})
+    if len(removed) > LOCK_HISTORY_SIZE:
+        # Deltas older than the oldest dropped tombstone can't be answered
+        dropped = removed[: len(removed) - LOCK_HISTORY_SIZE]
+        cfg["removed_locks"] = removed[len(dropped):]
+        cfg["locks_history_floor"] = dropped[-1]["version"]
+    return version
+
+
+def replace_locks(cfg: dict, locks: list[dict]) -> None:
+    """Store a freshly fetched lock list, versioning locks that changed."""
+    old = {str(lock.get("lockId")): lock for lock in cfg.get("locks", [])}
+    seen = set()
+    for lock in locks:
+        key = str(lock.get("lockId"))
+        seen.add(key)
+        if old.get(key) != lock:
+            bump_lock_version(cfg, key)
+    for key in old.keys() - seen:
+        record_lock_removal(cfg, old[key].get("lockId"))
+    cfg["locks"] = locks
+    cfg["locks_refreshed_at"] = time.time()
+
+
+def locks_since(cfg: dict, since: int) -> dict:
+    """Locks changed/removed after ``since``, or a full snapshot if too old."""
+    version = int(cfg.get("locks_version", 0))
+    locks = cfg.get("locks", [])
+    if since < int(cfg.get("locks_history_floor", 0)) or since > version:
+        return {"locks": locks, "removed": [], "version": version, "full": True}
+
+    versions = cfg.get("lock_versions", {})
+    present = {str(lock.get("lockId")) for lock in locks}
+    return {
+        "locks": [lock for lock in locks if versions.get(str(lock.get("lockId")), 0) > since],
+        "removed": [
+            entry["lockId"]
+            for entry in cfg.get("removed_locks", [])
+            if entry["version"] > since and str(entry["lockId"]) not in present
+        ],
+        "version": version,
+        "full": False,
+    }
 
 
 def update_lock_state(cfg: dict, lock_id: int, is_locked: bool) -> None:
@@ -103,6 +595,7 @@ def update_lock_state(cfg: dict, lock_id: int, is_locked: bool) -> None:
         lid = lock.get("lockId")
         if str(lid) == str(lock_id):
             lock["isLocked"] = bool(is_locked)
+            bump_lock_version(cfg, lid)
             updated = True
             break
     if updated:
@@ -114,6 +607,222 @@ def update_lock_state(cfg: dict, lock_id: int, is_locked: bool) -> None:
         )
 
 
+# --------------------------------------------------------------------
+# Upstream calls with the stored token (refreshed once when rejected)
+# --------------------------------------------------------------------
+_token_refresh_lock = threading.Lock()
+
+
+def refresh_stored_token(rejected_token: str) -> bool:
+    """Swap a rejected access token for a fresh one; True if a newer token is stored."""
+    with _token_refresh_lock:
+        cfg = read_state()
+        if cfg.get("access_token") != rejected_token:
+            return True  # another thread refreshed it meanwhile
+        if not (cfg.get("refresh_token") and cfg.get("client_secret")):
+            return False
+        try:
+            result = refresh_access_token(
+                base_url=cfg["api_base_url"],
+                client_id=cfg["client_id"],
+                client_secret=cfg["client_secret"],
+                refresh_token=cfg["refresh_token"],
+            )
+        except Exception as e:
+            log_event(f"Access token refresh failed: {e}", logging.ERROR, "upstream")
+            return False
+        with _config_lock:
+            cfg = load_config()
+            cfg["access_token"] = result["access_token"]
+            cfg["refresh_token"] = result.get("refresh_token") or cfg["refresh_token"]
+            try:
+                cfg["token_expires_at"] = time.time() + int(result.get("expires_in", 0))
+            except (TypeError, ValueError):
+                cfg["token_expires_at"] = 0
+            save_config(cfg)
+    log_event("Access token refreshed after it was rejected", component="upstream")
+    return True
+
+
+def call_upstream(fn, **kwargs):
+    """Call a ttlock_api function with the stored credentials (plus ``kwargs``)."""
+    cfg = read_state()
+    token = cfg.get("access_token", "")
+    try:
+        return fn(
+            base_url=cfg["api_base_url"],
+            client_id=cfg["client_id"],
+            access_token=token,
+            **kwargs,
+        )
+    except TTLockError as e:
+        if e.kind != "token" or not refresh_stored_token(token):
+            raise
+    cfg = read_state()
+    return fn(
+        base_url=cfg["api_base_url"],
+        client_id=cfg["client_id"],
+        access_token=cfg["access_token"],
+        **kwargs,
+    )
+
+
+# --------------------------------------------------------------------
+# TTLock cloud callbacks (lock records pushed to /api/callback)
+# --------------------------------------------------------------------
+CALLBACK_QUEUE_SIZE = 1000
+RECORD_SYNC_WINDOW_MS = 24 * 3600 * 1000  # first cloud pull per lock looks back 1 day
+
+record_journal = RecordJournal(RECORDS_PATH)
+
+_config_lock = threading.Lock()
+_callback_queue: "queue.Queue[tuple[int, list[dict]]]" = queue.Queue(maxsize=CALLBACK_QUEUE_SIZE)
+_callback_worker: threading.Thread | None = None
+_callback_worker_guard = threading.Lock()
+
+
+def parse_callback_payload(payload: dict) -> tuple[int, list[dict]]:
+    """Validate a TTLock callback body and return (lock_id, records)."""
+    try:
+        lock_id = int(payload.get("lockId"))
+    except (TypeError, ValueError):
+        raise ValueError("missing or invalid lockId")
+
+    records = payload.get("records", [])
+    if isinstance(records, str):
+        try:
+            records = json.loads(records) if records else []
+        except ValueError:
+            raise ValueError("records is not valid JSON")
+    if not isinstance(records, list) or not all(isinstance(r, dict) for r in records):
+        raise ValueError("records must be a list of objects")
+
+    return lock_id, records
+
+
+def apply_lock_records(cfg: dict, lock_id: int, records: list[dict]) -> bool:
+    """Apply pushed lock records (oldest first) to the stored lock state."""
+    lock = None
+    for candidate in cfg.get("locks", []):
+        if str(candidate.get("lockId")) == str(lock_id):
+            lock = candidate
+            break
+    if lock is None:
+        log_event(f"Callback for unknown lock {lock_id} ignored", logging.DEBUG, "callbacks")
+        return False
+
+    for record in sorted(records, key=record_time):
+        if str(record.get("success", 1)) != "1":
+            continue
+        kind = record_type(record)
+
+        if kind in LOCK_RECORD_TYPES:
+            lock["isLocked"] = True
+        elif kind in UNLOCK_RECORD_TYPES:
+            lock["isLocked"] = False
+
+        lock["lastRecordType"] = kind
+        # Never the passcode itself: lock state is served and exported as-is
+        lock["lastOperator"] = record.get("username") or ("passcode" if record.get("keyboardPwd") else "")
+        lock["lastEventTime"] = record_time(record)
+        if record.get("electricQuantity") is not None:
+            lock["electricQuantity"] = record["electricQuantity"]
+
+    if records:
+        bump_lock_version(cfg, lock.get("lockId"))
+    return True
+
+
+def _callback_worker_loop() -> None:
+    while True:
+        batch = [_callback_queue.get()]
+        # Drain whatever else is queued so a burst costs one config write
+        while True:
+            try:
+                batch.append(_callback_queue.get_nowait())
+            except queue.Empty:
+                break
+
+        try:
+            # Journal first; only records not seen before (callbacks get
+            # redelivered, cloud pulls overlap) are applied to lock state
+            fresh = [(lock_id, record_journal.append(lock_id, records)) for lock_id, records in batch]
+            with _config_lock:
+                cfg = load_config()
+                changed = False
+                for lock_id, records in fresh:
+                    if records:
+                        changed = apply_lock_records(cfg, lock_id, records) or changed
+                if changed:
+                    save_config(cfg)
+            log_event(f"Applied {len(batch)} TTLock callback(s)", logging.DEBUG, "callbacks")
+        except Exception as e:
+            log_event(f"Error applying TTLock callbacks: {e}", logging.ERROR, "callbacks")
+        finally:
+            for _ in batch:
+                _callback_queue.task_done()
+
+
+def _record_sync_loop() -> None:
+    """Pull new lock records from the cloud into the callback queue."""
+    while True:
+        time.sleep(RECORD_SYNC_INTERVAL)
+        cfg = read_state()
+        if not cfg.get("access_token") or not cfg.get("client_id"):
+            continue
+        now_ms = int(time.time() * 1000)
+        for lock in cfg.get("locks", []):
+            lock_id = lock.get("lockId")
+            start_ms = max(record_journal.last_time(lock_id) + 1, now_ms - RECORD_SYNC_WINDOW_MS)
+            try:
+                records = fetch_lock_records(lock_id, start_ms, now_ms)
+            except Exception as e:
+                # Nothing is journaled, so the cursor stays put and the whole
+                # window is fetched again next time
+                log_event(f"Record sync for lock {lock_id} failed: {e}", logging.WARNING, "records")
+                continue
+            if records:
+                ensure_callback_worker()
+                try:
+                    _callback_queue.put((int(lock_id), records), timeout=5)
+                except queue.Full:
+                    log_event("Record sync: callback queue full", logging.WARNING, "records")
+
+
+def fetch_lock_records(lock_id, start_ms: int, end_ms: int) -> list[dict]:
+    """
+    Every record of a lock in [start_ms, end_ms]. All pages are fetched before
+    anything is returned: journaling them advances the lock's cursor, so a
+    partial window would skip the unfetched records for good.
+    """
+    records: list[dict] = []
+    page_no = 1
+    while True:
+        result = call_upstream(
+            list_lock_records,
+            lock_id=lock_id,
+            start_ms=start_ms,
+            end_ms=end_ms,
+            page_no=page_no,
+        )
+        page = result.get("list") or []
+        records.extend(page)
+        reached_cursor = any(record_time(record) < start_ms for record in page)
+        if not page or reached_cursor or page_no >= int(result.get("pages") or 1):
+            return records
+        page_no += 1
+
+
+def ensure_callback_worker() -> None:
+    global _callback_worker
+    with _callback_worker_guard:
+        if _callback_worker is None or not _callback_worker.is_alive():
+            _callback_worker = threading.Thread(
+                target=_callback_worker_loop, name="ttlock-callbacks", daemon=True
+            )
+            _callback_worker.start()
+
+
 # --------------------------------------------------------------------
 # Curl builder for /v3/user/register
 # --------------------------------------------------------------------
@@ -154,6 +863,18 @@ def build_curl_example(cfg: dict) -> str:
 # --------------------------------------------------------------------
 # Routes – UI
 # --------------------------------------------------------------------
+# Routes that call the cloud work on a copy of the state and merge only the
+# fields they set into the current state afterwards: callbacks and jobs saved
+# while the call was in flight must not be overwritten by the stale copy.
+def update_config(updates: dict) -> dict:
+    """Merge ``updates`` into the current state and save it; returns the saved copy."""
+    with _config_lock:
+        cfg = load_config()
+        cfg.update(updates)
+        save_config(cfg)
+    return cfg
+
+
 @app.route("/", methods=["GET"])
 def index():
     cfg = load_config()
@@ -172,25 +893,25 @@ def index():
 
 @app.route("/hash_password", methods=["POST"])
 def hash_password_route():
-    cfg = load_config()
-
     username = request.form.get("username", "").strip()
     plain = request.form.get("plain_password", "").strip()
 
+    updates = {}
     if username:
-        cfg["username"] = username
+        updates["username"] = username
 
-    hashed = cfg.get("password_md5", "")
+    hashed = read_state().get("password_md5", "")
     if plain:
         hashed = hashlib.md5(plain.encode("utf-8")).hexdigest()
-        cfg["password_md5"] = hashed
-        log_event(f"Generated MD5 hash for username '{cfg['username']}'")
+        updates["password_md5"] = hashed
 
     now_ms = int(time.time() * 1000)
-    cfg["last_date_ms"] = str(now_ms)
-    log_event(f"Generated date ms: {cfg['last_date_ms']}")
+    updates["last_date_ms"] = str(now_ms)
 
-    save_config(cfg)
+    cfg = update_config(updates)
+    if plain:
+        log_event(f"Generated MD5 hash for username '{cfg['username']}'")
+    log_event(f"Generated date ms: {cfg['last_date_ms']}")
     curl_example = build_curl_example(cfg)
     log_tail = get_log_tail()
 
@@ -207,15 +928,15 @@ def hash_password_route():
 
 @app.route("/save_settings", methods=["POST"])
 def save_settings_route():
-    cfg = load_config()
+    cfg = read_state()
 
     try:
-        cfg["api_base_url"] = request.form.get("api_base_url", "").strip() or cfg["api_base_url"]
-        cfg["redirect_uri"] = request.form.get("redirect_uri", "").strip()
-        cfg["client_id"] = request.form.get("client_id", "").strip()
-        cfg["client_secret"] = request.form.get("client_secret", "").strip()
-
-        save_config(cfg)
+        cfg = update_config({
+            "api_base_url": request.form.get("api_base_url", "").strip() or cfg["api_base_url"],
+            "redirect_uri": request.form.get("redirect_uri", "").strip(),
+            "client_id": request.form.get("client_id", "").strip(),
+            "client_secret": request.form.get("client_secret", "").strip(),
+        })
         log_event("Settings updated (API base URL, redirect URI, client credentials)")
         status_msg = "Settings saved."
     except Exception as e:
@@ -242,6 +963,7 @@ def register_user_route():
 
     api_base_url = request.form.get("api_base_url", "").strip() or cfg["api_base_url"]
     cfg["api_base_url"] = api_base_url
+    updates = {"api_base_url": api_base_url}
 
     register_error = ""
     register_resp_raw = ""
@@ -252,16 +974,17 @@ def register_user_route():
     else:
         log_event(f"Attempting to register user '{cfg['username']}'")
         try:
-            result = register_user(
-                base_url=cfg["api_base_url"],
-                client_id=cfg["client_id"],
-                client_secret=cfg["client_secret"],
-                username=cfg["username"],
-                password_md5=cfg["password_md5"],
-            )
-            cfg["username"] = result.get("username", cfg["username"])
+            with blocking_requests.hold(), upstream_admission.admit():
+                result = register_user(
+                    base_url=cfg["api_base_url"],
+                    client_id=cfg["client_id"],
+                    client_secret=cfg["client_secret"],
+                    username=cfg["username"],
+                    password_md5=cfg["password_md5"],
+                )
+            updates["username"] = result.get("username", cfg["username"])
             register_resp_raw = json.dumps(result, indent=2)
-            log_event(f"User registered successfully, returned username: {cfg['username']}")
+            log_event(f"User registered successfully, returned username: {updates['username']}")
         except TTLockError as e:
             register_error = f"Register failed: {e}"
             log_event(f"TTLockError during register_user: {register_error}", logging.ERROR)
@@ -269,8 +992,8 @@ def register_user_route():
             register_error = f"Unexpected error: {e}"
             log_event(register_error, logging.ERROR)
 
-    cfg["raw_register_response"] = register_resp_raw
-    save_config(cfg)
+    updates["raw_register_response"] = register_resp_raw
+    cfg = update_config(updates)
     curl_example = build_curl_example(cfg)
     log_tail = get_log_tail()
 
@@ -294,6 +1017,7 @@ def get_token_route():
 
     cfg["api_base_url"] = api_base_url
     cfg["redirect_uri"] = redirect_uri
+    updates = {"api_base_url": api_base_url, "redirect_uri": redirect_uri}
 
     token_error = ""
     token_resp_raw = ""
@@ -304,16 +1028,21 @@ def get_token_route():
     else:
         log_event(f"Attempting to get access token for user '{cfg['username']}'")
         try:
-            result = get_access_token(
-                base_url=cfg["api_base_url"],
-                client_id=cfg["client_id"],
-                client_secret=cfg["client_secret"],
-                username=cfg["username"],
-                password_md5=cfg["password_md5"],
-                redirect_uri=cfg["redirect_uri"],
-            )
-            cfg["access_token"] = result.get("access_token", "")
-            cfg["refresh_token"] = result.get("refresh_token", "")
+            with blocking_requests.hold(), upstream_admission.admit():
+                result = get_access_token(
+                    base_url=cfg["api_base_url"],
+                    client_id=cfg["client_id"],
+                    client_secret=cfg["client_secret"],
+                    username=cfg["username"],
+                    password_md5=cfg["password_md5"],
+                    redirect_uri=cfg["redirect_uri"],
+                )
+            updates["access_token"] = result.get("access_token", "")
+            updates["refresh_token"] = result.get("refresh_token", "")
+            try:
+                updates["token_expires_at"] = time.time() + int(result.get("expires_in", 0))
+            except (TypeError, ValueError):
+                updates["token_expires_at"] = 0
             token_resp_raw = json.dumps(result, indent=2)
             log_event("Access token retrieved successfully")
         except TTLockError as e:
@@ -323,8 +1052,8 @@ def get_token_route():
             token_error = f"Unexpected error: {e}"
             log_event(token_error, logging.ERROR)
 
-    cfg["raw_token_response"] = token_resp_raw
-    save_config(cfg)
+    updates["raw_token_response"] = token_resp_raw
+    cfg = update_config(updates)
     curl_example = build_curl_example(cfg)
     log_tail = get_log_tail()
 
@@ -344,6 +1073,8 @@ def fetch_locks_route():
     cfg = load_config()
 
     lock_error = ""
+    attempted = False
+    locks = None
     if not cfg.get("access_token"):
         lock_error = "No access token available. Complete Steps 1–4 or use the Shortcut."
         log_event(f"Fetch locks aborted: {lock_error}", logging.WARNING)
@@ -352,28 +1083,28 @@ def fetch_locks_route():
         log_event(f"Fetch locks aborted: {lock_error}", logging.WARNING)
     else:
         log_event("Attempting to fetch lock list from TTLock")
+        attempted = True
         try:
-            result = list_locks(
-                base_url=cfg["api_base_url"],
-                client_id=cfg["client_id"],
-                access_token=cfg["access_token"],
-            )
+            with blocking_requests.hold(), upstream_admission.admit():
+                result = call_upstream(list_locks)
             locks = result.get("list", [])
-            # We deliberately overwrite lock metadata, but isLocked will be re-set
-            # after next lock/unlock command.
-            cfg["locks"] = locks
-            cfg["last_lock_error"] = ""
             log_event(f"Fetched {len(locks)} locks from TTLock")
         except TTLockError as e:
             lock_error = f"Lock list failed: {e}"
-            cfg["last_lock_error"] = lock_error
             log_event(lock_error, logging.ERROR)
         except Exception as e:
             lock_error = f"Unexpected error: {e}"
-            cfg["last_lock_error"] = lock_error
             log_event(lock_error, logging.ERROR)
 
-    save_config(cfg)
+    with _config_lock:
+        cfg = load_config()
+        if locks is not None:
+            # We deliberately overwrite lock metadata, but isLocked will be re-set
+            # after next lock/unlock command.
+            replace_locks(cfg, locks)
+        if attempted:
+            cfg["last_lock_error"] = lock_error
+        save_config(cfg)
     curl_example = build_curl_example(cfg)
     log_tail = get_log_tail()
 
@@ -413,30 +1144,21 @@ def control_lock_route():
     else:
         log_event(f"Attempting to {action} lock {lock_id}")
         try:
-            result = operate_lock(
-                base_url=cfg["api_base_url"],
-                client_id=cfg["client_id"],
-                access_token=cfg["access_token"],
-                lock_id=int(lock_id),
-                action=action,
-            )
-            result_text = json.dumps(result, indent=2)
-            action_error = ""
-            # Optimistic state: assume the lock obeyed the command
-            update_lock_state(cfg, int(lock_id), is_locked=(action == "lock"))
-            log_event(f"{action.capitalize()} command sent successfully for lock {lock_id}")
-        except TTLockError as e:
-            action_error = f"{action.capitalize()} failed: {e}"
-            result_text = ""
-            log_event(action_error, logging.ERROR)
+            # Same path as the API: lock mutex, admission, token refresh and
+            # the optimistic isLocked update
+            with blocking_requests.hold():
+                body, _ = run_lock_command(int(lock_id), action)
+            if body.get("success"):
+                result_text = json.dumps(body.get("result"), indent=2)
+                log_event(f"{action.capitalize()} command sent successfully for lock {lock_id}")
+            else:
+                action_error = f"{action.capitalize()} failed: {body.get('error', '')}"
+                log_event(action_error, logging.ERROR)
         except Exception as e:
             action_error = f"Unexpected error: {e}"
-            result_text = ""
             log_event(action_error, logging.ERROR)
 
-    cfg["last_lock_error"] = action_error
-    cfg["last_lock_action_result"] = result_text
-    save_config(cfg)
+    cfg = update_config({"last_lock_error": action_error, "last_lock_action_result": result_text})
 
     curl_example = build_curl_example(cfg)
     log_tail = get_log_tail()
@@ -466,56 +1188,65 @@ def fast_setup_route():
     access_token = request.form.get("fast_access_token", "").strip()
     refresh_token = request.form.get("fast_refresh_token", "").strip()
 
-    cfg["api_base_url"] = base_url
+    updates = {"api_base_url": base_url}
 
     if username:
-        cfg["username"] = username
+        updates["username"] = username
 
     # If given plain password, override MD5
     if plain_password:
         password_md5 = hashlib.md5(plain_password.encode("utf-8")).hexdigest()
-        log_event(f"Fast setup: generated MD5 hash for username '{cfg['username']}'")
+        log_event(f"Fast setup: generated MD5 hash for username '{username or cfg['username']}'")
 
     if password_md5:
-        cfg["password_md5"] = password_md5
+        updates["password_md5"] = password_md5
 
     if access_token:
-        cfg["access_token"] = access_token
+        updates["access_token"] = access_token
 
     if refresh_token:
-        cfg["refresh_token"] = refresh_token
+        updates["refresh_token"] = refresh_token
 
+    cfg.update(updates)
     message = ""
     error = ""
+    locks = None
 
     if cfg.get("access_token"):
         log_event("Fast setup: attempting to verify access token by fetching locks")
         try:
             if not cfg.get("client_id"):
                 raise TTLockError("client_id is missing. Complete Step 2 first.")
-            result = list_locks(
-                base_url=cfg["api_base_url"],
-                client_id=cfg["client_id"],
-                access_token=cfg["access_token"],
-            )
-            cfg["locks"] = result.get("list", [])
-            cfg["last_lock_error"] = ""
-            count = len(cfg["locks"])
+            # The token just entered, not necessarily the stored one
+            with blocking_requests.hold(), upstream_admission.admit():
+                result = list_locks(
+                    base_url=cfg["api_base_url"],
+                    client_id=cfg["client_id"],
+                    access_token=cfg["access_token"],
+                )
+            locks = result.get("list", [])
+            updates["last_lock_error"] = ""
+            count = len(locks)
             message = f"Verification successful. Found {count} locks. You can use Step 5 & 6 now."
             log_event(f"Fast setup verification succeeded, {count} locks found")
         except TTLockError as e:
             error = f"Verification failed (TTLock error): {e}"
-            cfg["last_lock_error"] = error
+            updates["last_lock_error"] = error
             log_event(error, logging.ERROR)
         except Exception as e:
             error = f"Verification failed (unexpected error): {e}"
-            cfg["last_lock_error"] = error
+            updates["last_lock_error"] = error
             log_event(error, logging.ERROR)
     else:
         message = "Credentials saved. Add an access token to verify and fetch locks."
         log_event("Fast setup: saved credentials without access token (no verification)")
 
-    save_config(cfg)
+    with _config_lock:
+        cfg = load_config()
+        cfg.update(updates)
+        if locks is not None:
+            replace_locks(cfg, locks)
+        save_config(cfg)
     curl_example = build_curl_example(cfg)
     log_tail = get_log_tail()
 
@@ -532,57 +1263,1162 @@ def fast_setup_route():
     )
 
 
+# --------------------------------------------------------------------
+# Admission control (bounded upstream concurrency, 503 when saturated)
+# --------------------------------------------------------------------
+class Overloaded(Exception):
+    """Upstream-bound work was shed; the client should retry later."""
+
+    def __init__(self, message: str, retry_after: int) -> None:
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class AdmissionControl:
+    """
+    At most ``limit`` upstream-bound requests run at once; up to ``queue_size``
+    more wait at most ``timeout`` seconds for a slot, anything beyond that is
+    rejected immediately. A stalled cloud therefore ties up a bounded number of
+    server threads instead of all of them.
+    """
+
+    def __init__(self, limit: int, queue_size: int, timeout: float) -> None:
+        self.limit = max(1, limit)
+        self.queue_size = max(0, queue_size)
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(self.limit)
+        self._lock = threading.Lock()
+        self._active = 0
+        self._waiting = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+
+    def retry_after(self) -> int:
+        return max(1, int(self.timeout + 0.999))
+
+    @contextmanager
+    def admit(self, wait: bool = False):
+        """
+        Hold a slot for the block. Request threads use the bounded queue;
+        wait=True (job workers, already off the request path) blocks until free.
+        """
+        if wait:
+            self._slots.acquire()
+        elif not self._slots.acquire(blocking=False):
+            with self._lock:
+                if self._waiting >= self.queue_size:
+                    self.rejected += 1
+                    raise Overloaded("Too many upstream requests in progress", self.retry_after())
+                self._waiting += 1
+            try:
+                acquired = self._slots.acquire(timeout=self.timeout)
+            finally:
+                with self._lock:
+                    self._waiting -= 1
+            if not acquired:
+                with self._lock:
+                    self.timed_out += 1
+                raise Overloaded("Timed out waiting for an upstream slot", self.retry_after())
+
+        with self._lock:
+            self._active += 1
+            self.admitted += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._active -= 1
+            self._slots.release()
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "limit": self.limit,
+                "active": self._active,
+                "waiting": self._waiting,
+                "queue_size": self.queue_size,
+                "admitted": self.admitted,
+                "rejected": self.rejected,
+                "timed_out": self.timed_out,
+            }
+
+
+upstream_admission = AdmissionControl(UPSTREAM_CONCURRENCY, UPSTREAM_QUEUE, UPSTREAM_QUEUE_TIMEOUT)
+# A primary and a hedge per admitted call, plus the health probe and record sync
+configure_hedging(2 * UPSTREAM_CONCURRENCY + 2)
+
+
+class RequestBudget:
+    """
+    Caps the request threads that may block: on the cloud, a lock's mutex,
+    a job long-poll or the original of a retried Idempotency-Key. Over the
+    cap a request is answered at once instead of tying up another thread.
+    """
+
+    def __init__(self, limit: int) -> None:
+        self.limit = max(1, limit)
+        self._slots = threading.BoundedSemaphore(self.limit)
+        self._lock = threading.Lock()
+        self._in_use = 0
+        self.rejected = 0
+
+    def try_acquire(self) -> bool:
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            return False
+        with self._lock:
+            self._in_use += 1
+        return True
+
+    def release(self) -> None:
+        with self._lock:
+            self._in_use -= 1
+        self._slots.release()
+
+    @contextmanager
+    def hold(self):
+        """Hold a slot for the block; raise Overloaded when none is free."""
+        if not self.try_acquire():
+            raise Overloaded("Too many requests waiting on the cloud or on commands", 1)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {"limit": self.limit, "in_use": self._in_use, "rejected": self.rejected}
+
+
+blocking_requests = RequestBudget(BLOCKING_REQUESTS)
+
+
+def bounded_wait(events: list, timeout: float) -> bool:
+    """
+    Wait up to ``timeout`` seconds for all ``events`` on a request thread,
+    within the blocking-request budget. False (without waiting) when an event
+    is still pending and the budget is used up.
+    """
+    pending = [event for event in events if event is not None and not event.is_set()]
+    if not pending or timeout <= 0:
+        return True
+    if not blocking_requests.try_acquire():
+        return False
+    try:
+        deadline = time.monotonic() + timeout
+        for event in pending:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            event.wait(remaining)
+    finally:
+        blocking_requests.release()
+    return True
+
+
+@app.errorhandler(Overloaded)
+def _handle_overloaded(e: Overloaded):
+    log_event(f"{request.method} {request.path} shed: {e}", logging.WARNING, "admission")
+    resp = jsonify({"success": False, "error": str(e)})
+    resp.headers["Retry-After"] = str(e.retry_after)
+    return resp, 503
+
+
 # --------------------------------------------------------------------
 # JSON API for external integrations
 # --------------------------------------------------------------------
+# The plain /api/locks body (and its gzip form) is encoded once per
+# locks_version and shared by every poller until the lock list changes. Every
+# lock change bumps the version and save_config() never lets it go back, so
+# saves that leave the locks alone (tokens, job bookkeeping) keep the cache.
+_locks_body: dict | None = None
+_locks_body_lock = threading.Lock()
+
+
+def encoded_locks(cfg: dict) -> dict:
+    global _locks_body
+    version = int(cfg.get("locks_version", 0))
+    cached = _locks_body
+    if cached is not None and cached["version"] == version:
+        return cached
+    with _locks_body_lock:
+        if _locks_body is not None and _locks_body["version"] == version:
+            return _locks_body
+        with span("encode"):
+            payload = {"locks": cfg.get("locks", []), "version": version}
+            body = (app.json.dumps(payload, separators=(",", ":")) + "\n").encode("utf-8")
+            encoded = {
+                "version": version,
+                # Weak: the gzip and identity bodies share it
+                "etag": f"locks-{version}",
+                "plain": body,
+                "gzip": gzip.compress(body, compresslevel=6, mtime=0),
+            }
+        # A request holding an older state must not evict the current body
+        if _locks_body is None or version > _locks_body["version"]:
+            _locks_body = encoded
+        return encoded
+
+
+def locks_response(cfg: dict) -> Response:
+    encoded = encoded_locks(cfg)
+    if request.if_none_match.contains_weak(encoded["etag"]):
+        resp = Response(status=304)
+    elif request.accept_encodings["gzip"]:
+        resp = Response(encoded["gzip"], mimetype="application/json")
+        resp.headers["Content-Encoding"] = "gzip"
+    else:
+        resp = Response(encoded["plain"], mimetype="application/json")
+    resp.set_etag(encoded["etag"], weak=True)
+    # On the 304 too, so caches keep the gzip and identity bodies apart
+    resp.headers["Vary"] = "Accept-Encoding"
+    return resp
+
+
+def poll_interval_hint() -> float:
+    """Seconds /api/locks pollers should wait; 0 means no preference."""
+    upstream = upstream_admission.snapshot()
+    budget = blocking_requests.snapshot()
+    load = max(
+        upstream["active"] / max(1, upstream["limit"]),
+        budget["in_use"] / max(1, budget["limit"]),
+        1.0 if upstream["waiting"] else 0.0,
+    )
+    busy = BUSY_POLL_INTERVAL * min(1.0, 2 * load - 1) if load > 0.5 else 0.0
+    return max(POLL_INTERVAL_HINT, busy)
+
+
 @app.route("/api/locks", methods=["GET"])
 def api_locks():
-    cfg = load_config()
+    cfg = read_state()
     if not cfg.get("locks") and cfg.get("access_token") and cfg.get("client_id"):
         try:
-            result = list_locks(
-                base_url=cfg["api_base_url"],
-                client_id=cfg["client_id"],
-                access_token=cfg["access_token"],
-            )
-            cfg["locks"] = result.get("list", [])
-            save_config(cfg)
+            with blocking_requests.hold(), upstream_admission.admit(), span("upstream"):
+                result = call_upstream(list_locks)
+            with _config_lock:
+                cfg = load_config()
+                replace_locks(cfg, result.get("list", []))
+                save_config(cfg)
             log_event(f"/api/locks auto-fetched {len(cfg['locks'])} locks")
+            cfg = read_state()
         except Exception as e:
             log_event(f"/api/locks error fetching locks: {e}", logging.ERROR)
 
-    return jsonify({"locks": cfg.get("locks", [])})
+    since = request.args.get("since", "")
+    if since:
+        try:
+            resp = jsonify(locks_since(cfg, int(since)))
+        except ValueError:
+            return jsonify({"success": False, "error": "since must be an integer"}), 400
+    elif request.args.get("ids"):
+        wanted = {lock_id.strip() for lock_id in request.args["ids"].split(",")}
+        locks = [lock for lock in cfg.get("locks", []) if str(lock.get("lockId")) in wanted]
+        resp = jsonify({"locks": locks, "version": int(cfg.get("locks_version", 0))})
+    else:
+        resp = locks_response(cfg)
 
+    hint = poll_interval_hint()
+    if hint:
+        resp.headers["X-Poll-Interval"] = f"{hint:g}"
+    return resp
 
-@app.route("/api/locks/<int:lock_id>/<action>", methods=["POST"])
-def api_operate_lock(lock_id: int, action: str):
+
+# --------------------------------------------------------------------
+# Server-sent lock change events
+# --------------------------------------------------------------------
+EVENT_HEARTBEAT_SECONDS = 15
+EVENT_STREAM_MAX_SECONDS = 600  # clients reconnect (and resume) after this
+MAX_EVENT_STREAMS = 4  # each stream holds a gunicorn thread
+
+_event_stream_slots = threading.BoundedSemaphore(MAX_EVENT_STREAMS)
+
+
+def _sse(event: str, version: int, payload: dict) -> str:
+    return f"id: {version}\nevent: {event}\ndata: {json.dumps(payload)}\n\n"
+
+
+def lock_event_stream(since: int | None):
+    """Yield SSE 'locks' events (same shape as /api/locks?since=) as versions change."""
+    deadline = time.monotonic() + EVENT_STREAM_MAX_SECONDS
+    with _lock_change:
+        seen = _lock_change_version
+
+    yield "retry: 5000\n\n"
+    cfg = load_config()
+    last = int(cfg.get("locks_version", 0))
+    if since is None or since != last:
+        payload = locks_since(cfg, since if since is not None else -1)
+        yield _sse("locks", last, payload)
+
+    while time.monotonic() < deadline:
+        with _lock_change:
+            if _lock_change_version == seen:
+                _lock_change.wait(EVENT_HEARTBEAT_SECONDS)
+            changed = _lock_change_version != seen
+            seen = _lock_change_version
+        if not changed:
+            yield ": keepalive\n\n"
+            continue
+
+        cfg = load_config()
+        version = int(cfg.get("locks_version", 0))
+        if version != last:
+            payload = locks_since(cfg, last)
+            last = version
+            yield _sse("locks", version, payload)
+
+
+@app.route("/api/events", methods=["GET"])
+def api_events():
+    """
+    Server-sent events stream of lock changes. Resume with the Last-Event-ID
+    header (or ?since=<version>); without either the first event is a full snapshot.
+    """
+    since_raw = request.headers.get("Last-Event-ID") or request.args.get("since", "")
+    try:
+        since = int(since_raw) if since_raw else None
+    except ValueError:
+        return jsonify({"success": False, "error": "since must be an integer"}), 400
+
+    if not _event_stream_slots.acquire(blocking=False):
+        resp = jsonify({"success": False, "error": "Too many event streams"})
+        resp.headers["Retry-After"] = "30"
+        return resp, 503
+
+    resp = Response(stream_with_context(lock_event_stream(since)), mimetype="text/event-stream")
+    resp.headers["Cache-Control"] = "no-cache"
+    resp.headers["X-Accel-Buffering"] = "no"
+    resp.call_on_close(_event_stream_slots.release)
+    return resp
+
+
+@app.route("/api/callback", methods=["POST"])
+def api_callback():
+    """
+    Receiver for TTLock lock-record callbacks.
+
+    Only validates and enqueues; records are applied by a background worker so
+    the cloud gets its "success" acknowledgement immediately.
+    """
+    if CALLBACK_TOKEN and request.args.get("token", "") != CALLBACK_TOKEN:
+        log_event("/api/callback rejected: bad token", logging.WARNING)
+        return jsonify({"success": False, "error": "Invalid token"}), 403
+
+    payload = request.form.to_dict() or request.get_json(silent=True) or {}
+    try:
+        lock_id, records = parse_callback_payload(payload)
+    except ValueError as e:
+        log_event(f"/api/callback rejected: {e}", logging.WARNING)
+        return jsonify({"success": False, "error": str(e)}), 400
+
+    ensure_callback_worker()
+    try:
+        _callback_queue.put_nowait((lock_id, records))
+    except queue.Full:
+        log_event("/api/callback queue full, dropping callback", logging.WARNING)
+        return jsonify({"success": False, "error": "Callback queue full"}), 503
+
+    return "success"
+
+
+# One mutex per lock: commands to the same lock run one at a time (the
+# gateway handles them serially anyway), different locks run in parallel.
+# Entries are [mutex, users] and are dropped when the last user leaves, so
+# arbitrary lock ids in request paths don't accumulate.
+_lock_mutexes: dict[int, list] = {}
+_lock_mutexes_guard = threading.Lock()
+
+
+@contextmanager
+def lock_mutex(lock_id: int):
+    with _lock_mutexes_guard:
+        entry = _lock_mutexes.get(lock_id)
+        if entry is None:
+            entry = _lock_mutexes[lock_id] = [threading.Lock(), 0]
+        entry[1] += 1
+    try:
+        with span("lock_wait"):
+            entry[0].acquire()
+        try:
+            yield
+        finally:
+            entry[0].release()
+    finally:
+        with _lock_mutexes_guard:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del _lock_mutexes[lock_id]
+
+
+def run_lock_command(lock_id: int, action: str, wait: bool = False) -> tuple[dict, int]:
+    """
+    Send a lock/unlock command upstream and return (response body, HTTP status).
+
+    The lock's mutex is taken before an upstream slot, so commands queued
+    behind a slow lock never hold slots that other locks could use. ``wait``
+    is passed to upstream_admission.admit().
+    """
+    with lock_mutex(int(lock_id)):
+        with upstream_admission.admit(wait=wait):
+            return _run_lock_command(lock_id, action)
+
+
+def _run_lock_command(lock_id: int, action: str) -> tuple[dict, int]:
     cfg = load_config()
 
     if not cfg.get("access_token"):
-        return jsonify({"success": False, "error": "No access token"}), 400
+        return {"success": False, "error": "No access token"}, 400
 
     if not cfg.get("client_id"):
-        return jsonify({"success": False, "error": "No client_id configured"}), 400
+        return {"success": False, "error": "No client_id configured"}, 400
 
     try:
-        result = operate_lock(
-            base_url=cfg["api_base_url"],
-            client_id=cfg["client_id"],
-            access_token=cfg["access_token"],
-            lock_id=lock_id,
-            action=action,
-        )
-        # Update optimistic state
-        update_lock_state(cfg, lock_id, is_locked=(action == "lock"))
-        save_config(cfg)
+        with span("upstream"):
+            result = call_upstream(operate_lock, lock_id=lock_id, action=action)
+        # Update optimistic state on a fresh copy so pushes applied while the
+        # command was in flight are not overwritten
+        with _config_lock:
+            cfg = load_config()
+            update_lock_state(cfg, lock_id, is_locked=(action == "lock"))
+            save_config(cfg)
         log_event(f"/api/locks/{lock_id}/{action} succeeded")
-        return jsonify({"success": True, "result": result})
+        return {"success": True, "result": result}, 200
     except TTLockError as e:
         log_event(f"/api/locks/{lock_id}/{action} TTLockError: {e}", logging.ERROR)
-        return jsonify({"success": False, "error": str(e)}), 500
+        return {"success": False, "error": str(e)}, 500
     except Exception as e:
         log_event(f"/api/locks/{lock_id}/{action} unexpected error: {e}", logging.ERROR)
-        return jsonify({"success": False, "error": str(e)}), 500
+        return {"success": False, "error": str(e)}, 500
+
+
+# --------------------------------------------------------------------
+# Async command jobs (POST ...?async=1 -> 202, then GET /api/jobs/<id>)
+# --------------------------------------------------------------------
+JOB_RETENTION = 600  # seconds a finished job stays queryable
+MAX_JOB_WAIT = 30  # cap for GET /api/jobs/<id>?wait=
+
+_job_executor = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix="ttlock-job")
+_jobs: dict[str, dict] = {}
+_job_events: dict[str, threading.Event] = {}
+# lockId -> ids of its unfinished jobs, oldest (the one submitted) first.
+# Only the head job of a lock is on the pool, so jobs waiting behind a slow
+# lock don't occupy workers that other locks could use.
+_lock_job_queues: dict[int, deque] = {}
+_jobs_lock = threading.Lock()
+
+
+def _prune_jobs() -> None:
+    cutoff = time.time() - JOB_RETENTION
+    with _jobs_lock:
+        expired = [
+            job_id
+            for job_id, job in _jobs.items()
+            if job["finished"] is not None and job["finished"] < cutoff
+        ]
+        for job_id in expired:
+            _jobs.pop(job_id, None)
+            _job_events.pop(job_id, None)
+
+
+def _run_lock_job(job_id: str) -> None:
+    with _jobs_lock:
+        job = _jobs[job_id]
+        job["status"] = "running"
+
+    trace = start_trace(job["trace_id"], f"job {job['action']} {job['lockId']}")
+    status: int | str = "error"
+    try:
+        body, status = run_lock_command(job["lockId"], job["action"], wait=True)
+    except Exception as e:
+        # The lock's next job must still be started
+        body = {"success": False, "error": str(e)}
+    finally:
+        finish_trace(trace, status)
+
+    with _jobs_lock:
+        job["status"] = "succeeded" if body.get("success") else "failed"
+        job["http_status"] = status
+        job["result"] = body.get("result")
+        job["error"] = body.get("error", "")
+        job["finished"] = time.time()
+        event = _job_events.get(job_id)
+        pending = _lock_job_queues[job["lockId"]]
+        pending.popleft()
+        next_id = pending[0] if pending else None
+        if not pending:
+            del _lock_job_queues[job["lockId"]]
+    if event is not None:
+        event.set()
+    if next_id is not None:
+        _job_executor.submit(_run_lock_job, next_id)
+
+
+def reserve_job_capacity(count: int) -> None:
+    """Raise Overloaded if ``count`` more jobs would exceed MAX_QUEUED_JOBS."""
+    with _jobs_lock:
+        unfinished = sum(1 for job in _jobs.values() if job["finished"] is None)
+    if unfinished + count > MAX_QUEUED_JOBS:
+        raise Overloaded(
+            f"Command queue full ({unfinished} queued, limit {MAX_QUEUED_JOBS})",
+            upstream_admission.retry_after(),
+        )
+
+
+def submit_lock_job(lock_id: int, action: str, trace_id: str = "") -> dict:
+    _prune_jobs()
+    job_id = uuid.uuid4().hex
+    job = {
+        "id": job_id,
+        "lockId": lock_id,
+        "action": action,
+        "trace_id": trace_id or job_id,
+        "status": "pending",
+        "created": time.time(),
+        "finished": None,
+        "http_status": None,
+        "result": None,
+        "error": "",
+    }
+    with _jobs_lock:
+        _jobs[job_id] = job
+        _job_events[job_id] = threading.Event()
+        pending = _lock_job_queues.setdefault(lock_id, deque())
+        pending.append(job_id)
+        first = len(pending) == 1
+        snapshot = dict(job)
+    if first:
+        _job_executor.submit(_run_lock_job, job_id)
+    log_event(f"Queued {action} job {job_id} for lock {lock_id}", component="jobs")
+    return snapshot
+
+
+# --------------------------------------------------------------------
+# Idempotency-Key for command requests (retries replay the first result)
+# --------------------------------------------------------------------
+IDEMPOTENCY_TTL = 600  # seconds a key is remembered
+IDEMPOTENCY_CACHE_SIZE = 1000
+IDEMPOTENCY_WAIT = 30  # seconds a retry waits for the original to finish
+MAX_IDEMPOTENCY_KEY_LENGTH = 255
+
+_idempotency: OrderedDict[str, dict] = OrderedDict()
+_idempotency_lock = threading.Lock()
+
+
+def claim_idempotency_key(key: str, fingerprint: tuple) -> tuple[dict, bool]:
+    """Return (entry, True) for a new key, or the existing entry and False."""
+    now = time.monotonic()
+    with _idempotency_lock:
+        while _idempotency:
+            oldest = next(iter(_idempotency.values()))
+            if now - oldest["created"] < IDEMPOTENCY_TTL and len(_idempotency) < IDEMPOTENCY_CACHE_SIZE:
+                break
+            _idempotency.popitem(last=False)
+        entry = _idempotency.get(key)
+        if entry is not None:
+            return entry, False
+        entry = _idempotency[key] = {
+            "fingerprint": fingerprint,
+            "created": now,
+            "done": threading.Event(),
+            "response": None,  # (body, status) of a synchronous command
+            "job_ids": None,  # jobs of an async command or batch
+        }
+        return entry, True
+
+
+def release_idempotency_key(key: str) -> None:
+    """Forget a key whose request failed before producing a result."""
+    with _idempotency_lock:
+        entry = _idempotency.pop(key, None)
+    if entry is not None:
+        entry["done"].set()
+
+
+def idempotency_key() -> tuple[str, tuple | None]:
+    """The request's Idempotency-Key, or an error response if it is unusable."""
+    key = request.headers.get("Idempotency-Key", "").strip()
+    if len(key) > MAX_IDEMPOTENCY_KEY_LENGTH:
+        return "", ({"success": False, "error": "Idempotency-Key is too long"}, 400)
+    return key, None
+
+
+def replay_idempotent(entry: dict, fingerprint: tuple):
+    """Response for a retried key: the original result, never a new upstream call."""
+    if entry["fingerprint"] != fingerprint:
+        return jsonify({"success": False, "error": "Idempotency-Key was used for a different request"}), 422
+    if not bounded_wait([entry["done"]], IDEMPOTENCY_WAIT) or not entry["done"].is_set():
+        resp = jsonify({"success": False, "error": "Original request is still in progress"})
+        resp.headers["Retry-After"] = "1"
+        return resp, 409
+    if entry["job_ids"] is not None:
+        with _jobs_lock:
+            jobs = [dict(_jobs[job_id]) for job_id in entry["job_ids"] if job_id in _jobs]
+        if len(jobs) != len(entry["job_ids"]):
+            return jsonify({"success": False, "error": "Original jobs have expired"}), 409
+        if len(jobs) == 1 and entry["fingerprint"][0] != "batch":
+            body = {"success": True, "job": jobs[0], "status_url": f"/api/jobs/{jobs[0]['id']}"}
+            status = 202
+        else:
+            body = {
+                "success": True,
+                "results": [{"lockId": job["lockId"], "action": job["action"], "job": job} for job in jobs],
+            }
+            status = 200 if all(job["finished"] is not None for job in jobs) else 202
+    else:
+        body, status = entry["response"]
+    resp = jsonify(body)
+    resp.headers["Idempotent-Replayed"] = "true"
+    return resp, status
+
+
+def wants_async() -> bool:
+    flag = request.args.get("async", "").lower() in ("1", "true", "yes")
+    return flag or "respond-async" in request.headers.get("Prefer", "")
+
+
+@app.route("/api/records", methods=["GET"])
+def api_records():
+    """
+    Lock records with seq > ?after= (oldest first, at most ?limit=). Without a
+    cursor, ?tail=<n> returns the newest n records to seed one.
+    """
+    try:
+        limit = max(1, min(int(request.args.get("limit", 200)), 1000))
+        if "after" in request.args:
+            return jsonify(record_journal.since(int(request.args["after"]), limit))
+        return jsonify(record_journal.tail(min(int(request.args.get("tail", 50)), 1000)))
+    except ValueError:
+        return jsonify({"success": False, "error": "after, limit and tail must be integers"}), 400
+
+
+@app.route("/api/locks/<int:lock_id>/<action>", methods=["POST"])
+def api_operate_lock(lock_id: int, action: str):
+    """
+    With an Idempotency-Key header, a retry of the same command within
+    IDEMPOTENCY_TTL gets the original result instead of a second command.
+    """
+    key, error = idempotency_key()
+    if error:
+        return jsonify(error[0]), error[1]
+    fingerprint = ("lock", lock_id, action.lower())
+    if key:
+        entry, new = claim_idempotency_key(key, fingerprint)
+        if not new:
+            log_event(f"/api/locks/{lock_id}/{action} replayed for Idempotency-Key", component="jobs")
+            return replay_idempotent(entry, fingerprint)
+
+    try:
+        if wants_async():
+            if action.lower() not in ("lock", "unlock"):
+                if key:
+                    release_idempotency_key(key)
+                return jsonify({"success": False, "error": f"Invalid action: {action}"}), 400
+            reserve_job_capacity(1)
+            job = submit_lock_job(lock_id, action.lower(), g.get("trace_id", ""))
+            if key:
+                entry["job_ids"] = [job["id"]]
+                entry["done"].set()
+            status_url = f"/api/jobs/{job['id']}"
+            resp = jsonify({"success": True, "job": job, "status_url": status_url})
+            resp.headers["Location"] = status_url
+            return resp, 202
+
+        with blocking_requests.hold():
+            body, status = run_lock_command(lock_id, action)
+    except BaseException:
+        if key:
+            release_idempotency_key(key)
+        raise
+    if key:
+        entry["response"] = (body, status)
+        entry["done"].set()
+    return jsonify(body), status
+
+
+@app.route("/api/traces", methods=["GET"])
+def api_traces():
+    """Recent traces, newest first; ?slow_ms= keeps only slower ones."""
+    try:
+        slow_ms = float(request.args.get("slow_ms", 0))
+    except ValueError:
+        slow_ms = 0
+    trace_id = request.args.get("trace_id", "")
+    with _traces_lock:
+        traces = list(_traces)
+    traces = [
+        t
+        for t in reversed(traces)
+        if t["duration_ms"] >= slow_ms and (not trace_id or t["trace_id"] == trace_id)
+    ]
+    return jsonify({"traces": traces})
+
+
+@app.route("/api/logging", methods=["GET"])
+def api_logging():
+    return jsonify(log_stats())
+
+
+MAX_BATCH_COMMANDS = 100
+
+
+@app.route("/api/locks/batch", methods=["POST"])
+def api_batch_operate_locks():
+    """
+    Body: {"commands": [{"lockId": 123, "action": "lock"}, ...]}
+
+    Every command runs as a job on the worker pool, so a group is scheduled
+    concurrently. ?wait=<seconds> waits for the jobs; the reply is 200 when all
+    have finished, otherwise 202 and the rest can be polled via /api/jobs/<id>.
+    """
+    body = request.get_json(silent=True) or {}
+    commands = body.get("commands")
+    if not isinstance(commands, list) or not commands:
+        return jsonify({"success": False, "error": "commands must be a non-empty list"}), 400
+    if len(commands) > MAX_BATCH_COMMANDS:
+        return jsonify({"success": False, "error": f"At most {MAX_BATCH_COMMANDS} commands"}), 400
+
+    parsed = []
+    for index, command in enumerate(commands):
+        try:
+            lock_id = int(command.get("lockId"))
+            action = str(command.get("action", "")).lower()
+        except (AttributeError, TypeError, ValueError):
+            return jsonify({"success": False, "error": f"Invalid command {index}"}), 400
+        if action not in ("lock", "unlock"):
+            return jsonify({"success": False, "error": f"Invalid action in command {index}"}), 400
+        parsed.append((lock_id, action))
+
+    key, error = idempotency_key()
+    if error:
+        return jsonify(error[0]), error[1]
+    fingerprint = ("batch", tuple(parsed))
+    if key:
+        entry, new = claim_idempotency_key(key, fingerprint)
+        if not new:
+            log_event("Batch replayed for Idempotency-Key", component="jobs")
+            return replay_idempotent(entry, fingerprint)
+
+    trace_id = g.get("trace_id", "")
+    try:
+        reserve_job_capacity(len(parsed))
+        jobs = [submit_lock_job(lock_id, action, trace_id) for lock_id, action in parsed]
+    except BaseException:
+        if key:
+            release_idempotency_key(key)
+        raise
+    if key:
+        entry["job_ids"] = [job["id"] for job in jobs]
+        entry["done"].set()
+    log_event(f"Batch of {len(jobs)} lock commands queued", component="jobs")
+
+    try:
+        wait = min(float(request.args.get("wait", 0)), MAX_JOB_WAIT)
+    except ValueError:
+        wait = 0
+    with _jobs_lock:
+        events = [_job_events.get(job["id"]) for job in jobs]
+    waited = bounded_wait(events, wait)
+
+    with _jobs_lock:
+        results = [
+            {"lockId": job["lockId"], "action": job["action"], "job": dict(_jobs.get(job["id"], job))}
+            for job in jobs
+        ]
+    all_done = all(result["job"]["finished"] is not None for result in results)
+    resp = jsonify({"success": True, "results": results})
+    if not waited:
+        resp.headers["Retry-After"] = "1"  # too many waiters; poll the jobs instead
+    return resp, 200 if all_done else 202
+
+
+@app.route("/api/jobs/<job_id>", methods=["GET"])
+def api_job_status(job_id: str):
+    """
+    Job status. ?wait=<seconds> blocks until the job completes (or the wait
+    expires), so clients can long-poll for the completion event.
+    """
+    with _jobs_lock:
+        event = _job_events.get(job_id)
+    if event is None:
+        return jsonify({"success": False, "error": "Unknown job"}), 404
+
+    try:
+        wait = min(float(request.args.get("wait", 0)), MAX_JOB_WAIT)
+    except ValueError:
+        wait = 0
+    waited = bounded_wait([event], wait)
+
+    with _jobs_lock:
+        job = _jobs.get(job_id)
+        job = dict(job) if job is not None else None
+    if job is None:
+        return jsonify({"success": False, "error": "Unknown job"}), 404
+    resp = jsonify({"success": True, "job": job})
+    if not waited:
+        # Too many long-polls in progress: answered at once, poll again later
+        resp.headers["Retry-After"] = "1"
+    return resp
+
+
+# --------------------------------------------------------------------
+# Bulk passcode / eKey provisioning
+# --------------------------------------------------------------------
+def call_upstream_in_background(fn, **kwargs):
+    """call_upstream() for background work, which waits for an admission slot."""
+    with upstream_admission.admit(wait=True):
+        return call_upstream(fn, **kwargs)
+
+
+provisioning_jobs = ProvisioningManager(PROVISIONING_DIR, read_state, call_upstream_in_background)
+provisioning_jobs.resume_incomplete()
+
+if RECORD_SYNC_INTERVAL > 0:
+    threading.Thread(target=_record_sync_loop, name="ttlock-record-sync", daemon=True).start()
+
+
+@app.route("/api/provisioning/jobs", methods=["POST"])
+def api_create_provisioning_job():
+    """
+    Body: {"items": [{"lockId", "type": "passcode"|"ekey", "passcode" or
+    "receiverUsername", "name", "startDate", "endDate"}, ...],
+    "concurrency": 4, "rate": 5}
+    """
+    cfg = read_state()
+    if not cfg.get("access_token") or not cfg.get("client_id"):
+        return jsonify({"success": False, "error": "No access token / client_id configured"}), 400
+
+    body = request.get_json(silent=True) or {}
+    items, errors = validate_items(body.get("items"))
+    if errors:
+        return jsonify({"success": False, "error": "Invalid items", "details": errors[:50]}), 400
+
+    try:
+        concurrency = int(body.get("concurrency", DEFAULT_CONCURRENCY))
+        rate = float(body.get("rate", DEFAULT_RATE))
+    except (TypeError, ValueError):
+        return jsonify({"success": False, "error": "concurrency and rate must be numbers"}), 400
+
+    job = provisioning_jobs.create_job(items, concurrency, rate)
+    log_event(f"Provisioning job {job['id']} started with {job['total']} items", component="provisioning")
+    resp = jsonify({"success": True, "job": job})
+    resp.headers["Location"] = f"/api/provisioning/jobs/{job['id']}"
+    return resp, 202
+
+
+@app.route("/api/provisioning/jobs", methods=["GET"])
+def api_list_provisioning_jobs():
+    return jsonify({"jobs": provisioning_jobs.list_jobs()})
+
+
+@app.route("/api/provisioning/jobs/<job_id>", methods=["GET"])
+def api_provisioning_job(job_id: str):
+    """?results=1 includes per-item results, ?status=failed filters them."""
+    include = request.args.get("results", "").lower() in ("1", "true", "yes")
+    try:
+        job = provisioning_jobs.status(job_id, include, request.args.get("status", ""))
+    except KeyError:
+        return jsonify({"success": False, "error": "Unknown job"}), 404
+    return jsonify({"success": True, "job": job})
+
+
+@app.route("/api/provisioning/jobs/<job_id>/resume", methods=["POST"])
+def api_resume_provisioning_job(job_id: str):
+    """Resume an interrupted/cancelled job; ?retry_failed=1 re-runs failed items."""
+    retry_failed = request.args.get("retry_failed", "").lower() in ("1", "true", "yes")
+    try:
+        started = provisioning_jobs.start(job_id, retry_failed=retry_failed)
+        job = provisioning_jobs.status(job_id)
+    except KeyError:
+        return jsonify({"success": False, "error": "Unknown job"}), 404
+    if not started:
+        return jsonify({"success": False, "error": "Job is already running", "job": job}), 409
+    log_event(f"Provisioning job {job_id} resumed", component="provisioning")
+    return jsonify({"success": True, "job": job}), 202
+
+
+@app.route("/api/provisioning/jobs/<job_id>/cancel", methods=["POST"])
+def api_cancel_provisioning_job(job_id: str):
+    try:
+        provisioning_jobs.cancel(job_id)
+        job = provisioning_jobs.status(job_id)
+    except KeyError:
+        return jsonify({"success": False, "error": "Unknown job"}), 404
+    log_event(f"Provisioning job {job_id} cancelled", component="provisioning")
+    return jsonify({"success": True, "job": job})
+
+
+# --------------------------------------------------------------------
+# Scheduled lock commands (cron-like, spread by a shared rate limit)
+# --------------------------------------------------------------------
+def run_scheduled_command(lock_id: int, action: str) -> dict:
+    trace = start_trace(uuid.uuid4().hex, f"schedule {action} {lock_id}")
+    status: int | str = "error"
+    try:
+        body, status = run_lock_command(lock_id, action, wait=True)
+    finally:
+        finish_trace(trace, status)
+    return body
+
+
+def known_lock_ids() -> list[int]:
+    return [int(lock["lockId"]) for lock in read_state().get("locks", []) if lock.get("lockId")]
+
+
+scheduler = Scheduler(SCHEDULES_DIR, run_scheduled_command, known_lock_ids, SCHEDULER_RATE)
+scheduler.start()
+
+
+@app.route("/api/schedules", methods=["POST"])
+def api_create_schedule():
+    """
+    Body: {"name": "Night", "cron": "0 22 * * *", "action": "lock",
+    "lockIds": [123, 456] or "all": true, "concurrency": 2, "enabled": true}
+    """
+    spec, errors = validate_schedule(request.get_json(silent=True))
+    if errors:
+        return jsonify({"success": False, "error": "Invalid schedule", "details": errors}), 400
+    schedule = scheduler.create(spec)
+    log_event(f"Schedule {schedule['id']} created ({spec['cron']} {spec['action']})", component="scheduler")
+    resp = jsonify({"success": True, "schedule": schedule})
+    resp.headers["Location"] = f"/api/schedules/{schedule['id']}"
+    return resp, 201
+
+
+@app.route("/api/schedules", methods=["GET"])
+def api_list_schedules():
+    return jsonify({"schedules": scheduler.list_schedules()})
+
+
+@app.route("/api/schedules/<schedule_id>", methods=["GET"])
+def api_schedule(schedule_id: str):
+    """Schedule with its next run time and the last ?runs= (default 10) run results."""
+    try:
+        runs = max(0, int(request.args.get("runs", 10)))
+        return jsonify({"success": True, "schedule": scheduler.status(schedule_id, runs=runs)})
+    except KeyError:
+        return jsonify({"success": False, "error": "Unknown schedule"}), 404
+    except ValueError:
+        return jsonify({"success": False, "error": "runs must be an integer"}), 400
+
+
+@app.route("/api/schedules/<schedule_id>", methods=["PATCH"])
+def api_update_schedule(schedule_id: str):
+    changes, errors = validate_schedule(request.get_json(silent=True), partial=True)
+    if errors:
+        return jsonify({"success": False, "error": "Invalid schedule", "details": errors}), 400
+    try:
+        schedule = scheduler.update(schedule_id, changes)
+    except KeyError:
+        return jsonify({"success": False, "error": "Unknown schedule"}), 404
+    log_event(f"Schedule {schedule_id} updated: {sorted(changes)}", component="scheduler")
+    return jsonify({"success": True, "schedule": schedule})
+
+
+@app.route("/api/schedules/<schedule_id>", methods=["DELETE"])
+def api_delete_schedule(schedule_id: str):
+    try:
+        scheduler.delete(schedule_id)
+    except KeyError:
+        return jsonify({"success": False, "error": "Unknown schedule"}), 404
+    log_event(f"Schedule {schedule_id} deleted", component="scheduler")
+    return jsonify({"success": True})
+
+
+@app.route("/api/schedules/<schedule_id>/run", methods=["POST"])
+def api_run_schedule(schedule_id: str):
+    """Run a schedule now, outside its cron times."""
+    try:
+        started = scheduler.run_now(schedule_id)
+        schedule = scheduler.status(schedule_id)
+    except KeyError:
+        return jsonify({"success": False, "error": "Unknown schedule"}), 404
+    if not started:
+        return jsonify({"success": False, "error": "Schedule is already running", "schedule": schedule}), 409
+    log_event(f"Schedule {schedule_id} run manually", component="scheduler")
+    return jsonify({"success": True, "schedule": schedule}), 202
+
+
+# --------------------------------------------------------------------
+# Admin: profiling sessions and the slow-request log
+# --------------------------------------------------------------------
+def admin_denied():
+    """Error response unless the request carries the ADMIN_TOKEN bearer token."""
+    if not ADMIN_TOKEN:
+        return jsonify({"success": False, "error": "Admin endpoints are disabled (set ADMIN_TOKEN)"}), 404
+    auth = request.headers.get("Authorization", "")
+    token = auth[7:] if auth.startswith("Bearer ") else ""
+    if not hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode()):
+        log_event(f"Rejected admin request to {request.path}", logging.WARNING, "admin")
+        return jsonify({"success": False, "error": "Unauthorized"}), 401
+    return None
+
+
+@app.route("/api/admin/profile", methods=["POST"])
+def api_start_profile():
+    """
+    Body: {"mode": "cprofile"|"sampling", "route": "/api/locks", "requests": 100,
+    "seconds": 60, "interval_ms": 5}. Profiles the next matching requests until
+    either limit is reached; replaces any running session.
+    """
+    denied = admin_denied()
+    if denied:
+        return denied
+    body = request.get_json(silent=True) or {}
+    try:
+        session = profiler.start(
+            mode=str(body.get("mode", "sampling")),
+            route=str(body.get("route", "")),
+            requests=int(body["requests"]) if body.get("requests") else None,
+            seconds=float(body["seconds"]) if body.get("seconds") else None,
+            interval_ms=float(body.get("interval_ms", 5)),
+        )
+    except (TypeError, ValueError) as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    log_event(f"Profiling started: {session}", component="admin")
+    return jsonify({"success": True, "session": session}), 201
+
+
+@app.route("/api/admin/profile", methods=["GET"])
+def api_profile_report():
+    """
+    Session status, or with ?format=pstats (cProfile, ?sort=&limit=) or
+    ?format=collapsed (sampling; one "stack count" line each) the report as text.
+    """
+    denied = admin_denied()
+    if denied:
+        return denied
+    fmt = request.args.get("format", "")
+    if fmt not in ("", "pstats", "collapsed"):
+        return jsonify({"success": False, "error": "format must be pstats or collapsed"}), 400
+    session = profiler.status()
+    if session is None:
+        return jsonify({"success": False, "error": "No profiling session"}), 404
+    if not fmt:
+        return jsonify({"success": True, "session": session})
+    try:
+        limit = int(request.args.get("limit", 50))
+        report = profiler.report(fmt, limit=limit, sort=request.args.get("sort", "cumulative"))
+    except (KeyError, ValueError) as e:
+        return jsonify({"success": False, "error": f"Bad report options: {e}"}), 400
+    return Response(report or "", mimetype="text/plain")
+
+
+@app.route("/api/admin/profile", methods=["DELETE"])
+def api_stop_profile():
+    denied = admin_denied()
+    if denied:
+        return denied
+    session = profiler.stop()
+    if session is None:
+        return jsonify({"success": False, "error": "No profiling session"}), 404
+    return jsonify({"success": True, "session": session})
+
+
+@app.route("/api/admin/slow-requests", methods=["GET", "POST"])
+def api_slow_requests():
+    """GET the captured stacks; POST {"threshold_ms": 500} to change the threshold (0 = off)."""
+    denied = admin_denied()
+    if denied:
+        return denied
+    if request.method == "POST":
+        body = request.get_json(silent=True) or {}
+        try:
+            slow_requests.configure(float(body.get("threshold_ms", 0)))
+        except (TypeError, ValueError):
+            return jsonify({"success": False, "error": "threshold_ms must be a number"}), 400
+        log_event(f"Slow-request threshold set to {slow_requests.threshold_ms} ms", component="admin")
+    return jsonify({
+        "success": True,
+        "threshold_ms": slow_requests.threshold_ms,
+        "requests": slow_requests.entries(),
+    })
+
+
+# --------------------------------------------------------------------
+# Health checks (no cloud call on the request path)
+# --------------------------------------------------------------------
+_probe: dict = {"ok": None, "checked_at": None, "latency_ms": None, "error": ""}
+_probe_lock = threading.Lock()
+
+
+def probe_upstream() -> None:
+    """One cheap authenticated call (a single-lock page) to see if the cloud answers."""
+    cfg = read_state()
+    if not cfg.get("access_token") or not cfg.get("client_id"):
+        result = {"ok": None, "error": "no access token / client_id configured"}
+    else:
+        start = time.monotonic()
+        try:
+            call_upstream(list_locks, page_size=1)
+            result = {"ok": True, "error": ""}
+        except Exception as e:
+            result = {"ok": False, "error": str(e)}
+        result["latency_ms"] = round((time.monotonic() - start) * 1000, 1)
+    result["checked_at"] = time.time()
+    with _probe_lock:
+        _probe.update(result)
+    if result["ok"] is False:
+        log_event(f"Upstream probe failed: {result['error']}", logging.WARNING, "health")
+
+
+def _probe_loop() -> None:
+    while True:
+        probe_upstream()
+        time.sleep(HEALTH_PROBE_INTERVAL)
+
+
+@app.route("/healthz", methods=["GET"])
+def healthz():
+    """Liveness: the process is up and serving requests."""
+    return jsonify({"status": "ok"})
+
+
+@app.route("/readyz", methods=["GET"])
+def readyz():
+    """
+    Readiness from cached state: token present and unexpired, and the last
+    background probe of the cloud succeeded recently.
+    """
+    cfg = read_state()
+    now = time.time()
+    with _probe_lock:
+        probe = dict(_probe)
+
+    expires_at = float(cfg.get("token_expires_at") or 0)
+    token_ok = bool(cfg.get("access_token")) and (not expires_at or expires_at > now)
+    refreshed_at = float(cfg.get("locks_refreshed_at") or 0)
+    checks = {
+        "token": {
+            "ok": token_ok,
+            "expires_in": round(expires_at - now) if expires_at else None,
+        },
+        "snapshot": {
+            "locks": len(cfg.get("locks", [])),
+            "version": int(cfg.get("locks_version", 0)),
+            "age_seconds": round(now - refreshed_at) if refreshed_at else None,
+        },
+        "upstream": dict(
+            probe,
+            age_seconds=round(now - probe["checked_at"]) if probe["checked_at"] else None,
+        ),
+        # Informational: shedding load is the helper working as intended
+        "admission": upstream_admission.snapshot(),
+        "blocking_requests": blocking_requests.snapshot(),
+    }
+    upstream_ok = probe["ok"] is True
+    if HEALTH_PROBE_INTERVAL > 0 and probe["checked_at"]:
+        # A probe thread that stopped reporting is as bad as a failed probe
+        upstream_ok = upstream_ok and now - probe["checked_at"] < 3 * HEALTH_PROBE_INTERVAL
+    ready = token_ok and (upstream_ok or HEALTH_PROBE_INTERVAL <= 0)
+    return jsonify({"status": "ready" if ready else "not_ready", "checks": checks}), (
+        200 if ready else 503
+    )
+
+
+if HEALTH_PROBE_INTERVAL > 0:
+    threading.Thread(target=_probe_loop, name="ttlock-health-probe", daemon=True).start()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,293 @@
+"""
+On-demand profiling of live requests.
+
+A profiling session targets one route (a path prefix or a Flask rule such as
+/api/locks/<int:lock_id>/<action>) for the next N requests and/or T seconds:
+
+- "cprofile": deterministic cProfile of matching requests, merged into one
+  pstats report. One request is profiled at a time; matching requests that
+  overlap it are skipped. On Python 3.12+ the profile covers every thread
+  while it is enabled, not only the profiled request.
+- "sampling": a background thread samples the stacks of threads serving
+  matching requests every few milliseconds and counts collapsed stacks
+  (flamegraph.pl / speedscope input). Much lower overhead than cProfile.
+
+SlowRequestLog independently captures the stack of any request still running
+after a threshold, which shows where slow requests actually wait.
+"""
+import cProfile
+import io
+import logging
+import os
+import pstats
+import sys
+import threading
+import time
+import traceback
+from collections import Counter, deque
+
+MODES = ("cprofile", "sampling")
+DEFAULT_INTERVAL_MS = 5
+MIN_INTERVAL_MS = 1
+MAX_SECONDS = 600
+MAX_REQUESTS = 10_000
+MAX_STACK_DEPTH = 64
+SLOW_LOG_SIZE = 100
+
+_LOGGER = logging.getLogger("ttlock_helper.profiling")
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def collapse_stack(frame) -> str:
+    """Root-first 'a;b;c' stack of ``frame``, as used by flamegraph tools."""
+    labels = []
+    while frame is not None and len(labels) < MAX_STACK_DEPTH:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    return ";".join(reversed(labels))
+
+
+class ProfileSession:
+    def __init__(self, mode: str, route: str, requests: int | None, seconds: float | None,
+                 interval_ms: float) -> None:
+        self.mode = mode
+        self.route = route
+        self.requests_left = requests
+        self.deadline = time.monotonic() + seconds if seconds else None
+        self.interval = max(MIN_INTERVAL_MS, interval_ms) / 1000
+        self.started = time.time()
+        self.finished: float | None = None
+        self.profiled = 0
+        self.samples: Counter = Counter()
+        self.stats: pstats.Stats | None = None
+        self.stop = threading.Event()
+
+    def accepts(self, path: str, rule: str) -> bool:
+        if self.stop.is_set():
+            return False
+        if self.deadline is not None and time.monotonic() >= self.deadline:
+            return False
+        if self.requests_left is not None and self.requests_left <= 0:
+            return False
+        return path.startswith(self.route) or rule == self.route
+
+    @property
+    def done(self) -> bool:
+        expired = self.deadline is not None and time.monotonic() >= self.deadline
+        exhausted = self.requests_left is not None and self.requests_left <= 0
+        return self.stop.is_set() or expired or exhausted
+
+    def summary(self) -> dict:
+        return {
+            "mode": self.mode,
+            "route": self.route,
+            "started": self.started,
+            "finished": self.finished,
+            "active": self.finished is None,
+            "profiled_requests": self.profiled,
+            "requests_left": self.requests_left,
+            "samples": sum(self.samples.values()),
+        }
+
+
+class RequestProfiler:
+    """Holds the current (or last) profiling session; hooks are called per request."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._session: ProfileSession | None = None
+        # thread ident -> (session, cProfile.Profile or None) for requests being profiled
+        self._active: dict[int, tuple[ProfileSession, cProfile.Profile | None]] = {}
+
+    def start(self, mode: str, route: str, requests: int | None = None,
+              seconds: float | None = None, interval_ms: float = DEFAULT_INTERVAL_MS) -> dict:
+        if mode not in MODES:
+            raise ValueError(f"mode must be one of {', '.join(MODES)}")
+        if not route.startswith("/"):
+            raise ValueError("route must start with /")
+        if not requests and not seconds:
+            raise ValueError("give requests and/or seconds")
+        requests = min(int(requests), MAX_REQUESTS) if requests else None
+        seconds = min(float(seconds), MAX_SECONDS) if seconds else None
+
+        session = ProfileSession(mode, route, requests, seconds, interval_ms)
+        with self._lock:
+            if self._session is not None:
+                self._session.stop.set()
+            self._session = session
+        if mode == "sampling":
+            threading.Thread(target=self._sample_loop, args=(session,),
+                             name="ttlock-profiler", daemon=True).start()
+        _LOGGER.info("Profiling %s with %s (requests=%s, seconds=%s)", route, mode, requests, seconds)
+        return session.summary()
+
+    def stop(self) -> dict | None:
+        with self._lock:
+            session = self._session
+        if session is None:
+            return None
+        session.stop.set()
+        self._maybe_finish(session)
+        return session.summary()
+
+    def status(self) -> dict | None:
+        with self._lock:
+            session = self._session
+        if session is not None:
+            self._maybe_finish(session)
+        return session.summary() if session is not None else None
+
+    # ---- request hooks -------------------------------------------------
+    def request_started(self, path: str, rule: str) -> None:
+        session = self._session
+        if session is None or session.finished is not None:
+            return
+        with self._lock:
+            if not session.accepts(path, rule):
+                return
+            if session.mode == "cprofile" and any(p is not None for _, p in self._active.values()):
+                # Only one cProfile can be enabled at a time (on 3.12+ it hooks
+                # sys.monitoring for the whole interpreter), so overlapping
+                # requests are skipped and left for later ones to cover
+                return
+            if session.requests_left is not None:
+                session.requests_left -= 1
+            session.profiled += 1
+            profile = cProfile.Profile() if session.mode == "cprofile" else None
+            self._active[threading.get_ident()] = (session, profile)
+        if profile is not None:
+            try:
+                profile.enable()
+            except ValueError:
+                # Some other tool (a debugger, coverage) holds the profiler hook
+                with self._lock:
+                    self._active.pop(threading.get_ident(), None)
+                    if session.requests_left is not None:
+                        session.requests_left += 1
+                    session.profiled -= 1
+
+    def request_finished(self) -> None:
+        with self._lock:
+            entry = self._active.pop(threading.get_ident(), None)
+        if entry is None:
+            return
+        session, profile = entry
+        if profile is not None:
+            profile.disable()
+            with self._lock:
+                if session.stats is None:
+                    session.stats = pstats.Stats(profile)
+                else:
+                    session.stats.add(profile)
+        self._maybe_finish(session)
+
+    def _maybe_finish(self, session: ProfileSession) -> None:
+        with self._lock:
+            in_flight = any(s is session for s, _ in self._active.values())
+            if session.finished is None and session.done and not in_flight:
+                session.finished = time.time()
+                _LOGGER.info("Profiling of %s finished (%d requests)", session.route, session.profiled)
+
+    def _sample_loop(self, session: ProfileSession) -> None:
+        while not session.stop.is_set():
+            with self._lock:
+                idents = [ident for ident, (s, _) in self._active.items() if s is session]
+            if idents:
+                frames = sys._current_frames()
+                for ident in idents:
+                    frame = frames.get(ident)
+                    if frame is not None:
+                        session.samples[collapse_stack(frame)] += 1
+            elif session.done:
+                break
+            time.sleep(session.interval)
+        self._maybe_finish(session)
+
+    # ---- reports -------------------------------------------------------
+    def report(self, fmt: str = "pstats", limit: int = 50, sort: str = "cumulative") -> str | None:
+        with self._lock:
+            session = self._session
+            if session is None:
+                return None
+            if fmt == "collapsed":
+                return "\n".join(f"{stack} {count}" for stack, count in session.samples.most_common())
+            if session.stats is None:
+                return ""
+            out = io.StringIO()
+            stats = pstats.Stats(stream=out)
+            stats.add(session.stats)
+            stats.sort_stats(sort).print_stats(limit)
+            return out.getvalue()
+
+
+class SlowRequestLog:
+    """Captures the stack of requests still running after ``threshold_ms``."""
+
+    def __init__(self, threshold_ms: float = 0) -> None:
+        self.threshold_ms = threshold_ms
+        self._lock = threading.Lock()
+        # thread ident -> [start, method, path, request id, captured]
+        self._inflight: dict[int, list] = {}
+        self._entries: deque = deque(maxlen=SLOW_LOG_SIZE)
+        self._thread: threading.Thread | None = None
+
+    def configure(self, threshold_ms: float) -> None:
+        self.threshold_ms = max(0.0, threshold_ms)
+        if self.threshold_ms and (self._thread is None or not self._thread.is_alive()):
+            self._thread = threading.Thread(target=self._watch, name="ttlock-slowlog", daemon=True)
+            self._thread.start()
+
+    def request_started(self, method: str, path: str, request_id: str) -> None:
+        if not self.threshold_ms:
+            return
+        with self._lock:
+            self._inflight[threading.get_ident()] = [time.monotonic(), method, path, request_id, False]
+
+    def request_finished(self) -> None:
+        if not self._inflight:
+            return
+        with self._lock:
+            entry = self._inflight.pop(threading.get_ident(), None)
+        if entry is not None and entry[4]:
+            # Fill in the total for the entry captured while it was running
+            total = round((time.monotonic() - entry[0]) * 1000, 1)
+            for logged in reversed(self._entries):
+                if logged["request_id"] == entry[3] and logged["path"] == entry[2]:
+                    logged["total_ms"] = total
+                    break
+
+    def _watch(self) -> None:
+        while self.threshold_ms:
+            time.sleep(min(0.1, self.threshold_ms / 4000))
+            now = time.monotonic()
+            with self._lock:
+                overdue = [
+                    (ident, entry)
+                    for ident, entry in self._inflight.items()
+                    if not entry[4] and (now - entry[0]) * 1000 >= self.threshold_ms
+                ]
+                for _, entry in overdue:
+                    entry[4] = True
+            if not overdue:
+                continue
+            frames = sys._current_frames()
+            for ident, (start, method, path, request_id, _) in overdue:
+                frame = frames.get(ident)
+                self._entries.append({
+                    "time": time.time(),
+                    "method": method,
+                    "path": path,
+                    "request_id": request_id,
+                    "elapsed_ms": round((now - start) * 1000, 1),
+                    "total_ms": None,
+                    "stack": traceback.format_stack(frame) if frame is not None else [],
+                })
+                _LOGGER.warning("Slow request %s %s (%s) still running after %.0f ms",
+                                method, path, request_id, self.threshold_ms)
+
+    def entries(self) -> list[dict]:
+        return list(reversed(self._entries))
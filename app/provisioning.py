@@ -0,0 +1,344 @@
+"""
+Bulk keyboard passcode / eKey provisioning.
+
+A job is a list of (lock, passcode or eKey, validity window) items. Items run
+on a bounded thread pool behind a rate limiter, and each finished item is
+appended to the job's results file, so an interrupted job resumes with only
+the items that have no result yet.
+"""
+import json
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable
+
+from ttlock_api import TTLockError, add_passcode, send_ekey
+
+ITEM_TYPES = ("passcode", "ekey")
+DEFAULT_CONCURRENCY = 4
+MAX_CONCURRENCY = 16
+DEFAULT_RATE = 5.0  # upstream calls per second, per job
+MAX_ITEMS = 10_000
+
+_JOB_ID_RE = re.compile(r"^[0-9a-f]{32}$")
+_LOGGER = logging.getLogger("ttlock_helper.provisioning")
+
+
+class RateLimiter:
+    """Token bucket; acquire() blocks until the next call is allowed."""
+
+    def __init__(self, rate: float, burst: int = 1) -> None:
+        self.rate = rate
+        self.capacity = max(1, burst)
+        self._tokens = float(self.capacity)
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+def validate_items(items) -> tuple[list[dict], list[str]]:
+    """Normalise raw job items; returns (items, errors)."""
+    if not isinstance(items, list) or not items:
+        return [], ["items must be a non-empty list"]
+    if len(items) > MAX_ITEMS:
+        return [], [f"at most {MAX_ITEMS} items per job"]
+
+    normalized: list[dict] = []
+    errors: list[str] = []
+    for index, raw in enumerate(items):
+        if not isinstance(raw, dict):
+            errors.append(f"item {index}: must be an object")
+            continue
+        try:
+            lock_id = int(raw.get("lockId"))
+            start_ms = int(raw.get("startDate"))
+            end_ms = int(raw.get("endDate"))
+        except (TypeError, ValueError):
+            errors.append(f"item {index}: lockId, startDate and endDate must be integers")
+            continue
+        if end_ms <= start_ms:
+            errors.append(f"item {index}: endDate must be after startDate")
+            continue
+
+        item_type = str(raw.get("type", "passcode")).lower()
+        item = {
+            "index": index,
+            "lockId": lock_id,
+            "type": item_type,
+            "name": str(raw.get("name") or "Guest"),
+            "startDate": start_ms,
+            "endDate": end_ms,
+        }
+        if item_type == "passcode":
+            passcode = str(raw.get("passcode", ""))
+            if not (passcode.isdigit() and 4 <= len(passcode) <= 9):
+                errors.append(f"item {index}: passcode must be 4-9 digits")
+                continue
+            item["passcode"] = passcode
+        elif item_type == "ekey":
+            receiver = str(raw.get("receiverUsername", "")).strip()
+            if not receiver:
+                errors.append(f"item {index}: receiverUsername is required for eKeys")
+                continue
+            item["receiverUsername"] = receiver
+        else:
+            errors.append(f"item {index}: type must be one of {', '.join(ITEM_TYPES)}")
+            continue
+        normalized.append(item)
+
+    return normalized, errors
+
+
+class ProvisioningManager:
+    """Runs provisioning jobs and checkpoints them under ``directory``."""
+
+    def __init__(self, directory: Path, get_credentials: Callable[[], dict],
+                 call_upstream: Callable[..., dict]) -> None:
+        """
+        ``get_credentials`` returns the current (read-only) state and
+        ``call_upstream(fn, **kwargs)`` calls a ttlock_api function with the
+        stored credentials, refreshing a rejected token.
+        """
+        self.directory = directory
+        self._get_credentials = get_credentials
+        self._call_upstream = call_upstream
+        self._lock = threading.Lock()
+        self._running: dict[str, threading.Event] = {}
+
+    # ---- storage -------------------------------------------------------
+    def _spec_path(self, job_id: str) -> Path:
+        if not _JOB_ID_RE.match(job_id):
+            raise KeyError(job_id)
+        return self.directory / f"{job_id}.json"
+
+    def _results_path(self, job_id: str) -> Path:
+        return self._spec_path(job_id).with_suffix(".results.jsonl")
+
+    def _read_spec(self, job_id: str) -> dict:
+        path = self._spec_path(job_id)
+        if not path.exists():
+            raise KeyError(job_id)
+        with path.open("r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _write_spec(self, spec: dict) -> None:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self._spec_path(spec["id"])
+        tmp = path.with_suffix(".tmp")
+        with tmp.open("w", encoding="utf-8") as f:
+            json.dump(spec, f)
+        os.replace(tmp, path)
+
+    def _read_results(self, job_id: str) -> dict[int, dict]:
+        """Latest result per item index (later lines win, e.g. after a retry)."""
+        path = self._results_path(job_id)
+        results: dict[int, dict] = {}
+        if not path.exists():
+            return results
+        with path.open("r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    result = json.loads(line)
+                except ValueError:
+                    # Torn final line from a crash mid-write; that item re-runs
+                    continue
+                results[result["index"]] = result
+        return results
+
+    def _append_result(self, job_id: str, result: dict) -> None:
+        with self._lock:
+            with self._results_path(job_id).open("a", encoding="utf-8") as f:
+                f.write(json.dumps(result) + "\n")
+                f.flush()
+
+    # ---- jobs ----------------------------------------------------------
+    def create_job(self, items: list[dict], concurrency: int, rate: float) -> dict:
+        spec = {
+            "id": uuid.uuid4().hex,
+            "created": time.time(),
+            "finished": None,
+            "cancelled": False,
+            "concurrency": max(1, min(MAX_CONCURRENCY, int(concurrency))),
+            "rate": max(0.1, float(rate)),
+            "items": items,
+        }
+        self._write_spec(spec)
+        _LOGGER.info("Created provisioning job %s with %d items", spec["id"], len(items))
+        self.start(spec["id"])
+        return self.status(spec["id"])
+
+    def start(self, job_id: str, retry_failed: bool = False) -> bool:
+        """Start (or resume) a job; returns False if it is already running."""
+        spec = self._read_spec(job_id)
+        with self._lock:
+            if job_id in self._running:
+                return False
+            cancel = self._running[job_id] = threading.Event()
+        if spec.get("cancelled") or spec.get("finished"):
+            spec["cancelled"] = False
+            spec["finished"] = None
+            self._write_spec(spec)
+        threading.Thread(
+            target=self._run,
+            args=(spec, cancel, retry_failed),
+            name=f"provision-{job_id[:8]}",
+            daemon=True,
+        ).start()
+        return True
+
+    def cancel(self, job_id: str) -> None:
+        spec = self._read_spec(job_id)
+        spec["cancelled"] = True
+        self._write_spec(spec)
+        with self._lock:
+            cancel = self._running.get(job_id)
+        if cancel is not None:
+            cancel.set()
+
+    def resume_incomplete(self) -> list[str]:
+        """Restart jobs left unfinished by a previous process."""
+        resumed = []
+        if not self.directory.exists():
+            return resumed
+        for path in self.directory.glob("*.json"):
+            try:
+                spec = self._read_spec(path.stem)
+            except (KeyError, ValueError):
+                continue
+            if spec.get("finished") or spec.get("cancelled"):
+                continue
+            if self.start(spec["id"]):
+                resumed.append(spec["id"])
+        if resumed:
+            _LOGGER.info("Resumed %d interrupted provisioning job(s)", len(resumed))
+        return resumed
+
+    def _run(self, spec: dict, cancel: threading.Event, retry_failed: bool) -> None:
+        job_id = spec["id"]
+        done = self._read_results(job_id)
+        remaining = [
+            item
+            for item in spec["items"]
+            if item["index"] not in done
+            or (retry_failed and done[item["index"]]["status"] != "ok")
+        ]
+        _LOGGER.info("Provisioning job %s: %d item(s) to run", job_id, len(remaining))
+        limiter = RateLimiter(spec["rate"], burst=spec["concurrency"])
+
+        try:
+            with ThreadPoolExecutor(
+                max_workers=spec["concurrency"], thread_name_prefix=f"provision-{job_id[:8]}"
+            ) as pool:
+                for item in remaining:
+                    pool.submit(self._run_item, job_id, item, limiter, cancel)
+        finally:
+            with self._lock:
+                self._running.pop(job_id, None)
+            if not cancel.is_set():
+                spec = self._read_spec(job_id)
+                spec["finished"] = time.time()
+                self._write_spec(spec)
+                _LOGGER.info("Provisioning job %s finished", job_id)
+
+    def _run_item(self, job_id: str, item: dict, limiter: RateLimiter,
+                  cancel: threading.Event) -> None:
+        if cancel.is_set():
+            return
+        limiter.acquire()
+        if cancel.is_set():
+            return
+
+        result = {"index": item["index"], "lockId": item["lockId"], "type": item["type"]}
+        try:
+            creds = self._get_credentials()
+            if not creds.get("access_token") or not creds.get("client_id"):
+                raise TTLockError("No access token / client_id configured")
+            common = {
+                "lock_id": item["lockId"],
+                "start_ms": item["startDate"],
+                "end_ms": item["endDate"],
+            }
+            if item["type"] == "passcode":
+                body = self._call_upstream(
+                    add_passcode, passcode=item["passcode"], name=item["name"], **common
+                )
+            else:
+                body = self._call_upstream(
+                    send_ekey, receiver_username=item["receiverUsername"], key_name=item["name"], **common
+                )
+            result.update(status="ok", response=body)
+        except Exception as e:
+            result.update(status="failed", error=str(e))
+            _LOGGER.warning(
+                "Provisioning job %s item %d (lock %s) failed: %s",
+                job_id, item["index"], item["lockId"], e,
+            )
+        result["finished"] = time.time()
+        self._append_result(job_id, result)
+
+    # ---- reporting -----------------------------------------------------
+    def status(self, job_id: str, include_results: bool = False,
+               result_status: str = "") -> dict:
+        spec = self._read_spec(job_id)
+        results = self._read_results(job_id)
+        with self._lock:
+            running = job_id in self._running
+
+        ok = sum(1 for r in results.values() if r["status"] == "ok")
+        failed = len(results) - ok
+        total = len(spec["items"])
+        if running:
+            state = "running"
+        elif spec.get("cancelled"):
+            state = "cancelled"
+        elif spec.get("finished"):
+            state = "completed"
+        else:
+            state = "interrupted"
+
+        summary = {
+            "id": job_id,
+            "state": state,
+            "created": spec["created"],
+            "finished": spec.get("finished"),
+            "concurrency": spec["concurrency"],
+            "rate": spec["rate"],
+            "total": total,
+            "ok": ok,
+            "failed": failed,
+            "pending": total - len(results),
+        }
+        if include_results:
+            summary["results"] = [
+                results[i]
+                for i in sorted(results)
+                if not result_status or results[i]["status"] == result_status
+            ]
+        return summary
+
+    def list_jobs(self) -> list[dict]:
+        if not self.directory.exists():
+            return []
+        jobs = []
+        for path in self.directory.glob("*.json"):
+            try:
+                jobs.append(self.status(path.stem))
+            except (KeyError, ValueError):
+                continue
+        return sorted(jobs, key=lambda job: job["created"], reverse=True)
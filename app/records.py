@@ -0,0 +1,209 @@
+"""
+Journal of TTLock lock records (who opened what, when).
+
+Records from callbacks or cloud pulls get a monotonically increasing ``seq``
+so clients can fetch only what is new since their cursor. The journal is an
+append-only JSON-lines file; the newest ``size`` records are kept in memory.
+Each lock's newest record time and last few recordIds are kept apart from
+that window (and saved next to the journal), so a quiet lock in a busy fleet
+neither loses its sync cursor nor gets its records journaled twice.
+Passcodes are never journaled: keyboardPwd is replaced with a marker.
+"""
+import json
+import os
+import threading
+from collections import deque
+from pathlib import Path
+
+# recordType values from the TTLock lock-record docs that imply a final state
+LOCK_RECORD_TYPES = {11, 33, 34, 35, 36, 45, 47}
+UNLOCK_RECORD_TYPES = {1, 4, 7, 8, 9, 10, 12, 46, 49, 55, 57, 61}
+
+DEFAULT_JOURNAL_SIZE = 5000
+CURSOR_IDS_KEPT = 20  # recordIds remembered per lock for deduplication
+PASSCODE_MARKER = "**REDACTED**"
+
+
+def record_type(record: dict) -> int | None:
+    try:
+        return int(record.get("recordType"))
+    except (TypeError, ValueError):
+        return None
+
+
+def record_action(record: dict) -> str:
+    """'lock', 'unlock' or 'other' for a TTLock record."""
+    kind = record_type(record)
+    if kind in LOCK_RECORD_TYPES:
+        return "lock"
+    if kind in UNLOCK_RECORD_TYPES:
+        return "unlock"
+    return "other"
+
+
+def record_time(record: dict) -> int:
+    try:
+        return int(record.get("lockDate") or record.get("serverDate") or 0)
+    except (TypeError, ValueError):
+        return 0
+
+
+def redact_record(record: dict) -> dict:
+    """Copy of ``record`` that still shows a passcode was used, but not which."""
+    entry = dict(record)
+    if entry.get("keyboardPwd"):
+        entry["keyboardPwd"] = PASSCODE_MARKER
+    return entry
+
+
+class RecordJournal:
+    def __init__(self, path: Path, size: int = DEFAULT_JOURNAL_SIZE) -> None:
+        self.path = path
+        self.cursor_path = path.with_suffix(".cursors.json")
+        self.size = size
+        self._records: deque = deque(maxlen=size)
+        self._keys: set = set()
+        # str(lock id) -> {"time": newest record time, "ids": [recent recordIds]}
+        self._cursors: dict[str, dict] = {}
+        self._seq = 0
+        self._lines = 0
+        self._lock = threading.Lock()
+        self._load()
+
+    @staticmethod
+    def _key(lock_id, record: dict) -> tuple:
+        if record.get("recordId") is not None:
+            return (str(lock_id), "id", str(record["recordId"]))
+        return (
+            str(lock_id),
+            record_time(record),
+            record_type(record),
+            record.get("username") or ("passcode" if record.get("keyboardPwd") else ""),
+        )
+
+    def _load(self) -> None:
+        if self.cursor_path.exists():
+            try:
+                with self.cursor_path.open("r", encoding="utf-8") as f:
+                    self._cursors = json.load(f)
+            except ValueError:
+                self._cursors = {}
+        if not self.path.exists():
+            return
+        unredacted = False
+        with self.path.open("r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                if entry.get("keyboardPwd") and entry["keyboardPwd"] != PASSCODE_MARKER:
+                    entry = redact_record(entry)
+                    unredacted = True
+                self._lines += 1
+                self._remember(entry)
+                self._advance(entry["lockId"], entry)
+                self._seq = max(self._seq, int(entry.get("seq", 0)))
+        if unredacted:
+            # Written before passcodes were redacted; rewrite without them
+            self._compact()
+
+    def _remember(self, entry: dict) -> None:
+        if len(self._records) == self._records.maxlen:
+            oldest = self._records[0]
+            self._keys.discard(self._key(oldest["lockId"], oldest))
+        self._records.append(entry)
+        self._keys.add(self._key(entry["lockId"], entry))
+
+    def _advance(self, lock_id, record: dict) -> None:
+        cursor = self._cursors.setdefault(str(lock_id), {"time": 0, "ids": []})
+        cursor["time"] = max(cursor["time"], record_time(record))
+        if record.get("recordId") is not None:
+            record_id = str(record["recordId"])
+            if record_id not in cursor["ids"]:
+                cursor["ids"].append(record_id)
+                del cursor["ids"][:-CURSOR_IDS_KEPT]
+
+    def _seen(self, lock_id, record: dict) -> bool:
+        if record.get("recordId") is not None:
+            cursor = self._cursors.get(str(lock_id))
+            if cursor is not None and str(record["recordId"]) in cursor["ids"]:
+                return True
+        return self._key(lock_id, record) in self._keys
+
+    def append(self, lock_id, records: list[dict]) -> list[dict]:
+        """Journal new records (oldest first, duplicates skipped); returns them."""
+        added = []
+        with self._lock:
+            for record in sorted(records, key=record_time):
+                if self._seen(lock_id, record):
+                    continue
+                self._seq += 1
+                entry = redact_record(record)
+                entry["lockId"] = lock_id
+                entry["seq"] = self._seq
+                entry["action"] = record_action(record)
+                self._remember(entry)
+                self._advance(lock_id, entry)
+                added.append(entry)
+            if added:
+                self._write(added)
+                self._write_cursors()
+        return added
+
+    def _write(self, entries: list[dict]) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        if self._lines + len(entries) > 2 * self.size:
+            self._compact()
+            return
+        with self.path.open("a", encoding="utf-8") as f:
+            for entry in entries:
+                f.write(json.dumps(entry) + "\n")
+        self._lines += len(entries)
+
+    def _compact(self) -> None:
+        """Rewrite the journal with only what is still in memory."""
+        tmp = self.path.with_suffix(".tmp")
+        with tmp.open("w", encoding="utf-8") as f:
+            for entry in self._records:
+                f.write(json.dumps(entry) + "\n")
+        os.replace(tmp, self.path)
+        self._lines = len(self._records)
+
+    def _write_cursors(self) -> None:
+        tmp = self.cursor_path.with_suffix(".tmp")
+        with tmp.open("w", encoding="utf-8") as f:
+            json.dump(self._cursors, f)
+        os.replace(tmp, self.cursor_path)
+
+    @property
+    def latest_seq(self) -> int:
+        return self._seq
+
+    def since(self, after: int, limit: int) -> dict:
+        """Records with seq > after (oldest first), at most ``limit``."""
+        with self._lock:
+            records = list(self._records)
+            latest = self._seq
+        oldest = records[0]["seq"] if records else latest + 1
+        selected = [entry for entry in records if entry["seq"] > after][:limit]
+        return {
+            "records": selected,
+            "cursor": selected[-1]["seq"] if selected else max(after, 0),
+            "latest": latest,
+            # Records between the cursor and the oldest kept entry are gone
+            "truncated": after + 1 < oldest and after < latest,
+        }
+
+    def tail(self, limit: int) -> dict:
+        """The newest ``limit`` records, for a client without a cursor."""
+        with self._lock:
+            records = list(self._records)[-limit:] if limit > 0 else []
+            latest = self._seq
+        return {"records": records, "cursor": latest, "latest": latest, "truncated": False}
+
+    def last_time(self, lock_id) -> int:
+        """Newest record time journaled for a lock (0 if none)."""
+        with self._lock:
+            cursor = self._cursors.get(str(lock_id))
+            return cursor["time"] if cursor is not None else 0
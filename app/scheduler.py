@@ -0,0 +1,366 @@
+"""
+Timed and recurring lock commands ("lock all doors at 22:00").
+
+A schedule is a cron expression (minute hour day-of-month month day-of-week,
+local time), an action and the locks it applies to. Runs execute on a small
+thread pool behind a rate limiter shared by all schedules, so several
+routines firing in the same minute are spread out instead of hitting the
+cloud at once. Each finished run is appended to the schedule's runs file.
+"""
+import json
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Callable
+
+from provisioning import RateLimiter
+
+ACTIONS = ("lock", "unlock")
+DEFAULT_CONCURRENCY = 2  # commands of one run in flight at once
+MAX_CONCURRENCY = 8
+DEFAULT_RATE = 1.0  # commands per second across all schedules
+MAX_LOCKS = 500
+RUNS_KEPT = 50  # per schedule
+
+_ID_RE = re.compile(r"^[0-9a-f]{32}$")
+_LOGGER = logging.getLogger("ttlock_helper.scheduler")
+
+# (name, lowest, highest) of the five cron fields
+CRON_FIELDS = (
+    ("minute", 0, 59),
+    ("hour", 0, 23),
+    ("day of month", 1, 31),
+    ("month", 1, 12),
+    ("day of week", 0, 6),  # 0 = Sunday; 7 is accepted as Sunday too
+)
+
+
+def parse_cron(expr: str) -> list[set[int]]:
+    """Parse a 5-field cron expression (*, a-b, a,b, */n, a/n, a-b/n); raises ValueError."""
+    parts = str(expr).split()
+    if len(parts) != 5:
+        raise ValueError("cron needs 5 fields: minute hour day-of-month month day-of-week")
+
+    fields = []
+    for part, (name, low, high) in zip(parts, CRON_FIELDS):
+        top = 7 if name == "day of week" else high
+        values: set[int] = set()
+        for item in part.split(","):
+            rng, _, step = item.partition("/")
+            if rng == "*":
+                start, end = low, high
+            elif "-" in rng:
+                start, end = (int(v) for v in rng.split("-", 1))
+            else:
+                start = end = int(rng)
+                if step:  # "a/n" runs from a to the end of the field
+                    end = high
+            step_n = int(step) if step else 1
+            if not (low <= start <= end <= top) or step_n < 1:
+                raise ValueError(f"{name} out of range in '{item}'")
+            values.update(range(start, end + 1, step_n))
+        if name == "day of week" and 7 in values:
+            values.discard(7)
+            values.add(0)
+        fields.append(values)
+    return fields
+
+
+def _day_matches(fields: list[set[int]], raw: str, day: datetime) -> bool:
+    dom_any, dow_any = raw.split()[2] == "*", raw.split()[4] == "*"
+    dom_ok = day.day in fields[2]
+    dow_ok = (day.weekday() + 1) % 7 in fields[4]
+    if day.month not in fields[3]:
+        return False
+    if dom_any or dow_any:
+        return dom_ok and dow_ok
+    return dom_ok or dow_ok  # cron: both restricted means either may match
+
+
+def cron_matches(expr: str, moment: datetime) -> bool:
+    fields = parse_cron(expr)
+    return (
+        moment.minute in fields[0]
+        and moment.hour in fields[1]
+        and _day_matches(fields, expr, moment)
+    )
+
+
+def next_run(expr: str, after: datetime) -> datetime | None:
+    """First matching minute after ``after`` (searched a year ahead)."""
+    fields = parse_cron(expr)
+    start = after.replace(second=0, microsecond=0) + timedelta(minutes=1)
+    day = start.replace(hour=0, minute=0)
+    for _ in range(366):
+        if _day_matches(fields, expr, day):
+            for hour in sorted(fields[1]):
+                for minute in sorted(fields[0]):
+                    candidate = day.replace(hour=hour, minute=minute)
+                    if candidate >= start:
+                        return candidate
+        day += timedelta(days=1)
+    return None
+
+
+def validate_schedule(raw, partial: bool = False) -> tuple[dict, list[str]]:
+    """Normalise a schedule body; with partial=True only given fields are checked."""
+    if not isinstance(raw, dict):
+        return {}, ["body must be an object"]
+    spec: dict = {}
+    errors: list[str] = []
+
+    if "cron" in raw or not partial:
+        try:
+            parse_cron(raw.get("cron", ""))
+            spec["cron"] = " ".join(str(raw["cron"]).split())
+        except (ValueError, KeyError) as e:
+            errors.append(f"cron: {e}")
+    if "action" in raw or not partial:
+        action = str(raw.get("action", "")).lower()
+        if action in ACTIONS:
+            spec["action"] = action
+        else:
+            errors.append(f"action must be one of {', '.join(ACTIONS)}")
+    if "lockIds" in raw or "all" in raw or not partial:
+        if raw.get("all"):
+            spec["all"] = True
+            spec["lockIds"] = []
+        else:
+            lock_ids = raw.get("lockIds")
+            try:
+                if not isinstance(lock_ids, list) or not lock_ids:
+                    raise ValueError
+                spec["lockIds"] = sorted({int(lock_id) for lock_id in lock_ids})
+                spec["all"] = False
+            except (TypeError, ValueError):
+                errors.append("lockIds must be a non-empty list of lock ids (or set all: true)")
+            else:
+                if len(spec["lockIds"]) > MAX_LOCKS:
+                    errors.append(f"at most {MAX_LOCKS} locks per schedule")
+    if "name" in raw or not partial:
+        spec["name"] = str(raw.get("name") or "Schedule")
+    if "enabled" in raw or not partial:
+        enabled = raw.get("enabled", True)
+        if isinstance(enabled, bool):
+            spec["enabled"] = enabled
+        else:
+            errors.append("enabled must be true or false")
+    if "concurrency" in raw or not partial:
+        try:
+            spec["concurrency"] = max(1, min(MAX_CONCURRENCY, int(raw.get("concurrency", DEFAULT_CONCURRENCY))))
+        except (TypeError, ValueError):
+            errors.append("concurrency must be an integer")
+    return spec, errors
+
+
+class Scheduler:
+    """Stores schedules under ``directory`` and fires them from a minute ticker."""
+
+    def __init__(self, directory: Path, run_command: Callable[[int, str], dict],
+                 get_lock_ids: Callable[[], list[int]], rate: float = DEFAULT_RATE) -> None:
+        self.directory = directory
+        self._run_command = run_command
+        self._get_lock_ids = get_lock_ids
+        # Shared by every run: overlapping schedules queue up instead of bursting
+        self._limiter = RateLimiter(max(0.1, rate), burst=1)
+        self._lock = threading.Lock()
+        self._running: set[str] = set()
+        self._thread: threading.Thread | None = None
+
+    # ---- storage -------------------------------------------------------
+    def _spec_path(self, schedule_id: str) -> Path:
+        if not _ID_RE.match(schedule_id):
+            raise KeyError(schedule_id)
+        return self.directory / f"{schedule_id}.json"
+
+    def _runs_path(self, schedule_id: str) -> Path:
+        return self._spec_path(schedule_id).with_suffix(".runs.jsonl")
+
+    def _read_spec(self, schedule_id: str) -> dict:
+        path = self._spec_path(schedule_id)
+        if not path.exists():
+            raise KeyError(schedule_id)
+        with path.open("r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _write_spec(self, spec: dict) -> None:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self._spec_path(spec["id"])
+        tmp = path.with_suffix(".tmp")
+        with tmp.open("w", encoding="utf-8") as f:
+            json.dump(spec, f)
+        os.replace(tmp, path)
+
+    def _read_runs(self, schedule_id: str) -> list[dict]:
+        path = self._runs_path(schedule_id)
+        if not path.exists():
+            return []
+        runs = []
+        with path.open("r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    runs.append(json.loads(line))
+                except ValueError:
+                    continue
+        return runs
+
+    def _append_run(self, schedule_id: str, run: dict) -> None:
+        with self._lock:
+            if not self._spec_path(schedule_id).exists():
+                return  # deleted while the run was in flight
+            runs = self._read_runs(schedule_id)
+            path = self._runs_path(schedule_id)
+            if len(runs) >= 2 * RUNS_KEPT:
+                tmp = path.with_suffix(".tmp")
+                with tmp.open("w", encoding="utf-8") as f:
+                    for kept in runs[-(RUNS_KEPT - 1):] + [run]:
+                        f.write(json.dumps(kept) + "\n")
+                os.replace(tmp, path)
+                return
+            with path.open("a", encoding="utf-8") as f:
+                f.write(json.dumps(run) + "\n")
+
+    def _specs(self) -> list[dict]:
+        if not self.directory.exists():
+            return []
+        specs = []
+        for path in self.directory.glob("*.json"):
+            try:
+                specs.append(self._read_spec(path.stem))
+            except (KeyError, ValueError):
+                continue
+        return specs
+
+    # ---- schedules -----------------------------------------------------
+    def create(self, spec: dict) -> dict:
+        spec = dict(spec, id=uuid.uuid4().hex, created=time.time(), lastFired=None)
+        self._write_spec(spec)
+        _LOGGER.info("Created schedule %s (%s %s)", spec["id"], spec["cron"], spec["action"])
+        return self.status(spec["id"])
+
+    def update(self, schedule_id: str, changes: dict) -> dict:
+        with self._lock:
+            spec = self._read_spec(schedule_id)
+            spec.update(changes)
+            self._write_spec(spec)
+        return self.status(schedule_id)
+
+    def delete(self, schedule_id: str) -> None:
+        path = self._spec_path(schedule_id)
+        with self._lock:
+            if not path.exists():
+                raise KeyError(schedule_id)
+            path.unlink()
+            self._runs_path(schedule_id).unlink(missing_ok=True)
+
+    def status(self, schedule_id: str, runs: int = 0) -> dict:
+        spec = self._read_spec(schedule_id)
+        upcoming = next_run(spec["cron"], datetime.now()) if spec.get("enabled") else None
+        with self._lock:
+            running = schedule_id in self._running
+        summary = dict(spec, running=running, nextRun=upcoming.isoformat() if upcoming else None)
+        history = self._read_runs(schedule_id)
+        summary["lastRun"] = history[-1] if history else None
+        if runs:
+            summary["runs"] = history[-runs:][::-1]
+        return summary
+
+    def list_schedules(self) -> list[dict]:
+        return sorted(
+            (self.status(spec["id"]) for spec in self._specs()),
+            key=lambda schedule: schedule["created"],
+        )
+
+    # ---- execution -----------------------------------------------------
+    def start(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self._tick_loop, name="ttlock-scheduler", daemon=True)
+        self._thread.start()
+
+    def _tick_loop(self) -> None:
+        while True:
+            now = datetime.now()
+            try:
+                self._fire_due(now.replace(second=0, microsecond=0))
+            except Exception:
+                _LOGGER.exception("Scheduler tick failed")
+            time.sleep(60 - datetime.now().second + 0.5)
+
+    def _fire_due(self, minute: datetime) -> None:
+        stamp = minute.isoformat()
+        for spec in self._specs():
+            if not spec.get("enabled") or spec.get("lastFired") == stamp:
+                continue
+            try:
+                due = cron_matches(spec["cron"], minute)
+            except ValueError:
+                continue
+            if due:
+                # Persist first so a restart within the same minute doesn't refire
+                self.update(spec["id"], {"lastFired": stamp})
+                self.run_now(spec["id"], trigger="cron")
+
+    def run_now(self, schedule_id: str, trigger: str = "manual") -> bool:
+        """Start a run in the background; False if one is still going."""
+        spec = self._read_spec(schedule_id)
+        with self._lock:
+            if schedule_id in self._running:
+                _LOGGER.warning("Schedule %s still running; skipping this run", schedule_id)
+                return False
+            self._running.add(schedule_id)
+        threading.Thread(
+            target=self._run,
+            args=(spec, trigger),
+            name=f"schedule-{schedule_id[:8]}",
+            daemon=True,
+        ).start()
+        return True
+
+    def _run(self, spec: dict, trigger: str) -> None:
+        schedule_id = spec["id"]
+        run = {"id": uuid.uuid4().hex, "trigger": trigger, "started": time.time()}
+        try:
+            lock_ids = self._get_lock_ids() if spec.get("all") else spec["lockIds"]
+            _LOGGER.info(
+                "Schedule %s (%s): %s %d lock(s)", schedule_id, spec["name"], spec["action"], len(lock_ids)
+            )
+            with ThreadPoolExecutor(
+                max_workers=spec.get("concurrency", DEFAULT_CONCURRENCY),
+                thread_name_prefix=f"schedule-{schedule_id[:8]}",
+            ) as pool:
+                results = list(pool.map(lambda lock_id: self._run_item(spec["action"], lock_id), lock_ids))
+        except Exception as e:
+            _LOGGER.exception("Schedule %s run failed", schedule_id)
+            results = []
+            run["error"] = str(e)
+        finally:
+            with self._lock:
+                self._running.discard(schedule_id)
+
+        run["finished"] = time.time()
+        run["ok"] = sum(1 for r in results if r["status"] == "ok")
+        run["failed"] = len(results) - run["ok"]
+        run["results"] = results
+        self._append_run(schedule_id, run)
+
+    def _run_item(self, action: str, lock_id: int) -> dict:
+        self._limiter.acquire()
+        result = {"lockId": lock_id, "at": time.time()}
+        try:
+            body = self._run_command(lock_id, action)
+            if body.get("success"):
+                result["status"] = "ok"
+            else:
+                result.update(status="failed", error=body.get("error", ""))
+        except Exception as e:
+            result.update(status="failed", error=str(e))
+        if result["status"] != "ok":
+            _LOGGER.warning("Scheduled %s of lock %s failed: %s", action, lock_id, result["error"])
+        return result
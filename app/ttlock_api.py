@@ -1,9 +1,116 @@
+import logging
+import random
+import threading
 import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from concurrent.futures import TimeoutError as FutureTimeout
+
 import requests
+from urllib3.exceptions import NewConnectionError
+
+DEFAULT_TIMEOUT = 15  # seconds; also the ceiling for adaptive timeouts
+MIN_TIMEOUT = 3
+TIMEOUT_MULTIPLIER = 2  # timeout = p99 * multiplier, clamped
+MIN_SAMPLES = 20  # below this we fall back to DEFAULT_TIMEOUT / no hedging
+LATENCY_WINDOW = 200  # samples kept per endpoint
+MIN_HEDGE_DELAY = 0.2
+HEDGE_WORKERS = 8  # default; main sizes it from the upstream admission slots
+
+# Retries (see _post): capped exponential backoff with full jitter
+RETRY_DEADLINE = 20  # seconds for all attempts of one call
+MAX_ATTEMPTS = 4
+RETRY_BASE_DELAY = 0.5
+RETRY_MAX_DELAY = 4
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+# Rejected before the cloud acted on it, so even commands may be resent
+NOT_PROCESSED_STATUSES = {429, 503}
+TOKEN_STATUSES = {401}
+# TTLock errcodes: 10003 invalid/expired token, 90000 internal error, -3003 gateway busy
+TOKEN_ERRCODES = {10003}
+RETRYABLE_ERRCODES = {90000, -3003}
+NOT_PROCESSED_ERRCODES = {-3003}
+
+_LOGGER = logging.getLogger("ttlock_helper.upstream")
 
 
 class TTLockError(Exception):
-    pass
+    """
+    kind is "token" when the access token was rejected and must be refreshed
+    before retrying; otherwise "fatal" (any retries are already exhausted).
+    """
+
+    def __init__(self, message: str = "", kind: str = "fatal",
+                 status: int | None = None, errcode: int | None = None) -> None:
+        super().__init__(message)
+        self.kind = kind
+        self.status = status
+        self.errcode = errcode
+
+
+class LatencyStats:
+    """Rolling latency window per TTLock endpoint used to size timeouts."""
+
+    def __init__(self, window: int = LATENCY_WINDOW) -> None:
+        self._window = window
+        self._samples: dict[str, deque] = {}
+        self._lock = threading.Lock()
+
+    def record(self, endpoint: str, seconds: float) -> None:
+        with self._lock:
+            samples = self._samples.get(endpoint)
+            if samples is None:
+                samples = self._samples[endpoint] = deque(maxlen=self._window)
+            samples.append(seconds)
+
+    def percentile(self, endpoint: str, pct: float) -> float | None:
+        with self._lock:
+            samples = sorted(self._samples.get(endpoint, ()))
+        if len(samples) < MIN_SAMPLES:
+            return None
+        index = min(len(samples) - 1, int(round(pct / 100 * (len(samples) - 1))))
+        return samples[index]
+
+    def timeout_for(self, endpoint: str) -> float:
+        p99 = self.percentile(endpoint, 99)
+        if p99 is None:
+            return DEFAULT_TIMEOUT
+        return max(MIN_TIMEOUT, min(DEFAULT_TIMEOUT, p99 * TIMEOUT_MULTIPLIER))
+
+    def hedge_delay(self, endpoint: str) -> float | None:
+        p95 = self.percentile(endpoint, 95)
+        if p95 is None:
+            return None
+        return max(MIN_HEDGE_DELAY, p95)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            endpoints = list(self._samples)
+        return {
+            endpoint: {
+                "samples": len(self._samples[endpoint]),
+                "p50": self.percentile(endpoint, 50),
+                "p95": self.percentile(endpoint, 95),
+                "p99": self.percentile(endpoint, 99),
+                "timeout": self.timeout_for(endpoint),
+            }
+            for endpoint in endpoints
+        }
+
+
+latency_stats = LatencyStats()
+_hedge_executor = ThreadPoolExecutor(max_workers=HEDGE_WORKERS, thread_name_prefix="ttlock-hedge")
+# One slot per pool worker, held until the request finishes (losers included),
+# so hedged work never queues behind requests that already lost a race
+_hedge_slots = threading.BoundedSemaphore(HEDGE_WORKERS)
+
+
+def configure_hedging(workers: int) -> None:
+    """Size the hedging pool; call once at startup before any requests."""
+    global _hedge_executor, _hedge_slots
+    workers = max(2, workers)
+    _hedge_executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ttlock-hedge")
+    _hedge_slots = threading.BoundedSemaphore(workers)
 
 
 def _build_url(base_url: str, path: str) -> str:
@@ -12,12 +119,191 @@ def _build_url(base_url: str, path: str) -> str:
     return f"{base}/{path}"
 
 
+def _timed_post(endpoint: str, url: str, data: dict, timeout: float) -> requests.Response:
+    start = time.monotonic()
+    try:
+        resp = requests.post(
+            url,
+            data=data,
+            headers={"Content-Type": "application/x-www-form-urlencoded"},
+            timeout=timeout,
+        )
+    except requests.Timeout:
+        # Censored sample: we only know it took at least this long
+        latency_stats.record(endpoint, timeout)
+        raise
+    latency_stats.record(endpoint, time.monotonic() - start)
+    return resp
+
+
+def _pooled_post(slots: threading.BoundedSemaphore, endpoint: str, url: str, data: dict,
+                 timeout: float) -> requests.Response:
+    try:
+        return _timed_post(endpoint, url, data, timeout)
+    finally:
+        slots.release()
+
+
+def _submit(endpoint: str, url: str, data: dict, timeout: float):
+    """Run a request on the hedging pool, or None when every worker is busy."""
+    slots = _hedge_slots
+    if not slots.acquire(blocking=False):
+        return None
+    try:
+        return _hedge_executor.submit(_pooled_post, slots, endpoint, url, data, timeout)
+    except RuntimeError:
+        slots.release()
+        return None
+
+
+def _send(endpoint: str, url: str, data: dict, timeout: float, hedge: bool) -> requests.Response:
+    """
+    One attempt.
+
+    With hedge=True (idempotent reads only) a second identical request is sent
+    once the first has been outstanding longer than the endpoint's p95, and
+    whichever answers first wins. Both run on the hedging pool, which never
+    queues: with no free worker the request is sent unhedged on the caller's
+    thread, and with no second worker the first request is just waited for.
+    """
+    delay = latency_stats.hedge_delay(endpoint) if hedge else None
+    first = _submit(endpoint, url, data, timeout) if delay is not None else None
+    if first is None:
+        return _timed_post(endpoint, url, data, timeout)
+    try:
+        return first.result(timeout=delay)
+    except FutureTimeout:
+        pass
+
+    second = _submit(endpoint, url, data, timeout)
+    if second is None:
+        _LOGGER.debug("%s slower than p95 but the hedging pool is full; not hedging", endpoint)
+        return first.result()
+    _LOGGER.debug("%s slower than p95 (%.2fs), sending hedged request", endpoint, delay)
+    pending = {first, second}
+    error: BaseException | None = None
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                return future.result()
+            error = future.exception()
+    raise error
+
+
+def _errcode(resp: requests.Response) -> int | None:
+    if b"errcode" not in resp.content:
+        return None
+    try:
+        return int(resp.json().get("errcode"))
+    except (ValueError, TypeError, AttributeError):
+        return None
+
+
+def classify_response(resp: requests.Response) -> tuple[str | None, bool]:
+    """(kind, processed) for a response; kind None means success or a caller-level error."""
+    if resp.status_code in TOKEN_STATUSES:
+        return "token", True
+    if resp.status_code in RETRYABLE_STATUSES:
+        return "retryable", resp.status_code not in NOT_PROCESSED_STATUSES
+    if not resp.ok:
+        return "fatal", True
+    errcode = _errcode(resp)
+    if errcode in TOKEN_ERRCODES:
+        return "token", True
+    if errcode in RETRYABLE_ERRCODES:
+        return "retryable", errcode not in NOT_PROCESSED_ERRCODES
+    return None, True
+
+
+def classify_exception(err: requests.RequestException) -> tuple[str, bool]:
+    """(kind, processed) for a transport error."""
+    if isinstance(err, requests.ConnectTimeout):
+        return "retryable", False
+    if isinstance(err, requests.ConnectionError):
+        reason = getattr(err.args[0], "reason", None) if err.args else None
+        return "retryable", not isinstance(reason, NewConnectionError)
+    if isinstance(err, requests.Timeout):
+        return "retryable", True
+    return "fatal", True
+
+
+def _retry_delay(attempt: int, resp: requests.Response | None) -> float:
+    if resp is not None and resp.headers.get("Retry-After", "").isdigit():
+        return float(resp.headers["Retry-After"])
+    return random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** (attempt - 1)))
+
+
+def _post(endpoint: str, base_url: str, data: dict, hedge: bool = False,
+          idempotent: bool = True) -> requests.Response:
+    """
+    POST form data to a TTLock endpoint, retrying transient failures.
+
+    Retryable failures (5xx, 429, timeouts, TTLock internal/busy errcodes)
+    are retried with capped exponential backoff and jitter until MAX_ATTEMPTS
+    or RETRY_DEADLINE. Calls that change something (idempotent=False) are
+    only resent when the cloud cannot have acted on the first attempt, and
+    always get DEFAULT_TIMEOUT rather than the adaptive one. Token errors
+    raise TTLockError(kind="token") and a retryable failure that is not (or
+    no longer) retried raises TTLockError, even when it came as HTTP 200
+    with a busy errcode; other responses are returned for the caller to judge.
+    """
+    url = _build_url(base_url, endpoint)
+    deadline = time.monotonic() + RETRY_DEADLINE
+    attempt = 0
+    while True:
+        attempt += 1
+        if idempotent:
+            timeout = min(latency_stats.timeout_for(endpoint), max(MIN_TIMEOUT, deadline - time.monotonic()))
+        else:
+            # A timed-out command may still have run, so it is never cut short
+            timeout = DEFAULT_TIMEOUT
+        resp: requests.Response | None = None
+        try:
+            resp = _send(endpoint, url, data, timeout, hedge)
+            kind, processed = classify_response(resp)
+        except requests.RequestException as e:
+            kind, processed = classify_exception(e)
+            error = e
+        if kind == "token" and "accessToken" not in data:
+            kind = "fatal"  # /oauth2/token itself: bad credentials, not a stale token
+        if kind == "token":
+            errcode = _errcode(resp) if resp is not None else None
+            raise TTLockError(
+                f"{endpoint}: access token rejected (HTTP {resp.status_code}, errcode {errcode})",
+                kind="token", status=resp.status_code, errcode=errcode,
+            )
+
+        delay = _retry_delay(attempt, resp)
+        retry = (
+            kind == "retryable"
+            and (idempotent or not processed)
+            and attempt < MAX_ATTEMPTS
+            and time.monotonic() + delay < deadline
+        )
+        if not retry:
+            if resp is None:
+                raise error
+            if kind == "retryable":
+                errcode = _errcode(resp)
+                raise TTLockError(
+                    f"{endpoint} failed after {attempt} attempt(s): HTTP {resp.status_code}, "
+                    f"errcode {errcode} - {resp.text}",
+                    status=resp.status_code, errcode=errcode,
+                )
+            return resp
+        _LOGGER.info(
+            "%s attempt %d failed (%s), retrying in %.2fs",
+            endpoint, attempt, resp.status_code if resp is not None else error, delay,
+        )
+        time.sleep(delay)
+
+
 def register_user(base_url: str, client_id: str, client_secret: str,
                   username: str, password_md5: str) -> dict:
     """
     /v3/user/register
     """
-    url = _build_url(base_url, "/v3/user/register")
     now_ms = int(time.time() * 1000)
 
     data = {
@@ -28,12 +314,7 @@ def register_user(base_url: str, client_id: str, client_secret: str,
         "date": str(now_ms),
     }
 
-    resp = requests.post(
-        url,
-        data=data,
-        headers={"Content-Type": "application/x-www-form-urlencoded"},
-        timeout=15,
-    )
+    resp = _post("/v3/user/register", base_url, data, idempotent=False)
 
     if not resp.ok:
         raise TTLockError(
@@ -57,8 +338,6 @@ def get_access_token(base_url: str, client_id: str, client_secret: str,
     """
     /oauth2/token (grant_type=password)
     """
-    url = _build_url(base_url, "/oauth2/token")
-
     data = {
         "client_id": client_id,
         "client_secret": client_secret,
@@ -70,12 +349,7 @@ def get_access_token(base_url: str, client_id: str, client_secret: str,
     if redirect_uri:
         data["redirect_uri"] = redirect_uri
 
-    resp = requests.post(
-        url,
-        data=data,
-        headers={"Content-Type": "application/x-www-form-urlencoded"},
-        timeout=15,
-    )
+    resp = _post("/oauth2/token", base_url, data)
 
     if not resp.ok:
         raise TTLockError(
@@ -93,6 +367,36 @@ def get_access_token(base_url: str, client_id: str, client_secret: str,
     return body
 
 
+def refresh_access_token(base_url: str, client_id: str, client_secret: str,
+                         refresh_token: str) -> dict:
+    """
+    /oauth2/token (grant_type=refresh_token)
+    """
+    data = {
+        "client_id": client_id,
+        "client_secret": client_secret,
+        "grant_type": "refresh_token",
+        "refresh_token": refresh_token,
+    }
+
+    resp = _post("/oauth2/token", base_url, data)
+
+    if not resp.ok:
+        raise TTLockError(
+            f"Token refresh failed: HTTP {resp.status_code} - {resp.text}"
+        )
+
+    try:
+        body = resp.json()
+    except Exception:
+        raise TTLockError(f"Token refresh failed: Non-JSON response: {resp.text}")
+
+    if "access_token" not in body:
+        raise TTLockError(f"Token refresh failed: {body}")
+
+    return body
+
+
 def list_locks(base_url: str, client_id: str, access_token: str,
                page_no: int = 1, page_size: int = 100) -> dict:
     """
@@ -100,7 +404,6 @@ def list_locks(base_url: str, client_id: str, access_token: str,
 
     Requires: clientId, accessToken, pageNo, pageSize, date
     """
-    url = _build_url(base_url, "/v3/lock/list")
     now_ms = int(time.time() * 1000)
 
     data = {
@@ -111,12 +414,7 @@ def list_locks(base_url: str, client_id: str, access_token: str,
         "date": str(now_ms),
     }
 
-    resp = requests.post(
-        url,
-        data=data,
-        headers={"Content-Type": "application/x-www-form-urlencoded"},
-        timeout=15,
-    )
+    resp = _post("/v3/lock/list", base_url, data, hedge=True)
 
     if not resp.ok:
         raise TTLockError(
@@ -146,7 +444,6 @@ def operate_lock(base_url: str, client_id: str, access_token: str,
         raise TTLockError(f"Invalid action: {action}")
 
     path = "/v3/lock/lock" if action == "lock" else "/v3/lock/unlock"
-    url = _build_url(base_url, path)
     now_ms = int(time.time() * 1000)
 
     data = {
@@ -156,12 +453,8 @@ def operate_lock(base_url: str, client_id: str, access_token: str,
         "date": str(now_ms),
     }
 
-    resp = requests.post(
-        url,
-        data=data,
-        headers={"Content-Type": "application/x-www-form-urlencoded"},
-        timeout=15,
-    )
+    # A resent lock/unlock could fire twice; only retried if never processed
+    resp = _post(path, base_url, data, idempotent=False)
 
     if not resp.ok:
         raise TTLockError(
@@ -173,4 +466,138 @@ def operate_lock(base_url: str, client_id: str, access_token: str,
     except Exception:
         raise TTLockError(f"{action.capitalize()} failed: Non-JSON response: {resp.text}")
 
+    _check_errcode(body, action.capitalize())
+
+    return body
+
+
+def _check_errcode(body: dict, what: str) -> None:
+    errcode = body.get("errcode")
+    if errcode not in (None, 0, "0"):
+        try:
+            code = int(errcode)
+        except (TypeError, ValueError):
+            code = None
+        raise TTLockError(
+            f"{what} failed: errcode {errcode} - {body.get('errmsg', '')}", errcode=code
+        )
+
+
+def add_passcode(base_url: str, client_id: str, access_token: str,
+                 lock_id: int, passcode: str, name: str,
+                 start_ms: int, end_ms: int, add_type: int = 2) -> dict:
+    """
+    /v3/keyboardPwd/add
+
+    Requires: clientId, accessToken, lockId, keyboardPwd, startDate, endDate, date
+    addType 2 = add via gateway (no phone Bluetooth needed)
+    """
+    now_ms = int(time.time() * 1000)
+
+    data = {
+        "clientId": client_id,
+        "accessToken": access_token,
+        "lockId": int(lock_id),
+        "keyboardPwd": passcode,
+        "keyboardPwdName": name,
+        "startDate": int(start_ms),
+        "endDate": int(end_ms),
+        "addType": add_type,
+        "date": str(now_ms),
+    }
+
+    resp = _post("/v3/keyboardPwd/add", base_url, data, idempotent=False)
+
+    if not resp.ok:
+        raise TTLockError(
+            f"Add passcode failed: HTTP {resp.status_code} - {resp.text}"
+        )
+
+    try:
+        body = resp.json()
+    except Exception:
+        raise TTLockError(f"Add passcode failed: Non-JSON response: {resp.text}")
+
+    _check_errcode(body, "Add passcode")
+    if "keyboardPwdId" not in body:
+        raise TTLockError(f"Add passcode failed: {body}")
+
+    return body
+
+
+def send_ekey(base_url: str, client_id: str, access_token: str,
+              lock_id: int, receiver_username: str, key_name: str,
+              start_ms: int, end_ms: int) -> dict:
+    """
+    /v3/key/send
+
+    Requires: clientId, accessToken, lockId, receiverUsername, keyName, startDate, endDate, date
+    """
+    now_ms = int(time.time() * 1000)
+
+    data = {
+        "clientId": client_id,
+        "accessToken": access_token,
+        "lockId": int(lock_id),
+        "receiverUsername": receiver_username,
+        "keyName": key_name,
+        "startDate": int(start_ms),
+        "endDate": int(end_ms),
+        "date": str(now_ms),
+    }
+
+    resp = _post("/v3/key/send", base_url, data, idempotent=False)
+
+    if not resp.ok:
+        raise TTLockError(
+            f"Send eKey failed: HTTP {resp.status_code} - {resp.text}"
+        )
+
+    try:
+        body = resp.json()
+    except Exception:
+        raise TTLockError(f"Send eKey failed: Non-JSON response: {resp.text}")
+
+    _check_errcode(body, "Send eKey")
+
+    return body
+
+
+def list_lock_records(base_url: str, client_id: str, access_token: str,
+                      lock_id: int, start_ms: int, end_ms: int,
+                      page_no: int = 1, page_size: int = 100) -> dict:
+    """
+    /v3/lockRecord/list
+
+    Requires: clientId, accessToken, lockId, startDate, endDate, pageNo, pageSize, date
+    """
+    now_ms = int(time.time() * 1000)
+
+    data = {
+        "clientId": client_id,
+        "accessToken": access_token,
+        "lockId": int(lock_id),
+        "startDate": int(start_ms),
+        "endDate": int(end_ms),
+        "pageNo": page_no,
+        "pageSize": page_size,
+        "date": str(now_ms),
+    }
+
+    resp = _post("/v3/lockRecord/list", base_url, data, hedge=True)
+
+    if not resp.ok:
+        raise TTLockError(
+            f"Lock records failed: HTTP {resp.status_code} - {resp.text}"
+        )
+
+    try:
+        body = resp.json()
+    except Exception:
+        raise TTLockError(f"Lock records failed: Non-JSON response: {resp.text}")
+
+    _check_errcode(body, "Lock records")
+    if "list" not in body:
+        raise TTLockError(f"Lock records failed: {body}")
+
     return body
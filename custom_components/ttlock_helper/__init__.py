@@ -4,14 +4,15 @@ import logging
 
 from homeassistant.config_entries import ConfigEntry
 from homeassistant.core import HomeAssistant
+from homeassistant.helpers.storage import Store
 from homeassistant.helpers.typing import ConfigType
 
-from .const import DOMAIN, CONF_BASE_URL
+from .const import DOMAIN, CONF_BASE_URL, STORAGE_VERSION
 from .coordinator import TTLockCoordinator
 
 _LOGGER = logging.getLogger(__name__)
 
-PLATFORMS: list[str] = ["lock", "sensor", "binary_sensor"]
+PLATFORMS: list[str] = ["lock", "sensor", "binary_sensor", "event"]
 
 
 async def async_setup(hass: HomeAssistant, config: ConfigType) -> bool:
@@ -24,13 +25,28 @@ async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     base_url = entry.data[CONF_BASE_URL]
     _LOGGER.debug("Setting up TTLock Helper with base URL %s", base_url)
 
-    coordinator = TTLockCoordinator(hass, base_url)
-    await coordinator.async_config_entry_first_refresh()
+    coordinator = TTLockCoordinator(hass, base_url, entry.entry_id)
+    # Start from the persisted snapshot when we have one so HA boot never
+    # waits on (or fails because of) the helper; refresh in the background
+    restored = await coordinator.async_restore_snapshot()
+    if not restored:
+        await coordinator.async_config_entry_first_refresh()
+    entry.async_on_unload(coordinator.async_start_lock_tracking())
+    entry.async_on_unload(coordinator.async_start_event_stream())
+    entry.async_on_unload(coordinator.async_cancel_verify)
+    entry.async_on_unload(coordinator.async_cancel_grace_timer)
 
     hass.data.setdefault(DOMAIN, {})
     hass.data[DOMAIN][entry.entry_id] = coordinator
 
     await hass.config_entries.async_forward_entry_setups(entry, PLATFORMS)
+    # After the platforms so event entities are subscribed before the backfill
+    entry.async_on_unload(coordinator.async_start_record_feed())
+
+    if restored:
+        entry.async_create_background_task(
+            hass, coordinator.async_refresh(), "ttlock_helper initial refresh"
+        )
 
     return True
 
@@ -41,3 +57,9 @@ async def async_unload_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     if unload_ok:
         hass.data[DOMAIN].pop(entry.entry_id, None)
     return unload_ok
+
+
+async def async_remove_entry(hass: HomeAssistant, entry: ConfigEntry) -> None:
+    """Delete the persisted lock snapshot and record cursor when the entry is removed."""
+    await Store(hass, STORAGE_VERSION, f"{DOMAIN}.{entry.entry_id}.locks").async_remove()
+    await Store(hass, STORAGE_VERSION, f"{DOMAIN}.{entry.entry_id}.records").async_remove()
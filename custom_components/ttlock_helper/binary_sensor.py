@@ -1,20 +1,19 @@
 from __future__ import annotations
 
 import logging
-from typing import Any
 
 from homeassistant.components.binary_sensor import (
     BinarySensorEntity,
     BinarySensorDeviceClass,
 )
 from homeassistant.config_entries import ConfigEntry
-from homeassistant.core import HomeAssistant
+from homeassistant.core import HomeAssistant, callback
 from homeassistant.helpers.entity import DeviceInfo
 from homeassistant.helpers.entity_platform import AddEntitiesCallback
-from homeassistant.helpers.update_coordinator import CoordinatorEntity
 
 from .const import DOMAIN
 from .coordinator import TTLockCoordinator
+from .entity import TTLockEntity
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -27,23 +26,24 @@ async def async_setup_entry(
     """Set up TTLock gateway binary sensors from a config entry."""
     coordinator: TTLockCoordinator = hass.data[DOMAIN][entry.entry_id]
 
-    entities: list[TTLockGatewayBinarySensor] = []
+    @callback
+    def _async_add_locks(lock_ids: set[str]) -> None:
+        entities = [
+            TTLockGatewayBinarySensor(coordinator, entry.entry_id, lock["lockId"])
+            for lock in coordinator.data
+            if str(lock.get("lockId")) in lock_ids
+        ]
+        _LOGGER.debug("Adding %d TTLock gateway sensors", len(entities))
+        async_add_entities(entities)
 
-    for lock in coordinator.data:
-        lock_id = lock.get("lockId")
-        if lock_id is None:
-            continue
-        entities.append(TTLockGatewayBinarySensor(coordinator, entry.entry_id, lock_id))
+    _async_add_locks(set(coordinator.locks_by_id))
+    entry.async_on_unload(coordinator.async_add_new_lock_listener(_async_add_locks))
 
-    _LOGGER.debug("Adding %d TTLock gateway sensors", len(entities))
-    async_add_entities(entities)
 
-
-class TTLockGatewayBinarySensor(
-    CoordinatorEntity[TTLockCoordinator], BinarySensorEntity
-):
+class TTLockGatewayBinarySensor(TTLockEntity, BinarySensorEntity):
     """Binary sensor indicating if lock has a gateway configured."""
 
+    _watched_fields = frozenset({"lockAlias", "hasGateway"})
     _attr_device_class = BinarySensorDeviceClass.CONNECTIVITY
 
     def __init__(
@@ -52,18 +52,9 @@ class TTLockGatewayBinarySensor(
         entry_id: str,
         lock_id: int,
     ) -> None:
-        super().__init__(coordinator)
-        self._entry_id = entry_id
-        self._lock_id = lock_id
+        super().__init__(coordinator, entry_id, lock_id)
         self._attr_unique_id = f"{DOMAIN}_{entry_id}_{lock_id}_gateway"
 
-    @property
-    def _lock_data(self) -> dict[str, Any] | None:
-        for lock in self.coordinator.data:
-            if lock.get("lockId") == self._lock_id:
-                return lock
-        return None
-
     @property
     def name(self) -> str | None:
         data = self._lock_data
@@ -3,3 +3,46 @@ DOMAIN = "ttlock_helper"
 CONF_BASE_URL = "base_url"
 
 DEFAULT_POLL_INTERVAL = 30  # seconds
+
+# Lock commands are submitted as helper jobs (?async=1) and long-polled
+COMMAND_JOB_TIMEOUT = 60  # seconds, overall wait for a command job
+JOB_POLL_WAIT = 10  # seconds per /api/jobs/<id>?wait= long-poll
+JOB_POLL_CONCURRENCY = 2  # job long-polls in flight at once (each holds a helper thread)
+
+# Adaptive polling (DEFAULT_POLL_INTERVAL is the idle starting point)
+FAST_POLL_INTERVAL = 5  # seconds, right after a command or detected change
+FAST_POLL_WINDOW = 60  # seconds the fast interval stays in effect
+IDLE_BACKOFF_FACTOR = 1.5  # interval growth per unchanged poll
+MAX_IDLE_POLL_INTERVAL = 300
+MAX_ERROR_POLL_INTERVAL = 600
+POLL_JITTER = 0.2  # +/- fraction applied to error backoff
+
+# Helper event stream (/api/events); polling becomes a slow reconciliation
+STREAM_RECONCILE_INTERVAL = 600  # seconds between full polls while streaming
+STREAM_READ_TIMEOUT = 45  # helper sends a keepalive every 15 s
+STREAM_MAX_BACKOFF = 60  # seconds between reconnect attempts
+
+# Debounced read-back of locks after commands (instead of a full refresh)
+VERIFY_DELAY = 5  # seconds after the last command
+
+# Commands issued within this window are sent as one /api/locks/batch request
+COMMAND_BATCH_WINDOW = 0.25  # seconds
+
+# Diagnostic sensors re-read the link stats on their own, independent of polling
+DIAGNOSTIC_UPDATE_INTERVAL = 30  # seconds
+
+# Last-known lock snapshot in HA storage (fast startup, helper outages)
+STORAGE_VERSION = 1
+SNAPSHOT_SAVE_DELAY = 30  # seconds; coalesces bursts of updates into one write
+SNAPSHOT_GRACE = 900  # seconds entities stay available on stale data
+# Lock fields kept in the snapshot: id and name plus every entity's
+# _watched_fields. Keys and passcodes (lockData, adminPwd, ...) are left out
+# because .storage ends up in HA backups.
+SNAPSHOT_FIELDS = frozenset(
+    {"lockId", "lockName", "lockAlias", "modelNum", "isLocked", "electricQuantity", "hasGateway"}
+)
+
+# Lock records (who opened what) fetched incrementally from /api/records
+RECORD_BACKFILL = 50  # records fetched on first run, before a cursor exists
+RECORD_PAGE_SIZE = 200
+EVENT_LOCK_RECORD = f"{DOMAIN}_lock_record"  # bus event fired per record
@@ -1,25 +1,117 @@
 from __future__ import annotations
 
+import asyncio
+from collections import deque
+from collections.abc import Callable
 from datetime import timedelta
+import json
 import logging
+import random
+import uuid
 
 import aiohttp
 import async_timeout
 
-from homeassistant.core import HomeAssistant
+from homeassistant.core import CALLBACK_TYPE, HomeAssistant, callback
+from homeassistant.helpers import device_registry as dr, entity_registry as er
 from homeassistant.helpers.update_coordinator import DataUpdateCoordinator, UpdateFailed
 from homeassistant.helpers.aiohttp_client import async_get_clientsession
+from homeassistant.helpers.dispatcher import async_dispatcher_send
+from homeassistant.helpers.event import async_call_later
+from homeassistant.helpers.storage import Store
 from homeassistant.exceptions import HomeAssistantError
 
-from .const import DOMAIN, CONF_BASE_URL, DEFAULT_POLL_INTERVAL
+from .const import (
+    DOMAIN,
+    CONF_BASE_URL,
+    DEFAULT_POLL_INTERVAL,
+    COMMAND_JOB_TIMEOUT,
+    JOB_POLL_WAIT,
+    JOB_POLL_CONCURRENCY,
+    FAST_POLL_INTERVAL,
+    FAST_POLL_WINDOW,
+    IDLE_BACKOFF_FACTOR,
+    MAX_IDLE_POLL_INTERVAL,
+    MAX_ERROR_POLL_INTERVAL,
+    POLL_JITTER,
+    STREAM_RECONCILE_INTERVAL,
+    STREAM_READ_TIMEOUT,
+    STREAM_MAX_BACKOFF,
+    VERIFY_DELAY,
+    COMMAND_BATCH_WINDOW,
+    STORAGE_VERSION,
+    SNAPSHOT_SAVE_DELAY,
+    SNAPSHOT_GRACE,
+    SNAPSHOT_FIELDS,
+    RECORD_BACKFILL,
+    RECORD_PAGE_SIZE,
+    EVENT_LOCK_RECORD,
+)
 
 _LOGGER = logging.getLogger(__name__)
 
+# (platform, unique_id suffix) of the entities created for every lock
+LOCK_ENTITY_PLATFORMS = (
+    ("lock", ""),
+    ("sensor", "_battery"),
+    ("binary_sensor", "_gateway"),
+    ("event", "_activity"),
+)
+
+
+def record_signal(entry_id: str, lock_id: int | str) -> str:
+    """Dispatcher signal carrying new lock records for one lock."""
+    return f"{DOMAIN}_{entry_id}_record_{lock_id}"
+
+
+class PerformanceStats:
+    """Rolling latency samples and counters for the helper link."""
+
+    def __init__(self, window: int = 100) -> None:
+        self.refresh_ms: deque[float] = deque(maxlen=window)
+        self.command_ms: deque[float] = deque(maxlen=window)
+        self.refresh_errors = 0
+        self.command_errors = 0
+        self.timeouts = 0
+        self.superseded_commands = 0
+        self.payload_bytes: int | None = None
+
+    @staticmethod
+    def percentile(samples: deque[float], pct: float) -> float | None:
+        if not samples:
+            return None
+        ordered = sorted(samples)
+        index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+        return round(ordered[index], 1)
+
+    def record_error(self, err: BaseException, command: bool) -> None:
+        if command:
+            self.command_errors += 1
+        else:
+            self.refresh_errors += 1
+        cause = err.__cause__ or err
+        if isinstance(cause, asyncio.TimeoutError):
+            self.timeouts += 1
+
+    def as_dict(self) -> dict:
+        return {
+            "refresh_ms_last": self.refresh_ms[-1] if self.refresh_ms else None,
+            "refresh_ms_p50": self.percentile(self.refresh_ms, 50),
+            "refresh_ms_p95": self.percentile(self.refresh_ms, 95),
+            "command_ms_p50": self.percentile(self.command_ms, 50),
+            "command_ms_p95": self.percentile(self.command_ms, 95),
+            "refresh_errors": self.refresh_errors,
+            "command_errors": self.command_errors,
+            "timeouts": self.timeouts,
+            "superseded_commands": self.superseded_commands,
+            "payload_bytes": self.payload_bytes,
+        }
+
 
 class TTLockCoordinator(DataUpdateCoordinator[list[dict]]):
     """Coordinator to fetch locks from TTLock helper and send actions."""
 
-    def __init__(self, hass: HomeAssistant, base_url: str) -> None:
+    def __init__(self, hass: HomeAssistant, base_url: str, entry_id: str) -> None:
         super().__init__(
             hass,
             _LOGGER,
@@ -27,22 +119,577 @@ class TTLockCoordinator(DataUpdateCoordinator[list[dict]]):
             update_interval=timedelta(seconds=DEFAULT_POLL_INTERVAL),
         )
         self._base_url = base_url.rstrip("/")
+        self._entry_id = entry_id
+        # Lock ids that currently have entities; diffed after every update
+        self._known_lock_ids: set[str] = set()
+        self._new_lock_listeners: list[Callable[[set[str]], None]] = []
+        # Last lock-list version seen; lets us ask the helper for deltas only
+        self._version: int | None = None
+        # lockId (normalised to str) -> lock dict, rebuilt once per data list
+        self._index: dict[str, dict] = {}
+        self._index_source: list[dict] | None = None
+        # Adaptive polling state
+        self._idle_interval: float = DEFAULT_POLL_INTERVAL
+        self._fast_until: float = 0.0
+        self._error_count = 0
+        self._interval_hint: float | None = None
+        # Push updates from the helper's /api/events stream
+        self._stream_task: asyncio.Task | None = None
+        self._stream_connected = False
+        # Per-lock field diff of the last listener notification; None = all
+        self._changed_fields: dict[str, set[str] | None] | None = None
+        self._notified_data: list[dict] | None = None
+        self._notified_success: bool | None = None
+        # Locks awaiting a debounced read-back after a command
+        self._verify_ids: set[str] = set()
+        self._verify_unsub: CALLBACK_TYPE | None = None
+        # Commands waiting for the batch window to close
+        self._pending_commands: list[tuple[int, str, asyncio.Future]] = []
+        self._batch_flush: asyncio.TimerHandle | None = None
+        self._batch_supported: bool | None = None
+        # Each job long-poll holds a helper thread; a scene must not take them all
+        self._job_polls = asyncio.Semaphore(JOB_POLL_CONCURRENCY)
+        self.stats = PerformanceStats()
+        # Persisted last good lock list, used to start without the helper
+        self._store: Store = Store(hass, STORAGE_VERSION, f"{DOMAIN}.{entry_id}.locks")
+        self._last_success: float | None = None
+        # Fires when SNAPSHOT_GRACE runs out during an outage
+        self._grace_unsub: CALLBACK_TYPE | None = None
+        # Lock record feed: cursor into the helper's /api/records journal
+        self._records_store: Store = Store(
+            hass, STORAGE_VERSION, f"{DOMAIN}.{entry_id}.records"
+        )
+        self._record_cursor: int | None = None
+        self._records_loaded = False
+        self._records_task: asyncio.Task | None = None
+        self._records_enabled = False
 
     @property
     def base_url(self) -> str:
         return self._base_url
 
+    @property
+    def locks_by_id(self) -> dict[str, dict]:
+        """Index of the current lock list keyed by str(lockId)."""
+        if self._index_source is not self.data:
+            self._index = {
+                str(lock["lockId"]): lock
+                for lock in self.data or []
+                if lock.get("lockId") is not None
+            }
+            self._index_source = self.data
+        return self._index
+
+    def get_lock(self, lock_id: int | str) -> dict | None:
+        """O(1) lookup of a lock by id (int or str)."""
+        return self.locks_by_id.get(str(lock_id))
+
+    async def async_restore_snapshot(self) -> bool:
+        """Load the persisted lock list as current data; False if none."""
+        stored = await self._store.async_load()
+        if not isinstance(stored, dict) or not isinstance(stored.get("locks"), list):
+            return False
+        self.data = [self._snapshot_lock(lock) for lock in stored["locks"]]
+        self._version = stored.get("version")
+        self._last_success = self.hass.loop.time()
+        _LOGGER.debug("Restored %d TTLock locks from storage", len(self.data))
+        return True
+
+    @staticmethod
+    def _snapshot_lock(lock: dict) -> dict:
+        return {key: value for key, value in lock.items() if key in SNAPSHOT_FIELDS}
+
+    def _snapshot(self) -> dict:
+        return {
+            "version": self._version,
+            "locks": [self._snapshot_lock(lock) for lock in self.data or []],
+        }
+
+    @property
+    def data_usable(self) -> bool:
+        """True while data is fresh or failures are still within the grace period."""
+        if self.last_update_success:
+            return True
+        if self._last_success is None:
+            return False
+        return self.hass.loop.time() - self._last_success < SNAPSHOT_GRACE
+
+    @callback
+    def async_update_listeners(self) -> None:
+        """Record which lock fields changed, then notify listeners."""
+        if self.last_update_success and self.data is not None:
+            self._last_success = self.hass.loop.time()
+            if self.data is not self._notified_data:
+                self._store.async_delay_save(self._snapshot, SNAPSHOT_SAVE_DELAY)
+        if self.last_update_success != self._notified_success:
+            self._changed_fields = None  # availability flipped for everyone
+        else:
+            self._changed_fields = self._diff_locks(self._notified_data, self.data)
+        self._notified_data = self.data
+        self._notified_success = self.last_update_success
+        super().async_update_listeners()
+        if self.last_update_success:
+            self.async_cancel_grace_timer()
+            self._async_schedule_record_fetch()
+        elif self._grace_unsub is None and self._last_success is not None:
+            # The coordinator only notifies on the first of a run of failures,
+            # so nothing else would tell entities that the grace period ended
+            remaining = self._last_success + SNAPSHOT_GRACE - self.hass.loop.time()
+            if remaining > 0:
+                self._grace_unsub = async_call_later(
+                    self.hass, remaining, self._async_grace_expired
+                )
+
+    @callback
+    def _async_grace_expired(self, _now) -> None:
+        self._grace_unsub = None
+        if self.last_update_success:
+            return
+        _LOGGER.debug("TTLock helper still unreachable; marking entities unavailable")
+        self._changed_fields = None
+        super().async_update_listeners()
+
+    @callback
+    def async_cancel_grace_timer(self) -> None:
+        if self._grace_unsub is not None:
+            self._grace_unsub()
+            self._grace_unsub = None
+
+    @staticmethod
+    def _diff_locks(
+        old: list[dict] | None, new: list[dict] | None
+    ) -> dict[str, set[str] | None] | None:
+        if old is None or new is None:
+            return None
+        previous = {str(lock.get("lockId")): lock for lock in old}
+        changed: dict[str, set[str] | None] = {}
+        for lock in new:
+            key = str(lock.get("lockId"))
+            before = previous.pop(key, None)
+            if before is lock:
+                continue  # untouched by a delta merge
+            if before is None:
+                changed[key] = None
+                continue
+            fields = {
+                field
+                for field in before.keys() | lock.keys()
+                if before.get(field) != lock.get(field)
+            }
+            if fields:
+                changed[key] = fields
+        for key in previous:
+            changed[key] = None
+        return changed
+
+    def lock_changed(self, lock_id: int | str, fields: frozenset[str]) -> bool:
+        """Whether the last update touched any of ``fields`` of a lock."""
+        if self._changed_fields is None:
+            return True
+        key = str(lock_id)
+        if key not in self._changed_fields:
+            return False
+        changed = self._changed_fields[key]
+        return changed is None or not changed.isdisjoint(fields)
+
+    @callback
+    def async_set_lock_state(self, lock_id: int | str, is_locked: bool | None) -> bool | None:
+        """Set isLocked for one lock locally; returns the previous value."""
+        lock = self.get_lock(lock_id)
+        if lock is None or self.data is None:
+            return None
+        previous = lock.get("isLocked")
+        updated = {**lock, "isLocked": is_locked}
+        self.data = [updated if item is lock else item for item in self.data]
+        self.async_update_listeners()
+        return previous
+
+    @callback
+    def async_schedule_verify(self, lock_id: int | str) -> None:
+        """Read back ``lock_id`` from the helper once commands settle."""
+        if self._stream_connected:
+            return  # the event stream will push the helper's view anyway
+        self._verify_ids.add(str(lock_id))
+        if self._verify_unsub is not None:
+            self._verify_unsub()
+        self._verify_unsub = async_call_later(self.hass, VERIFY_DELAY, self._async_verify_locks)
+
+    @callback
+    def async_cancel_verify(self) -> None:
+        if self._verify_unsub is not None:
+            self._verify_unsub()
+            self._verify_unsub = None
+        self._verify_ids.clear()
+
+    async def _async_verify_locks(self, _now) -> None:
+        self._verify_unsub = None
+        lock_ids, self._verify_ids = self._verify_ids, set()
+        if not lock_ids or self.data is None:
+            return
+
+        url = f"{self._base_url}/api/locks"
+        session: aiohttp.ClientSession = async_get_clientsession(self.hass)
+        try:
+            async with async_timeout.timeout(10):
+                async with session.get(url, params={"ids": ",".join(sorted(lock_ids))}) as resp:
+                    if resp.status != 200:
+                        raise UpdateFailed(f"HTTP {resp.status}")
+                    data = await resp.json()
+        except Exception as err:
+            _LOGGER.debug("Verifying TTLock locks %s failed: %s", sorted(lock_ids), err)
+            return
+
+        # Older helpers ignore ?ids= and return everything; filter here
+        locks = [
+            lock for lock in data.get("locks", []) if str(lock.get("lockId")) in lock_ids
+        ]
+        merged = self._merge_delta({"locks": locks})
+        if merged != self.data:
+            self.data = merged
+            self.async_update_listeners()
+
+    @callback
+    def async_start_lock_tracking(self) -> CALLBACK_TYPE:
+        """Start diffing lock ids on each update; returns an unsubscribe."""
+        self._known_lock_ids = set(self.locks_by_id)
+        return self.async_add_listener(self._async_sync_lock_ids)
+
+    @callback
+    def async_add_new_lock_listener(
+        self, listener: Callable[[set[str]], None]
+    ) -> CALLBACK_TYPE:
+        """Call ``listener`` with the ids of locks that appear after setup."""
+        self._new_lock_listeners.append(listener)
+
+        @callback
+        def remove_listener() -> None:
+            self._new_lock_listeners.remove(listener)
+
+        return remove_listener
+
+    @callback
+    def _async_sync_lock_ids(self) -> None:
+        current = set(self.locks_by_id)
+        if not current and self._known_lock_ids:
+            # An empty list is far more likely a helper hiccup than every
+            # lock being deleted; keep the entities
+            _LOGGER.debug("Helper returned no locks; keeping existing entities")
+            return
+
+        added = current - self._known_lock_ids
+        removed = self._known_lock_ids - current
+        self._known_lock_ids = current
+
+        if removed:
+            self._async_remove_locks(removed)
+        if added:
+            _LOGGER.debug("New TTLock locks discovered: %s", sorted(added))
+            for listener in list(self._new_lock_listeners):
+                listener(added)
+
+    @callback
+    def _async_remove_locks(self, lock_ids: set[str]) -> None:
+        """Remove entities and devices of locks no longer reported by the helper."""
+        ent_reg = er.async_get(self.hass)
+        dev_reg = dr.async_get(self.hass)
+        for lock_id in lock_ids:
+            _LOGGER.debug("TTLock lock %s was removed; deleting its entities", lock_id)
+            for platform, suffix in LOCK_ENTITY_PLATFORMS:
+                entity_id = ent_reg.async_get_entity_id(
+                    platform, DOMAIN, f"{DOMAIN}_{self._entry_id}_{lock_id}{suffix}"
+                )
+                if entity_id:
+                    ent_reg.async_remove(entity_id)
+            device = dev_reg.async_get_device(identifiers={(DOMAIN, lock_id)})
+            if device:
+                dev_reg.async_remove_device(device.id)
+
+    @callback
+    def async_start_event_stream(self) -> CALLBACK_TYPE:
+        """Subscribe to the helper's event stream; returns a stop callback."""
+        self._stream_task = self.hass.async_create_background_task(
+            self._async_event_stream_loop(), "ttlock_helper event stream"
+        )
+
+        @callback
+        def stop_event_stream() -> None:
+            if self._stream_task is not None:
+                self._stream_task.cancel()
+                self._stream_task = None
+            self._stream_connected = False
+
+        return stop_event_stream
+
+    @callback
+    def _set_stream_connected(self, connected: bool) -> None:
+        if connected == self._stream_connected:
+            return
+        self._stream_connected = connected
+        if connected:
+            _LOGGER.debug("TTLock event stream connected; polling only to reconcile")
+            self.update_interval = timedelta(seconds=STREAM_RECONCILE_INTERVAL)
+        else:
+            _LOGGER.debug("TTLock event stream lost; falling back to polling")
+            self.update_interval = timedelta(seconds=DEFAULT_POLL_INTERVAL)
+            self.hass.async_create_task(self.async_request_refresh())
+
+    async def _async_event_stream_loop(self) -> None:
+        backoff = 1.0
+        while True:
+            try:
+                if not await self._async_consume_event_stream():
+                    _LOGGER.info("TTLock helper has no event stream; using polling only")
+                    return
+            except asyncio.CancelledError:
+                raise
+            except Exception as err:
+                _LOGGER.debug("TTLock event stream error: %s", err)
+
+            # Reset the backoff if we got connected (e.g. the helper recycled
+            # the stream); otherwise keep backing off while it is unreachable
+            backoff = 1.0 if self._stream_connected else min(STREAM_MAX_BACKOFF, backoff * 2)
+            self._set_stream_connected(False)
+            await asyncio.sleep(backoff * random.uniform(0.5, 1.0))
+
+    async def _async_consume_event_stream(self) -> bool:
+        """Read SSE events until the stream ends; False if unsupported."""
+        url = f"{self._base_url}/api/events"
+        headers = {"Accept": "text/event-stream"}
+        if self._version is not None and self.data is not None:
+            headers["Last-Event-ID"] = str(self._version)
+
+        session: aiohttp.ClientSession = async_get_clientsession(self.hass)
+        timeout = aiohttp.ClientTimeout(
+            total=None, sock_connect=10, sock_read=STREAM_READ_TIMEOUT
+        )
+
+        async with session.get(url, headers=headers, timeout=timeout) as resp:
+            if resp.status == 404:
+                return False
+            if resp.status != 200:
+                raise UpdateFailed(f"HTTP {resp.status} from event stream")
+            self._set_stream_connected(True)
+
+            event, data_lines = "message", []
+            async for raw in resp.content:
+                line = raw.decode("utf-8").rstrip("\r\n")
+                if not line:
+                    if data_lines:
+                        self._async_handle_stream_event(event, "\n".join(data_lines))
+                    event, data_lines = "message", []
+                    continue
+                if line.startswith(":"):
+                    continue  # keepalive
+                field, _, value = line.partition(":")
+                value = value[1:] if value.startswith(" ") else value
+                if field == "event":
+                    event = value
+                elif field == "data":
+                    data_lines.append(value)
+        return True
+
+    @callback
+    def _async_handle_stream_event(self, event: str, data: str) -> None:
+        if event != "locks":
+            return
+        try:
+            payload = json.loads(data)
+        except ValueError:
+            _LOGGER.debug("Ignoring malformed TTLock event: %s", data)
+            return
+
+        if payload.get("full", True) or self.data is None:
+            locks = payload.get("locks", [])
+        else:
+            locks = self._merge_delta(payload)
+        version = payload.get("version")
+        if version is not None:
+            self._version = int(version)
+
+        if locks != self.data:
+            _LOGGER.debug("TTLock event stream update (version %s)", version)
+            self.async_set_updated_data(locks)
+
+    @callback
+    def async_start_record_feed(self) -> CALLBACK_TYPE:
+        """Fetch new lock records after each update; returns a stop callback."""
+        self._records_enabled = True
+        self._async_schedule_record_fetch()
+
+        @callback
+        def stop_record_feed() -> None:
+            self._records_enabled = False
+            if self._records_task is not None:
+                self._records_task.cancel()
+                self._records_task = None
+
+        return stop_record_feed
+
+    @callback
+    def _async_schedule_record_fetch(self) -> None:
+        # Lock state updates are what records cause, so they are the trigger;
+        # a fetch already in flight picks up anything newer on its next page
+        if not self._records_enabled:
+            return
+        if self._records_task is not None and not self._records_task.done():
+            return
+        self._records_task = self.hass.async_create_background_task(
+            self._async_fetch_records(), "ttlock_helper lock records"
+        )
+
+    async def _async_fetch_records(self) -> None:
+        """Fetch records newer than the persisted cursor and dispatch them."""
+        if not self._records_loaded:
+            stored = await self._records_store.async_load()
+            if isinstance(stored, dict) and stored.get("cursor") is not None:
+                self._record_cursor = int(stored["cursor"])
+            self._records_loaded = True
+
+        url = f"{self._base_url}/api/records"
+        session: aiohttp.ClientSession = async_get_clientsession(self.hass)
+        while True:
+            if self._record_cursor is None:
+                # First run: only a bounded backfill, not the whole journal
+                params = {"tail": str(RECORD_BACKFILL)}
+            else:
+                params = {"after": str(self._record_cursor), "limit": str(RECORD_PAGE_SIZE)}
+            try:
+                async with async_timeout.timeout(10):
+                    async with session.get(url, params=params) as resp:
+                        if resp.status == 404:
+                            _LOGGER.info("TTLock helper has no /api/records; record feed off")
+                            self._records_enabled = False
+                            return
+                        if resp.status != 200:
+                            _LOGGER.debug("HTTP %s when fetching lock records", resp.status)
+                            return
+                        data = await resp.json()
+            except Exception as err:
+                _LOGGER.debug("Error fetching lock records: %s", err)
+                return
+
+            latest = int(data.get("latest", 0))
+            if self._record_cursor is not None and latest < self._record_cursor:
+                _LOGGER.debug("TTLock helper record journal was reset; backfilling")
+                self._record_cursor = None
+                continue
+            if data.get("truncated"):
+                _LOGGER.debug("Lock records after %s were pruned by the helper", self._record_cursor)
+
+            records = data.get("records", [])
+            for record in records:
+                self._async_dispatch_record(record)
+            self._record_cursor = int(data.get("cursor", latest))
+            self._records_store.async_delay_save(
+                lambda: {"cursor": self._record_cursor}, SNAPSHOT_SAVE_DELAY
+            )
+            if "tail" in params or len(records) < RECORD_PAGE_SIZE:
+                return
+
+    @callback
+    def _async_dispatch_record(self, record: dict) -> None:
+        lock_id = record.get("lockId")
+        async_dispatcher_send(self.hass, record_signal(self._entry_id, lock_id), record)
+        self.hass.bus.async_fire(
+            EVENT_LOCK_RECORD,
+            {
+                "entry_id": self._entry_id,
+                "lock_id": lock_id,
+                "action": record.get("action", "other"),
+                "record_type": record.get("recordType"),
+                "username": record.get("username"),
+                "success": record.get("success"),
+                "lock_date": record.get("lockDate"),
+                "record_id": record.get("recordId"),
+            },
+        )
+
+    @callback
+    def async_note_activity(self) -> None:
+        """Poll fast for a while, e.g. after a lock command."""
+        if self._stream_connected:
+            return
+        self._fast_until = self.hass.loop.time() + FAST_POLL_WINDOW
+        self._idle_interval = DEFAULT_POLL_INTERVAL
+        fast = timedelta(seconds=self._apply_hint(FAST_POLL_INTERVAL))
+        if self.update_interval == fast:
+            return
+        self.update_interval = fast
+        # The pending refresh was timed with the old (possibly idle, minutes
+        # long) interval; replace it so the fast interval applies right away
+        if self._listeners:
+            self._schedule_refresh()
+
+    def _apply_hint(self, seconds: float) -> float:
+        # The helper's X-Poll-Interval is a floor: the operator's setting,
+        # stretched by the helper while its upstream slots are busy
+        if self._interval_hint:
+            return max(seconds, self._interval_hint)
+        return seconds
+
+    def _set_next_interval(self, changed: bool, failed: bool) -> None:
+        now = self.hass.loop.time()
+        if failed:
+            self._error_count += 1
+            seconds = min(
+                MAX_ERROR_POLL_INTERVAL,
+                DEFAULT_POLL_INTERVAL * 2 ** (self._error_count - 1),
+            )
+            seconds *= random.uniform(1 - POLL_JITTER, 1 + POLL_JITTER)
+        elif self._stream_connected:
+            self._error_count = 0
+            seconds = STREAM_RECONCILE_INTERVAL
+        else:
+            self._error_count = 0
+            if changed:
+                self._fast_until = now + FAST_POLL_WINDOW
+                self._idle_interval = DEFAULT_POLL_INTERVAL
+            if now < self._fast_until:
+                seconds = FAST_POLL_INTERVAL
+            else:
+                seconds = self._idle_interval
+                self._idle_interval = min(
+                    MAX_IDLE_POLL_INTERVAL, self._idle_interval * IDLE_BACKOFF_FACTOR
+                )
+
+        seconds = self._apply_hint(seconds)
+        _LOGGER.debug(
+            "Next TTLock poll in %.1fs (changed=%s, errors=%d)",
+            seconds,
+            changed,
+            self._error_count,
+        )
+        self.update_interval = timedelta(seconds=seconds)
+
     async def _async_update_data(self) -> list[dict]:
-        """Fetch data from the helper (lock list)."""
+        """Fetch data from the helper and adapt the polling interval."""
+        previous = self.data
+        started = self.hass.loop.time()
+        try:
+            locks = await self._async_fetch_locks()
+        except UpdateFailed as err:
+            self.stats.record_error(err, command=False)
+            self._set_next_interval(changed=False, failed=True)
+            raise
+        self.stats.refresh_ms.append(round((self.hass.loop.time() - started) * 1000, 1))
+        self._set_next_interval(changed=previous is not None and locks != previous, failed=False)
+        return locks
+
+    async def _async_fetch_locks(self) -> list[dict]:
+        """Fetch the lock list (or a delta) from the helper."""
         url = f"{self._base_url}/api/locks"
-        _LOGGER.debug("Fetching locks from %s", url)
+        params = None
+        if self._version is not None and self.data is not None:
+            params = {"since": str(self._version)}
+        _LOGGER.debug("Fetching locks from %s (%s)", url, params or "full")
 
         session: aiohttp.ClientSession = async_get_clientsession(self.hass)
 
         try:
             async with async_timeout.timeout(10):
-                async with session.get(url) as resp:
+                async with session.get(url, params=params) as resp:
                     text = await resp.text()
+                    self.stats.payload_bytes = len(text.encode("utf-8"))
                     if resp.status != 200:
                         raise UpdateFailed(
                             f"HTTP {resp.status} error when fetching locks: {text}"
@@ -53,31 +700,238 @@ class TTLockCoordinator(DataUpdateCoordinator[list[dict]]):
                         raise UpdateFailed(
                             f"Non-JSON response when fetching locks: {text}"
                         ) from err
+                    hint = resp.headers.get("X-Poll-Interval")
+                    try:
+                        self._interval_hint = float(hint) if hint else None
+                    except ValueError:
+                        self._interval_hint = None
         except Exception as err:
             raise UpdateFailed(f"Error communicating with TTLock helper: {err}") from err
 
-        locks = data.get("locks", [])
-        _LOGGER.debug("Got %d locks from helper", len(locks))
+        version = data.get("version")
+        self._version = int(version) if version is not None else None
+
+        if data.get("full", True) or self.data is None:
+            locks = data.get("locks", [])
+            _LOGGER.debug("Got %d locks from helper", len(locks))
+            return locks
+
+        locks = self._merge_delta(data)
+        _LOGGER.debug(
+            "Applied delta from helper: %d changed, %d removed (version %s)",
+            len(data.get("locks", [])),
+            len(data.get("removed", [])),
+            version,
+        )
         return locks
 
-    async def async_lock_action(self, lock_id: int, action: str) -> None:
+    def _merge_delta(self, delta: dict) -> list[dict]:
+        """Apply a /api/locks?since= delta to the current lock list."""
+        changed = {str(lock.get("lockId")): lock for lock in delta.get("locks", [])}
+        removed = {str(lock_id) for lock_id in delta.get("removed", [])}
+        merged: list[dict] = []
+        for lock in self.data:
+            key = str(lock.get("lockId"))
+            if key in removed:
+                continue
+            merged.append(changed.pop(key, lock))
+        merged.extend(changed.values())
+        return merged
+
+    async def async_lock_action(self, lock_id: int, action: str) -> bool:
         """
         Send lock/unlock command via helper.
 
-        Treat any 2xx as success; only raise on real errors.
+        Commands issued within COMMAND_BATCH_WINDOW (e.g. by a scene) are
+        collected and sent as one batch; each caller still gets its own result.
+        Only the last of several commands to the same lock in one batch is
+        sent: it returns True once it succeeded (or raises), while the earlier
+        ones return False straight away without anything being sent.
         """
         action = action.lower()
         if action not in ("lock", "unlock"):
             raise HomeAssistantError(f"Invalid action '{action}' for TTLock")
 
+        future: asyncio.Future = self.hass.loop.create_future()
+        self._pending_commands.append((lock_id, action, future))
+        if self._batch_flush is None:
+            self._batch_flush = self.hass.loop.call_later(
+                COMMAND_BATCH_WINDOW, self._async_flush_commands
+            )
+
+        started = self.hass.loop.time()
+        try:
+            return await future
+        except Exception as err:
+            self.stats.record_error(err, command=True)
+            raise
+        finally:
+            self.stats.command_ms.append(round((self.hass.loop.time() - started) * 1000, 1))
+
+    def diagnostics(self) -> dict:
+        """Link state for the diagnostics download (caller redacts)."""
+        return {
+            "base_url": self._base_url,
+            "lock_count": len(self.data or []),
+            "version": self._version,
+            "update_interval": self.update_interval.total_seconds()
+            if self.update_interval
+            else None,
+            "interval_hint": self._interval_hint,
+            "stream_connected": self._stream_connected,
+            "record_cursor": self._record_cursor,
+            "batch_supported": self._batch_supported,
+            "last_update_success": self.last_update_success,
+            "stats": self.stats.as_dict(),
+        }
+
+    @callback
+    def _async_flush_commands(self) -> None:
+        self._batch_flush = None
+        pending, self._pending_commands = self._pending_commands, []
+        if pending:
+            self.hass.async_create_task(self._async_run_commands(pending))
+
+    async def _async_run_commands(
+        self, pending: list[tuple[int, str, asyncio.Future]]
+    ) -> None:
+        # Last command per lock wins; earlier ones are reported as superseded
+        commands: dict[str, tuple[int, str, list[asyncio.Future]]] = {}
+        for lock_id, action, future in pending:
+            key = str(lock_id)
+            if key in commands:
+                superseded = commands.pop(key)[2][0]
+                if not superseded.done():
+                    superseded.set_result(False)
+                self.stats.superseded_commands += 1
+            commands[key] = (lock_id, action, [future])
+        batch = list(commands.values())
+
+        if len(batch) > 1 and self._batch_supported is not False:
+            try:
+                if await self._async_send_batch(batch):
+                    return
+            except Exception as err:
+                error = self._as_ha_error(err)
+                for _, _, futures in batch:
+                    self._resolve(futures, error)
+                return
+
+        results = await asyncio.gather(
+            *(self._async_send_command(lock_id, action) for lock_id, action, _ in batch),
+            return_exceptions=True,
+        )
+        for (_, _, futures), result in zip(batch, results):
+            self._resolve(futures, result if isinstance(result, BaseException) else None)
+
+    @staticmethod
+    def _as_ha_error(err: BaseException) -> HomeAssistantError:
+        if isinstance(err, HomeAssistantError):
+            return err
+        error = HomeAssistantError(f"Error talking to TTLock helper: {err}")
+        error.__cause__ = err
+        return error
+
+    @staticmethod
+    def _resolve(futures: list[asyncio.Future], error: BaseException | None) -> None:
+        for future in futures:
+            if future.done():
+                continue
+            if error is None:
+                future.set_result(True)
+            else:
+                future.set_exception(error)
+
+    async def _async_send_batch(
+        self, batch: list[tuple[int, str, list[asyncio.Future]]]
+    ) -> bool:
+        """Send commands as one helper batch; False if the helper lacks it."""
+        url = f"{self._base_url}/api/locks/batch"
+        trace_id = uuid.uuid4().hex
+        headers = {"X-Trace-Id": trace_id}
+        body = {
+            "commands": [{"lockId": lock_id, "action": action} for lock_id, action, _ in batch]
+        }
+        _LOGGER.debug("Sending batch of %d TTLock commands (trace %s)", len(batch), trace_id)
+
+        session: aiohttp.ClientSession = async_get_clientsession(self.hass)
+        async with async_timeout.timeout(15):
+            async with session.post(
+                url,
+                params={"wait": "8"},
+                json=body,
+                # Lets the helper recognise a resent batch instead of re-running it
+                headers={**headers, "Idempotency-Key": trace_id},
+            ) as resp:
+                if resp.status in (404, 405):
+                    _LOGGER.debug("TTLock helper has no batch endpoint; sending individually")
+                    self._batch_supported = False
+                    return False
+                text = await resp.text()
+                if resp.status < 200 or resp.status >= 300:
+                    raise HomeAssistantError(f"TTLock helper HTTP {resp.status}: {text}")
+                data = await resp.json()
+
+        self._batch_supported = True
+        self.async_note_activity()
+        results = data.get("results", [])
+
+        async def finish(index: int, lock_id: int, action: str, futures) -> None:
+            try:
+                job = results[index].get("job") or {}
+                if job.get("status") == "failed":
+                    raise HomeAssistantError(
+                        f"TTLock {action} failed for lock {lock_id}: {job.get('error')}"
+                    )
+                if job.get("status") != "succeeded":
+                    await self._async_wait_for_job(session, job["id"], lock_id, action, headers)
+            except Exception as err:
+                self._resolve(futures, self._as_ha_error(err))
+            else:
+                self._resolve(futures, None)
+
+        await asyncio.gather(
+            *(finish(i, lock_id, action, futures) for i, (lock_id, action, futures) in enumerate(batch))
+        )
+        return True
+
+    async def _async_send_command(self, lock_id: int, action: str) -> None:
+        """
+        Send a single lock/unlock command via helper.
+
+        The command is submitted as an async job (HTTP 202) and its status is
+        long-polled, so slow gateway round-trips don't trip the request timeout.
+        Older helpers answer synchronously; treat any other 2xx as success.
+        """
         url = f"{self._base_url}/api/locks/{lock_id}/{action}"
-        _LOGGER.debug("Calling TTLock helper action %s for lock %s at %s", action, lock_id, url)
+        # Trace id ties this command to the helper's spans (GET /api/traces)
+        trace_id = uuid.uuid4().hex
+        headers = {"X-Trace-Id": trace_id}
+        _LOGGER.debug(
+            "Calling TTLock helper action %s for lock %s at %s (trace %s)",
+            action,
+            lock_id,
+            url,
+            trace_id,
+        )
 
         session: aiohttp.ClientSession = async_get_clientsession(self.hass)
+        data = None
+        started = self.hass.loop.time()
 
         try:
             async with async_timeout.timeout(15):
-                async with session.post(url) as resp:
+                async with session.post(
+                    url,
+                    params={"async": "1"},
+                    headers={**headers, "Idempotency-Key": trace_id},
+                ) as resp:
+                    status = resp.status
+                    _LOGGER.debug(
+                        "TTLock trace %s submit Server-Timing: %s",
+                        trace_id,
+                        resp.headers.get("Server-Timing"),
+                    )
                     text = await resp.text()
                     if resp.status < 200 or resp.status >= 300:
                         _LOGGER.error(
@@ -107,6 +961,20 @@ class TTLockCoordinator(DataUpdateCoordinator[list[dict]]):
                             text,
                         )
 
+            self.async_note_activity()
+
+            if status == 202 and isinstance(data, dict) and data.get("job"):
+                await self._async_wait_for_job(
+                    session, data["job"]["id"], lock_id, action, headers
+                )
+            _LOGGER.debug(
+                "TTLock trace %s: %s of lock %s took %.0f ms end to end",
+                trace_id,
+                action,
+                lock_id,
+                (self.hass.loop.time() - started) * 1000,
+            )
+
         except HomeAssistantError:
             raise
         except Exception as err:
@@ -119,3 +987,52 @@ class TTLockCoordinator(DataUpdateCoordinator[list[dict]]):
             raise HomeAssistantError(
                 f"Error talking to TTLock helper: {err}"
             ) from err
+
+    async def _async_wait_for_job(
+        self,
+        session: aiohttp.ClientSession,
+        job_id: str,
+        lock_id: int,
+        action: str,
+        headers: dict[str, str] | None = None,
+    ) -> dict:
+        """Long-poll a helper command job until it finishes."""
+        url = f"{self._base_url}/api/jobs/{job_id}"
+        deadline = self.hass.loop.time() + COMMAND_JOB_TIMEOUT
+
+        while True:
+            remaining = deadline - self.hass.loop.time()
+            if remaining <= 0:
+                raise HomeAssistantError(
+                    f"Timed out waiting for TTLock {action} of lock {lock_id}"
+                )
+            wait = max(1, int(min(JOB_POLL_WAIT, remaining)))
+
+            async with self._job_polls, async_timeout.timeout(wait + 5):
+                async with session.get(
+                    url, params={"wait": str(wait)}, headers=headers
+                ) as resp:
+                    text = await resp.text()
+                    retry_after = resp.headers.get("Retry-After", "")
+                    if resp.status == 503 and retry_after.isdigit():
+                        data = {}  # shed by the helper; try again shortly
+                    elif resp.status != 200:
+                        raise HomeAssistantError(
+                            f"TTLock helper HTTP {resp.status} for job {job_id}: {text}"
+                        )
+                    else:
+                        data = await resp.json()
+
+            job = data.get("job") or {}
+            _LOGGER.debug("TTLock job %s for lock %s: %s", job_id, lock_id, job.get("status"))
+            if job.get("status") == "succeeded":
+                return job
+            if job.get("status") == "failed":
+                raise HomeAssistantError(
+                    f"TTLock {action} failed for lock {lock_id}: {job.get('error')}"
+                )
+            if retry_after.isdigit():
+                # The helper answered without long-polling (too many waiters)
+                await asyncio.sleep(
+                    min(int(retry_after), max(0, deadline - self.hass.loop.time()))
+                )
@@ -0,0 +1,39 @@
+from __future__ import annotations
+
+from typing import Any
+
+from homeassistant.components.diagnostics import async_redact_data
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.core import HomeAssistant
+
+from .const import DOMAIN
+from .coordinator import TTLockCoordinator
+
+# Lock list entries from TTLock carry key material; never export it
+TO_REDACT = {
+    "lockData",
+    "lockKey",
+    "aesKeyStr",
+    "adminPwd",
+    "noKeyPwd",
+    "deletePwd",
+    "keyboardPwd",
+    "lastOperator",
+    "lockMac",
+    "access_token",
+    "refresh_token",
+    "client_secret",
+    "password",
+}
+
+
+async def async_get_config_entry_diagnostics(
+    hass: HomeAssistant, entry: ConfigEntry
+) -> dict[str, Any]:
+    """Return diagnostics for a config entry."""
+    coordinator: TTLockCoordinator = hass.data[DOMAIN][entry.entry_id]
+    return {
+        "entry": async_redact_data(dict(entry.data), TO_REDACT),
+        "link": coordinator.diagnostics(),
+        "locks": async_redact_data(coordinator.data or [], TO_REDACT),
+    }
@@ -0,0 +1,39 @@
+from __future__ import annotations
+
+from typing import Any
+
+from homeassistant.core import callback
+from homeassistant.helpers.update_coordinator import CoordinatorEntity
+
+from .coordinator import TTLockCoordinator
+
+
+class TTLockEntity(CoordinatorEntity[TTLockCoordinator]):
+    """Base for entities backed by one lock in the coordinator data."""
+
+    # Lock fields this entity renders; updates touching none of them are skipped
+    _watched_fields: frozenset[str] = frozenset()
+
+    def __init__(
+        self,
+        coordinator: TTLockCoordinator,
+        entry_id: str,
+        lock_id: int,
+    ) -> None:
+        super().__init__(coordinator)
+        self._entry_id = entry_id
+        self._lock_id = lock_id
+
+    @property
+    def available(self) -> bool:
+        # Keep showing the last known state through short helper outages
+        return self.coordinator.data_usable
+
+    @property
+    def _lock_data(self) -> dict[str, Any] | None:
+        return self.coordinator.get_lock(self._lock_id)
+
+    @callback
+    def _handle_coordinator_update(self) -> None:
+        if self.coordinator.lock_changed(self._lock_id, self._watched_fields):
+            super()._handle_coordinator_update()
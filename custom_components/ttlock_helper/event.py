@@ -0,0 +1,100 @@
+from __future__ import annotations
+
+import logging
+
+from homeassistant.components.event import EventEntity
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.helpers.dispatcher import async_dispatcher_connect
+from homeassistant.helpers.entity import DeviceInfo
+from homeassistant.helpers.entity_platform import AddEntitiesCallback
+
+from .const import DOMAIN
+from .coordinator import TTLockCoordinator, record_signal
+from .entity import TTLockEntity
+
+_LOGGER = logging.getLogger(__name__)
+
+
+async def async_setup_entry(
+    hass: HomeAssistant,
+    entry: ConfigEntry,
+    async_add_entities: AddEntitiesCallback,
+) -> None:
+    """Set up TTLock activity event entities from a config entry."""
+    coordinator: TTLockCoordinator = hass.data[DOMAIN][entry.entry_id]
+
+    @callback
+    def _async_add_locks(lock_ids: set[str]) -> None:
+        entities = [
+            TTLockActivityEvent(coordinator, entry.entry_id, lock["lockId"])
+            for lock in coordinator.data
+            if str(lock.get("lockId")) in lock_ids
+        ]
+        _LOGGER.debug("Adding %d TTLock activity entities", len(entities))
+        async_add_entities(entities)
+
+    _async_add_locks(set(coordinator.locks_by_id))
+    entry.async_on_unload(coordinator.async_add_new_lock_listener(_async_add_locks))
+
+
+class TTLockActivityEvent(TTLockEntity, EventEntity):
+    """Fires once per lock record (who locked/unlocked the door, and when)."""
+
+    _watched_fields = frozenset({"lockAlias", "modelNum"})
+    _attr_event_types = ["lock", "unlock", "other"]
+    _attr_icon = "mdi:history"
+
+    def __init__(
+        self,
+        coordinator: TTLockCoordinator,
+        entry_id: str,
+        lock_id: int,
+    ) -> None:
+        super().__init__(coordinator, entry_id, lock_id)
+        self._attr_unique_id = f"{DOMAIN}_{entry_id}_{lock_id}_activity"
+
+    async def async_added_to_hass(self) -> None:
+        await super().async_added_to_hass()
+        self.async_on_remove(
+            async_dispatcher_connect(
+                self.hass,
+                record_signal(self._entry_id, self._lock_id),
+                self._async_handle_record,
+            )
+        )
+
+    @callback
+    def _async_handle_record(self, record: dict) -> None:
+        action = record.get("action")
+        if action not in self._attr_event_types:
+            action = "other"
+        self._trigger_event(
+            action,
+            {
+                "record_type": record.get("recordType"),
+                "username": record.get("username"),
+                "success": record.get("success"),
+                "lock_date": record.get("lockDate"),
+                "record_id": record.get("recordId"),
+            },
+        )
+        self.async_write_ha_state()
+
+    @property
+    def name(self) -> str | None:
+        data = self._lock_data
+        base = "TTLock"
+        if data:
+            base = data.get("lockAlias") or base
+        return f"{base} Activity"
+
+    @property
+    def device_info(self) -> DeviceInfo:
+        """Attach to the lock's device."""
+        data = self._lock_data or {}
+        return DeviceInfo(
+            identifiers={(DOMAIN, str(self._lock_id))},
+            manufacturer="TTLock",
+            model=data.get("modelNum") or "TTLock",
+        )
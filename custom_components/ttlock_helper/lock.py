@@ -1,19 +1,16 @@
 from __future__ import annotations
 
 import logging
-from typing import Any
 
 from homeassistant.components.lock import LockEntity
 from homeassistant.config_entries import ConfigEntry
-from homeassistant.core import HomeAssistant
+from homeassistant.core import HomeAssistant, callback
 from homeassistant.helpers.entity import DeviceInfo
 from homeassistant.helpers.entity_platform import AddEntitiesCallback
-from homeassistant.helpers.update_coordinator import (
-    CoordinatorEntity,
-)
 
 from .const import DOMAIN
 from .coordinator import TTLockCoordinator
+from .entity import TTLockEntity
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -26,40 +23,35 @@ async def async_setup_entry(
     """Set up TTLock locks from a config entry."""
     coordinator: TTLockCoordinator = hass.data[DOMAIN][entry.entry_id]
 
-    entities: list[TTLockLockEntity] = []
+    @callback
+    def _async_add_locks(lock_ids: set[str]) -> None:
+        entities = [
+            TTLockLockEntity(coordinator, entry.entry_id, lock["lockId"])
+            for lock in coordinator.data
+            if str(lock.get("lockId")) in lock_ids
+        ]
+        _LOGGER.debug("Adding %d TTLock lock entities", len(entities))
+        async_add_entities(entities)
 
-    for lock in coordinator.data:
-        lock_id = lock.get("lockId")
-        if lock_id is None:
-            continue
-        entities.append(TTLockLockEntity(coordinator, entry.entry_id, lock_id))
+    _async_add_locks(set(coordinator.locks_by_id))
+    entry.async_on_unload(coordinator.async_add_new_lock_listener(_async_add_locks))
 
-    _LOGGER.debug("Adding %d TTLock lock entities", len(entities))
-    async_add_entities(entities)
 
-
-class TTLockLockEntity(CoordinatorEntity[TTLockCoordinator], LockEntity):
+class TTLockLockEntity(TTLockEntity, LockEntity):
     """Representation of a TTLock lock via helper."""
 
+    _watched_fields = frozenset({"lockAlias", "modelNum", "isLocked"})
+
     def __init__(
         self,
         coordinator: TTLockCoordinator,
         entry_id: str,
         lock_id: int,
     ) -> None:
-        super().__init__(coordinator)
-        self._entry_id = entry_id
-        self._lock_id = lock_id
+        super().__init__(coordinator, entry_id, lock_id)
         self._attr_unique_id = f"{DOMAIN}_{entry_id}_{lock_id}"
         self._attr_assumed_state = True
 
-    @property
-    def _lock_data(self) -> dict[str, Any] | None:
-        for lock in self.coordinator.data:
-            if lock.get("lockId") == self._lock_id:
-                return lock
-        return None
-
     @property
     def name(self) -> str | None:
         data = self._lock_data
@@ -92,10 +84,39 @@ class TTLockLockEntity(CoordinatorEntity[TTLockCoordinator], LockEntity):
 
     async def async_lock(self, **kwargs):
         _LOGGER.debug("Locking TTLock %s", self._lock_id)
-        await self.coordinator.async_lock_action(self._lock_id, "lock")
-        await self.coordinator.async_request_refresh()
+        await self._async_send_command("lock")
 
     async def async_unlock(self, **kwargs):
         _LOGGER.debug("Unlocking TTLock %s", self._lock_id)
-        await self.coordinator.async_lock_action(self._lock_id, "unlock")
-        await self.coordinator.async_request_refresh()
+        await self._async_send_command("unlock")
+
+    async def _async_send_command(self, action: str) -> None:
+        """
+        Show locking/unlocking immediately and apply the result locally.
+
+        On failure the previous state is restored. Instead of a full refresh,
+        a debounced verification of just this lock is scheduled. A command
+        superseded by a later one to this lock leaves the state to that one.
+        """
+        target = action == "lock"
+        self._attr_is_locking = target
+        self._attr_is_unlocking = not target
+        previous = self.coordinator.async_set_lock_state(self._lock_id, target)
+        self.async_write_ha_state()
+
+        try:
+            sent = await self.coordinator.async_lock_action(self._lock_id, action)
+        except Exception:
+            # previous may be a superseded command's optimistic state; read it back
+            self.coordinator.async_set_lock_state(self._lock_id, previous)
+            self.coordinator.async_schedule_verify(self._lock_id)
+            raise
+        else:
+            if sent:
+                # A poll may have landed mid-command with the old value
+                self.coordinator.async_set_lock_state(self._lock_id, target)
+                self.coordinator.async_schedule_verify(self._lock_id)
+        finally:
+            self._attr_is_locking = False
+            self._attr_is_unlocking = False
+            self.async_write_ha_state()
@@ -1,26 +1,76 @@
 from __future__ import annotations
 
+from dataclasses import dataclass
+from datetime import timedelta
 import logging
-from typing import Any
 
 from homeassistant.components.sensor import (
     SensorEntity,
+    SensorEntityDescription,
     SensorDeviceClass,
     SensorStateClass,
 )
 from homeassistant.config_entries import ConfigEntry
-from homeassistant.const import PERCENTAGE
-from homeassistant.core import HomeAssistant
+from homeassistant.const import PERCENTAGE, EntityCategory, UnitOfInformation, UnitOfTime
+from homeassistant.core import HomeAssistant, callback
 from homeassistant.helpers.entity import DeviceInfo
 from homeassistant.helpers.entity_platform import AddEntitiesCallback
+from homeassistant.helpers.event import async_track_time_interval
 from homeassistant.helpers.update_coordinator import CoordinatorEntity
 
-from .const import DOMAIN
+from .const import DIAGNOSTIC_UPDATE_INTERVAL, DOMAIN
 from .coordinator import TTLockCoordinator
+from .entity import TTLockEntity
 
 _LOGGER = logging.getLogger(__name__)
 
 
+@dataclass(frozen=True, kw_only=True)
+class TTLockDiagnosticDescription(SensorEntityDescription):
+    """Diagnostic sensor reading one key of coordinator.diagnostics()."""
+
+    stats_key: str
+
+
+_LATENCY = {
+    "native_unit_of_measurement": UnitOfTime.MILLISECONDS,
+    "device_class": SensorDeviceClass.DURATION,
+    "state_class": SensorStateClass.MEASUREMENT,
+}
+_COUNTER = {"state_class": SensorStateClass.TOTAL_INCREASING}
+
+DIAGNOSTIC_SENSORS: tuple[TTLockDiagnosticDescription, ...] = (
+    TTLockDiagnosticDescription(
+        key="refresh_latency", name="Refresh latency", stats_key="refresh_ms_last", **_LATENCY
+    ),
+    TTLockDiagnosticDescription(
+        key="command_latency_p50", name="Command latency p50", stats_key="command_ms_p50", **_LATENCY
+    ),
+    TTLockDiagnosticDescription(
+        key="command_latency_p95", name="Command latency p95", stats_key="command_ms_p95", **_LATENCY
+    ),
+    TTLockDiagnosticDescription(
+        key="refresh_errors", name="Refresh errors", stats_key="refresh_errors", **_COUNTER
+    ),
+    TTLockDiagnosticDescription(
+        key="command_errors", name="Command errors", stats_key="command_errors", **_COUNTER
+    ),
+    TTLockDiagnosticDescription(key="timeouts", name="Timeouts", stats_key="timeouts", **_COUNTER),
+    TTLockDiagnosticDescription(
+        key="payload_size",
+        name="Lock list payload size",
+        stats_key="payload_bytes",
+        native_unit_of_measurement=UnitOfInformation.BYTES,
+        device_class=SensorDeviceClass.DATA_SIZE,
+        state_class=SensorStateClass.MEASUREMENT,
+    ),
+    TTLockDiagnosticDescription(
+        key="lock_count", name="Lock count", stats_key="lock_count",
+        state_class=SensorStateClass.MEASUREMENT,
+    ),
+)
+
+
 async def async_setup_entry(
     hass: HomeAssistant,
     entry: ConfigEntry,
@@ -29,21 +79,29 @@ async def async_setup_entry(
     """Set up TTLock battery sensors from a config entry."""
     coordinator: TTLockCoordinator = hass.data[DOMAIN][entry.entry_id]
 
-    entities: list[TTLockBatterySensor] = []
+    @callback
+    def _async_add_locks(lock_ids: set[str]) -> None:
+        entities = [
+            TTLockBatterySensor(coordinator, entry.entry_id, lock["lockId"])
+            for lock in coordinator.data
+            if str(lock.get("lockId")) in lock_ids
+        ]
+        _LOGGER.debug("Adding %d TTLock battery sensors", len(entities))
+        async_add_entities(entities)
 
-    for lock in coordinator.data:
-        lock_id = lock.get("lockId")
-        if lock_id is None:
-            continue
-        entities.append(TTLockBatterySensor(coordinator, entry.entry_id, lock_id))
+    _async_add_locks(set(coordinator.locks_by_id))
+    entry.async_on_unload(coordinator.async_add_new_lock_listener(_async_add_locks))
 
-    _LOGGER.debug("Adding %d TTLock battery sensors", len(entities))
-    async_add_entities(entities)
+    async_add_entities(
+        TTLockHelperDiagnosticSensor(coordinator, entry.entry_id, description)
+        for description in DIAGNOSTIC_SENSORS
+    )
 
 
-class TTLockBatterySensor(CoordinatorEntity[TTLockCoordinator], SensorEntity):
+class TTLockBatterySensor(TTLockEntity, SensorEntity):
     """Battery level sensor for TTLock."""
 
+    _watched_fields = frozenset({"lockAlias", "electricQuantity"})
     _attr_device_class = SensorDeviceClass.BATTERY
     _attr_native_unit_of_measurement = PERCENTAGE
     _attr_state_class = SensorStateClass.MEASUREMENT
@@ -54,18 +112,9 @@ class TTLockBatterySensor(CoordinatorEntity[TTLockCoordinator], SensorEntity):
         entry_id: str,
         lock_id: int,
     ) -> None:
-        super().__init__(coordinator)
-        self._entry_id = entry_id
-        self._lock_id = lock_id
+        super().__init__(coordinator, entry_id, lock_id)
         self._attr_unique_id = f"{DOMAIN}_{entry_id}_{lock_id}_battery"
 
-    @property
-    def _lock_data(self) -> dict[str, Any] | None:
-        for lock in self.coordinator.data:
-            if lock.get("lockId") == self._lock_id:
-                return lock
-        return None
-
     @property
     def name(self) -> str | None:
         data = self._lock_data
@@ -98,3 +147,61 @@ class TTLockBatterySensor(CoordinatorEntity[TTLockCoordinator], SensorEntity):
             manufacturer="TTLock",
             model="TTLock Cloud",
         )
+
+
+class TTLockHelperDiagnosticSensor(CoordinatorEntity[TTLockCoordinator], SensorEntity):
+    """
+    Performance figure of the link to the helper.
+
+    Written on every coordinator update and at least every
+    DIAGNOSTIC_UPDATE_INTERVAL, so it stays current while polling is idle
+    (up to 5 minutes apart) or failing.
+    """
+
+    entity_description: TTLockDiagnosticDescription
+    _attr_entity_category = EntityCategory.DIAGNOSTIC
+
+    def __init__(
+        self,
+        coordinator: TTLockCoordinator,
+        entry_id: str,
+        description: TTLockDiagnosticDescription,
+    ) -> None:
+        super().__init__(coordinator)
+        self.entity_description = description
+        self._entry_id = entry_id
+        self._attr_unique_id = f"{DOMAIN}_{entry_id}_diag_{description.key}"
+        self._attr_name = f"TTLock Helper {description.name}"
+
+    async def async_added_to_hass(self) -> None:
+        await super().async_added_to_hass()
+        self.async_on_remove(
+            async_track_time_interval(
+                self.hass, self._async_sample, timedelta(seconds=DIAGNOSTIC_UPDATE_INTERVAL)
+            )
+        )
+
+    @callback
+    def _async_sample(self, _now) -> None:
+        self.async_write_ha_state()
+
+    @property
+    def available(self) -> bool:
+        # Stay available during outages: that's when error counts matter
+        return True
+
+    @property
+    def native_value(self) -> float | int | None:
+        key = self.entity_description.stats_key
+        if key == "lock_count":
+            return len(self.coordinator.data or [])
+        return self.coordinator.stats.as_dict().get(key)
+
+    @property
+    def device_info(self) -> DeviceInfo:
+        return DeviceInfo(
+            identifiers={(DOMAIN, self._entry_id)},
+            name="TTLock Helper",
+            manufacturer="TTLock",
+            model="TTLock Cloud",
+        )
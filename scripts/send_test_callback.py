@@ -0,0 +1,51 @@
+"""
+Post a sample TTLock lock-record callback to a running helper.
+
+Usage:
+    python scripts/send_test_callback.py <lock_id> [unlock|lock] [--url http://localhost:8005] [--token SECRET]
+"""
+import argparse
+import json
+import time
+
+import requests
+
+# recordType 1 = unlock by app, 11 = lock by app
+RECORD_TYPES = {"unlock": 1, "lock": 11}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Send a sample TTLock callback")
+    parser.add_argument("lock_id", type=int)
+    parser.add_argument("action", nargs="?", default="unlock", choices=sorted(RECORD_TYPES))
+    parser.add_argument("--url", default="http://localhost:8005")
+    parser.add_argument("--token", default="")
+    parser.add_argument("--username", default="test_user")
+    args = parser.parse_args()
+
+    now_ms = int(time.time() * 1000)
+    records = [
+        {
+            "lockId": args.lock_id,
+            "recordType": RECORD_TYPES[args.action],
+            "success": 1,
+            "username": args.username,
+            "lockDate": now_ms,
+            "serverDate": now_ms,
+            "electricQuantity": 80,
+        }
+    ]
+
+    url = f"{args.url.rstrip('/')}/api/callback"
+    params = {"token": args.token} if args.token else None
+    resp = requests.post(
+        url,
+        params=params,
+        data={"lockId": args.lock_id, "notifyType": 1, "records": json.dumps(records)},
+        timeout=15,
+    )
+    print(f"HTTP {resp.status_code}: {resp.text}")
+
+
+if __name__ == "__main__":
+    main()
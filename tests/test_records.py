@@ -0,0 +1,43 @@
+import json
+
+from records import PASSCODE_MARKER, RecordJournal
+
+
+def record(record_id: int, lock_date: int, **extra) -> dict:
+    return {"recordId": record_id, "lockDate": lock_date, "recordType": 7, "success": 1, **extra}
+
+
+def test_quiet_lock_keeps_cursor_after_eviction(tmp_path):
+    journal = RecordJournal(tmp_path / "records.jsonl", size=10)
+    journal.append(1, [record(1, 1000)])
+    journal.append(2, [record(100 + i, 2000 + i) for i in range(30)])
+    assert journal.last_time(1) == 1000
+
+    reopened = RecordJournal(tmp_path / "records.jsonl", size=10)
+    assert reopened.last_time(1) == 1000
+    assert reopened.last_time(2) == 2029
+    assert reopened.append(1, [record(1, 1000)]) == []
+
+
+def test_duplicates_are_skipped(tmp_path):
+    journal = RecordJournal(tmp_path / "records.jsonl")
+    first = journal.append(1, [record(1, 1000), record(2, 1001)])
+    assert [entry["seq"] for entry in first] == [1, 2]
+    again = journal.append(1, [record(2, 1001), record(3, 1002)])
+    assert [entry["recordId"] for entry in again] == [3]
+
+
+def test_passcodes_are_not_journaled(tmp_path):
+    journal = RecordJournal(tmp_path / "records.jsonl")
+    [entry] = journal.append(1, [record(1, 1000, keyboardPwd="123456")])
+    assert entry["keyboardPwd"] == PASSCODE_MARKER
+    assert "123456" not in (tmp_path / "records.jsonl").read_text()
+
+
+def test_old_journal_is_redacted_on_load(tmp_path):
+    path = tmp_path / "records.jsonl"
+    path.write_text(json.dumps(dict(record(1, 1000, keyboardPwd="123456"), lockId=1, seq=1)) + "\n")
+    journal = RecordJournal(path)
+    assert journal.tail(1)["records"][0]["keyboardPwd"] == PASSCODE_MARKER
+    assert "123456" not in path.read_text()
+    assert journal.last_time(1) == 1000
@@ -0,0 +1,84 @@
+from datetime import datetime
+
+import pytest
+
+from scheduler import Scheduler, cron_matches, next_run, parse_cron, validate_schedule
+
+
+def test_parse_cron_fields():
+    minute, hour, dom, month, dow = parse_cron("*/15 22 1-3 * 1,7")
+    assert minute == {0, 15, 30, 45}
+    assert hour == {22}
+    assert dom == {1, 2, 3}
+    assert month == set(range(1, 13))
+    assert dow == {0, 1}  # 7 is Sunday too
+
+
+@pytest.mark.parametrize(
+    "expr, minutes",
+    [
+        ("5/10 * * * *", {5, 15, 25, 35, 45, 55}),
+        ("10-30/10 * * * *", {10, 20, 30}),
+        ("0,30 * * * *", {0, 30}),
+    ],
+)
+def test_parse_cron_steps(expr, minutes):
+    assert parse_cron(expr)[0] == minutes
+
+
+def test_parse_cron_step_on_day_of_week_stays_in_range():
+    assert parse_cron("0 0 * * 1/2")[4] == {1, 3, 5}
+
+
+@pytest.mark.parametrize(
+    "expr",
+    ["", "* * * *", "60 * * * *", "* 24 * * *", "* * 0 * *", "5-1 * * * *", "*/0 * * * *", "a * * * *"],
+)
+def test_parse_cron_rejects_invalid(expr):
+    with pytest.raises(ValueError):
+        parse_cron(expr)
+
+
+def test_cron_matches_day_of_month_or_day_of_week():
+    # Both restricted: either may match (2024-01-01 was a Monday)
+    assert cron_matches("0 8 15 * 1", datetime(2024, 1, 1, 8, 0))
+    assert cron_matches("0 8 15 * 1", datetime(2024, 1, 15, 8, 0))
+    assert not cron_matches("0 8 15 * 1", datetime(2024, 1, 2, 8, 0))
+    # Only one restricted: it alone decides
+    assert not cron_matches("0 8 * * 1", datetime(2024, 1, 2, 8, 0))
+
+
+def test_next_run_same_day_and_rollover():
+    after = datetime(2024, 1, 1, 21, 59, 30)
+    assert next_run("0 22 * * *", after) == datetime(2024, 1, 1, 22, 0)
+    assert next_run("0 22 * * *", datetime(2024, 1, 1, 22, 0)) == datetime(2024, 1, 2, 22, 0)
+    assert next_run("5/10 * * * *", datetime(2024, 1, 1, 10, 6)) == datetime(2024, 1, 1, 10, 15)
+
+
+def test_next_run_month_and_weekday():
+    assert next_run("30 6 * 3 *", datetime(2024, 1, 1)) == datetime(2024, 3, 1, 6, 30)
+    # Next Saturday after Monday 2024-01-01
+    assert next_run("0 9 * * 6", datetime(2024, 1, 1)) == datetime(2024, 1, 6, 9, 0)
+
+
+def test_next_run_none_for_impossible_date():
+    assert next_run("0 0 31 2 *", datetime(2024, 1, 1)) is None
+
+
+def test_validate_schedule_requires_boolean_enabled():
+    base = {"cron": "0 22 * * *", "action": "lock", "all": True}
+    spec, errors = validate_schedule(base)
+    assert not errors and spec["enabled"] is True
+    spec, errors = validate_schedule({"enabled": False}, partial=True)
+    assert spec == {"enabled": False} and not errors
+    _, errors = validate_schedule(dict(base, enabled="false"))
+    assert errors == ["enabled must be true or false"]
+
+
+def test_delete_during_run_leaves_no_runs_file(tmp_path):
+    scheduler = Scheduler(tmp_path, lambda lock_id, action: {"success": True}, lambda: [])
+    schedule = scheduler.create({"cron": "0 22 * * *", "action": "lock", "all": False, "lockIds": [1],
+                                 "name": "Night", "enabled": True, "concurrency": 1})
+    scheduler.delete(schedule["id"])
+    scheduler._run(schedule, trigger="manual")
+    assert list(tmp_path.iterdir()) == []
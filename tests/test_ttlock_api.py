@@ -0,0 +1,151 @@
+import json
+import threading
+
+import pytest
+import requests
+
+import ttlock_api
+from ttlock_api import TTLockError, classify_exception, classify_response
+
+
+def make_response(status: int, body: dict | str = "") -> requests.Response:
+    resp = requests.Response()
+    resp.status_code = status
+    resp._content = (json.dumps(body) if isinstance(body, dict) else body).encode()
+    return resp
+
+
+@pytest.mark.parametrize(
+    "status, body, expected",
+    [
+        (200, {"errcode": 0}, (None, True)),
+        (200, {"list": []}, (None, True)),
+        (401, "", ("token", True)),
+        (200, {"errcode": 10003}, ("token", True)),
+        (429, "", ("retryable", False)),
+        (503, "", ("retryable", False)),
+        (500, "", ("retryable", True)),
+        (502, "", ("retryable", True)),
+        (200, {"errcode": -3003}, ("retryable", False)),
+        (200, {"errcode": 90000}, ("retryable", True)),
+        (400, "", ("fatal", True)),
+        (200, {"errcode": -2012}, (None, True)),
+    ],
+)
+def test_classify_response(status, body, expected):
+    assert classify_response(make_response(status, body)) == expected
+
+
+def test_classify_exception():
+    assert classify_exception(requests.ConnectTimeout()) == ("retryable", False)
+    assert classify_exception(requests.ReadTimeout()) == ("retryable", True)
+    assert classify_exception(requests.ConnectionError()) == ("retryable", True)
+    assert classify_exception(requests.TooManyRedirects()) == ("fatal", True)
+
+
+@pytest.fixture
+def sent(monkeypatch):
+    """Replace the network with a queue of responses; returns the list of sent bodies."""
+    calls: list[dict] = []
+    responses: list[requests.Response] = []
+
+    def fake_send(endpoint, url, data, timeout, hedge):
+        calls.append(data)
+        return responses.pop(0) if len(responses) > 1 else responses[0]
+
+    monkeypatch.setattr(ttlock_api, "_send", fake_send)
+    monkeypatch.setattr(ttlock_api, "_retry_delay", lambda attempt, resp: 0)
+    return calls, responses
+
+
+def operate(action: str = "lock") -> dict:
+    return ttlock_api.operate_lock(
+        base_url="https://api.example", client_id="c", access_token="t", lock_id=1, action=action
+    )
+
+
+def test_busy_gateway_is_retried_until_it_succeeds(sent):
+    calls, responses = sent
+    responses.extend([make_response(200, {"errcode": -3003}), make_response(200, {"errcode": 0})])
+    assert operate() == {"errcode": 0}
+    assert len(calls) == 2
+
+
+def test_exhausted_retries_raise(sent):
+    calls, responses = sent
+    responses.append(make_response(200, {"errcode": -3003, "errmsg": "gateway busy"}))
+    with pytest.raises(TTLockError) as err:
+        operate()
+    assert err.value.errcode == -3003
+    assert err.value.kind == "fatal"
+    assert len(calls) == ttlock_api.MAX_ATTEMPTS
+
+
+def test_processed_failure_is_not_resent_for_commands(sent):
+    calls, responses = sent
+    responses.append(make_response(200, {"errcode": 90000}))
+    with pytest.raises(TTLockError) as err:
+        operate("unlock")
+    assert err.value.errcode == 90000
+    assert len(calls) == 1
+
+
+def test_lock_error_errcode_raises(sent):
+    calls, responses = sent
+    responses.append(make_response(200, {"errcode": -2012, "errmsg": "no gateway"}))
+    with pytest.raises(TTLockError) as err:
+        operate()
+    assert err.value.errcode == -2012
+    assert len(calls) == 1
+
+
+def test_rejected_token_raises_token_error(sent):
+    calls, responses = sent
+    responses.append(make_response(200, {"errcode": 10003}))
+    with pytest.raises(TTLockError) as err:
+        operate()
+    assert err.value.kind == "token"
+    assert len(calls) == 1
+
+
+def test_reads_retry_server_errors(sent):
+    calls, responses = sent
+    responses.extend([make_response(500), make_response(200, {"list": [], "pages": 1})])
+    body = ttlock_api.list_locks(base_url="https://api.example", client_id="c", access_token="t")
+    assert body["list"] == []
+    assert len(calls) == 2
+
+
+def test_commands_keep_the_default_timeout(monkeypatch):
+    timeouts = {}
+
+    def fake_send(endpoint, url, data, timeout, hedge):
+        timeouts[endpoint] = timeout
+        return make_response(200, {"errcode": 0, "list": []})
+
+    monkeypatch.setattr(ttlock_api, "_send", fake_send)
+    monkeypatch.setattr(ttlock_api, "latency_stats", ttlock_api.LatencyStats())
+    for endpoint in ("/v3/lock/list", "/v3/lock/lock"):
+        for _ in range(ttlock_api.MIN_SAMPLES):
+            ttlock_api.latency_stats.record(endpoint, 0.1)
+    ttlock_api.list_locks(base_url="https://api.example", client_id="c", access_token="t")
+    operate()
+    assert timeouts["/v3/lock/list"] == ttlock_api.MIN_TIMEOUT
+    assert timeouts["/v3/lock/lock"] == ttlock_api.DEFAULT_TIMEOUT
+
+
+def test_full_hedging_pool_sends_on_the_callers_thread(monkeypatch):
+    threads = []
+
+    def fake_post(endpoint, url, data, timeout):
+        threads.append(threading.current_thread())
+        return make_response(200, {"list": []})
+
+    monkeypatch.setattr(ttlock_api, "_timed_post", fake_post)
+    monkeypatch.setattr(ttlock_api, "latency_stats", ttlock_api.LatencyStats())
+    for _ in range(ttlock_api.MIN_SAMPLES):
+        ttlock_api.latency_stats.record("/v3/lock/list", 0.1)
+    monkeypatch.setattr(ttlock_api, "_hedge_slots", threading.BoundedSemaphore(1))
+    ttlock_api._hedge_slots.acquire()
+    ttlock_api._send("/v3/lock/list", "https://api.example/v3/lock/list", {}, 5, hedge=True)
+    assert threads == [threading.current_thread()]